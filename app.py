@@ -1,5 +1,4 @@
 import os
-import logging
 from datetime import timedelta
 from flask import Flask, session, render_template, request, flash, redirect, url_for
 from flask_sqlalchemy import SQLAlchemy
@@ -8,7 +7,7 @@ from flask_wtf.csrf import CSRFProtect, generate_csrf
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
-from logging.handlers import RotatingFileHandler
+from replicas import RoutingSession, replica_binds
 
 
 # Load environment variables
@@ -18,26 +17,19 @@ class Base(DeclarativeBase):
     pass
 
 # Initialize extensions
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 csrf = CSRFProtect()
 
 def configure_logging(app):
-    """Configure application logging"""
-    if app.config['ENV'] == 'production':
-        handler = RotatingFileHandler(
-            'app.log',
-            maxBytes=1024 * 1024 * 10,  # 10MB
-            backupCount=5
-        )
-        handler.setFormatter(logging.Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-        ))
-        handler.setLevel(logging.INFO)
-        app.logger.addHandler(handler)
-    else:
-        logging.basicConfig(level=logging.DEBUG)
-    app.logger.setLevel(logging.DEBUG)
+    """Configure application logging (see structured_logging.py)"""
+    from flask.logging import default_handler
+    from structured_logging import init_logging
+    
+    init_logging(app)
+    # Records reach the queue through the root logger
+    app.logger.removeHandler(default_handler)
+    app.logger.setLevel(app.config['LOG_LEVEL'])
 
 def create_app():
     """Application factory"""
@@ -58,6 +50,8 @@ def create_app():
         'SECRET_KEY': os.environ['SESSION_SECRET'],
         'SQLALCHEMY_DATABASE_URI': os.environ['DATABASE_URL'],
         'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        # Read replicas for reports and exports (see replicas.py)
+        'SQLALCHEMY_BINDS': replica_binds(os.environ.get('DATABASE_REPLICA_URLS')),
         
         # Security Headers
         'SESSION_COOKIE_SECURE': env == 'production',
@@ -75,6 +69,12 @@ def create_app():
         'MAX_CONTENT_LENGTH': 16 * 1024 * 1024,
         'UPLOAD_FOLDER': os.path.join(app.instance_path, 'uploads'),
         
+        # Accounts allowed into the /admin pages
+        'ADMIN_EMAILS': [e.strip().lower() for e in os.environ.get('ADMIN_EMAILS', '').split(',') if e.strip()],
+        
+        # Enrollment numbers: {year}, {yy}, {centre} and {counter}
+        'ENROLLMENT_NUMBER_FORMAT': os.environ.get('ENROLLMENT_NUMBER_FORMAT', 'ENR{year}{counter:05d}'),
+        
         # Database Pool
         'SQLALCHEMY_ENGINE_OPTIONS': {
             'pool_size': 10,
@@ -98,6 +98,12 @@ def create_app():
     # Initialize extensions (CSRF disabled)
     db.init_app(app)
     login_manager.init_app(app)
+    
+    # Per-process connection pools under gunicorn preload_app
+    from db_pool import init_db_pool
+    init_db_pool(app)
+    from replicas import init_replicas
+    init_replicas(app)
     # csrf.init_app(app)  # Commented out to disable CSRF
     
     # Login Manager Configuration
@@ -120,8 +126,6 @@ def create_app():
     @app.before_request
     def before_request():
         session.permanent = True
-        # CSRF token generation removed since CSRF is disabled
-        app.logger.debug("Session initialized without CSRF token")
     
     # Debug route for session inspection (CSRF disabled)
     @app.route('/debug/session')
@@ -138,6 +142,65 @@ def create_app():
     # Configure logging
     configure_logging(app)
     
+    # Register metrics
+    try:
+        from metrics import init_metrics
+        init_metrics(app)
+    except ImportError:
+        app.logger.warning("prometheus_client not installed, metrics disabled")
+    
+    # Register N+1 detector and query budgets
+    from query_audit import init_query_audit
+    init_query_audit(app)
+    
+    # Slow query log
+    from slow_queries import init_slow_queries
+    init_slow_queries(app)
+    
+    # On-demand cProfile and the background stack sampler
+    from profiling import init_profiling
+    init_profiling(app)
+    
+    # RSS limit for worker recycling and per-endpoint allocation peaks
+    from memory import init_memory_tracking
+    init_memory_tracking(app)
+    
+    # Payment gateway settings
+    from payments import init_payments
+    init_payments(app)
+    
+    # Brotli/gzip for dynamic HTML and JSON responses
+    from compression import init_compression
+    init_compression(app)
+    
+    # Fingerprinted, precompressed static files (after `flask assets build`)
+    from assets import init_assets
+    init_assets(app)
+    
+    # Compiled templates kept on disk across worker restarts
+    from template_cache import init_template_cache
+    init_template_cache(app)
+    
+    # Fee rollup, rebuilt after fee writes (see fee_summaries.py)
+    from fee_summaries import init_fee_summaries
+    init_fee_summaries(app)
+    
+    # {% cache %} template fragments
+    from fragment_cache import init_fragment_cache
+    init_fragment_cache(app)
+    
+    # ETag / Last-Modified for report and list pages
+    from conditional import init_conditional
+    init_conditional(app)
+    
+    # Centre logo variants and /logos route
+    from logos import init_logos
+    init_logos(app)
+    
+    # Razorpay webhook inbox worker
+    from webhooks import init_webhooks
+    init_webhooks(app)
+    
     # Register middleware
     try:
         from middleware import subscription_middleware
@@ -152,6 +215,10 @@ def create_app():
     except ImportError:
         app.logger.error("Failed to import routes")
     
+    # CLI commands
+    from commands import register_commands
+    register_commands(app)
+    
     # Error handlers
     @app.errorhandler(400)
     def handle_bad_request(e):
@@ -216,19 +283,28 @@ def create_app():
             return {'db': db}
     
     # Ensure directories exist
+    from schema import SchemaUpgradeError
     with app.app_context():
         try:
             os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
             os.makedirs(app.instance_path, exist_ok=True)
             db.create_all()
+            
+            from schema import upgrade_schema
+            upgrade_schema()
+            
+            from fee_summaries import backfill
+            backfill()
+        except SchemaUpgradeError:
+            # Unenforced unique indexes are not safe to run with
+            raise
         except Exception as e:
             app.logger.error(f"Startup error: {e}")
     
     return app
 
-app = create_app()
-
 if __name__ == '__main__':
+    app = create_app()
     app.logger.info(f"Starting Student Management System on " f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', 8000)}")
     app.logger.info(f"Environment: {app.config['ENV']}")
     app.logger.info(f"Debug mode: {app.debug}")
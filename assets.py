@@ -0,0 +1,120 @@
+"""
+Fingerprinted, precompressed static assets.
+
+`flask assets build` copies every file under static/ (except uploads) to
+static/dist/ with a content hash in its name, writes .br and .gz siblings
+for text assets and records the mapping in static/dist/manifest.json.
+
+When a manifest is present, url_for('static', filename='css/custom.css')
+returns the hashed name. The static view then serves the Brotli or gzip
+sibling that the browser accepts, with a one year immutable Cache-Control.
+Without a manifest, as in development, static files are served as before.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+from flask import request, send_from_directory
+
+DIST_FOLDER = 'dist'
+MANIFEST = 'manifest.json'
+SKIP_FOLDERS = {DIST_FOLDER, 'uploads'}
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.map', '.html', '.xml', '.ico'}
+CACHE_SECONDS = 365 * 24 * 3600
+# Preference order when the browser accepts several encodings
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _compress(path, data):
+    """Write .br and .gz siblings when they are smaller than the original"""
+    import brotli
+
+    written = []
+    for suffix, compressed in (
+        ('.br', brotli.compress(data, quality=11)),
+        ('.gz', gzip.compress(data, compresslevel=9, mtime=0)),
+    ):
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+            written.append(suffix)
+    return written
+
+
+def build(static_folder):
+    """Fingerprint and precompress static files; returns the manifest"""
+    dist = os.path.join(static_folder, DIST_FOLDER)
+    shutil.rmtree(dist, ignore_errors=True)
+    os.makedirs(dist)
+
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        if root == static_folder:
+            dirs[:] = [d for d in dirs if d not in SKIP_FOLDERS]
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            relative = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+
+            stem, extension = os.path.splitext(relative)
+            hashed = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{extension}"
+            target = os.path.join(dist, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(data)
+            if extension.lower() in COMPRESSIBLE:
+                _compress(target, data)
+            manifest[relative] = hashed
+
+    with open(os.path.join(dist, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_folder):
+    path = os.path.join(static_folder, DIST_FOLDER, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def init_assets(app):
+    """Point url_for at fingerprinted files and serve them precompressed"""
+    manifest = load_manifest(app.static_folder)
+    app.extensions['asset_manifest'] = manifest
+    if not manifest:
+        return
+
+    hashed_names = set(manifest.values())
+    dist = os.path.join(app.static_folder, DIST_FOLDER)
+    serve_original = app.view_functions['static']
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+
+    def static(filename):
+        if filename not in hashed_names:
+            return serve_original(filename=filename)
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        for encoding, suffix in ENCODINGS:
+            if request.accept_encodings[encoding] and os.path.exists(os.path.join(dist, filename + suffix)):
+                response = send_from_directory(dist, filename + suffix, mimetype=mimetype, max_age=CACHE_SECONDS)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(dist, filename, mimetype=mimetype, max_age=CACHE_SECONDS)
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    app.view_functions['static'] = static
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Reproducible benchmark suite for the Student Management System.
+
+Builds a fresh database per dataset size with the synthetic seed generator,
+then times the dashboard, student lists, reports, exports and the Razorpay
+webhook through the Flask test client. Results are written as JSON so runs
+from two versions can be compared:
+
+    python benchmark.py --sizes 100,1000,5000 --output before.json
+    python benchmark.py --sizes 100,1000,5000 --output after.json --compare before.json
+
+The database defaults to a SQLite file; pass --database with a local
+PostgreSQL URL to benchmark against Postgres. The database is dropped and
+recreated for every size, so never point it at real data.
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+WEBHOOK_SECRET = 'benchmark-webhook-secret'
+BASE_URL = 'https://localhost'
+
+STUDENT_FIELDS = ['enrollment_number', 'name', 'mobile1', 'course', 'total_fees',
+                  'net_fees', 'paid_amount', 'balance_fees', 'fee_status']
+ENQUIRY_FIELDS = ['name', 'mobile1', 'course', 'status']
+
+
+def scenarios():
+    """(name, method, path, form data) for every timed request"""
+    yield 'dashboard', 'GET', '/dashboard', None
+    for fee_status in ('all', 'paid', 'partial', 'unpaid'):
+        yield f'students_list[{fee_status}]', 'GET', f'/students?fee_status={fee_status}', None
+    yield 'enquiries_list', 'GET', '/enquiries', None
+    yield 'subscription_payment', 'GET', '/subscription/payment?plan=monthly', None
+    for report in ('students', 'fees', 'batches', 'enquiries'):
+        yield f'reports_{report}', 'GET', f'/reports/{report}', None
+    for fmt in ('excel', 'pdf'):
+        yield f'export_{fmt}[students]', 'POST', f'/export/{fmt}', {
+            'export_type': 'students', 'fee_status': 'all', 'student_fields': STUDENT_FIELDS
+        }
+        yield f'export_{fmt}[enquiries]', 'POST', f'/export/{fmt}', {
+            'export_type': 'enquiries', 'enquiry_status': 'all', 'enquiry_fields': ENQUIRY_FIELDS
+        }
+
+
+def webhook_request(centre_id, n):
+    """A signed subscription.charged event, unique per call"""
+    body = json.dumps({
+        'event': 'subscription.charged',
+        'payload': {
+            'subscription': {'entity': {
+                'id': 'sub_benchmark', 'plan_id': 'plan_QiyHYDfCNwOii0',
+                'status': 'active', 'notes': {'centre_id': str(centre_id)}
+            }},
+            'payment': {'entity': {'id': f'pay_benchmark_{n}', 'amount': 69900, 'status': 'captured'}}
+        }
+    })
+    signature = hmac.new(WEBHOOK_SECRET.encode(), body.encode(), hashlib.sha256).hexdigest()
+    return body, {'X-Razorpay-Signature': signature, 'X-Razorpay-Event-Id': f'evt_benchmark_{n}',
+                  'Content-Type': 'application/json'}
+
+
+def summarise(name, size, timings, response):
+    timings_ms = sorted(t * 1000 for t in timings)
+    return {
+        'size': size,
+        'name': name,
+        'status': response.status_code,
+        'bytes': len(response.get_data()),
+        'queries': int(response.headers.get('X-Query-Count', -1)),
+        'min_ms': round(timings_ms[0], 3),
+        'median_ms': round(statistics.median(timings_ms), 3),
+        'p95_ms': round(timings_ms[min(len(timings_ms) - 1, int(len(timings_ms) * 0.95))], 3),
+        'mean_ms': round(statistics.fmean(timings_ms), 3)
+    }
+
+
+def run_size(app, size, repeat, enquiries_ratio):
+    from app import db
+    from seed import seed_database, SEED_PASSWORD
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed_database(centres=1, students=size, enquiries=max(1, int(size * enquiries_ratio)))
+
+    # Production config marks the session cookie Secure, so talk HTTPS
+    client = app.test_client()
+    client.post('/login', base_url=BASE_URL,
+                data={'email': 'seed-centre-1@example.com', 'password': SEED_PASSWORD})
+
+    results = []
+    for name, method, path, data in scenarios():
+        timings = []
+        response = None
+        for _ in range(repeat + 1):
+            started = time.perf_counter()
+            response = client.open(path, method=method, data=data, base_url=BASE_URL)
+            timings.append(time.perf_counter() - started)
+        results.append(summarise(name, size, timings[1:], response))
+        print(f"  {name:<28} {results[-1]['median_ms']:>10.2f} ms  status={response.status_code}")
+
+    webhook_client = app.test_client()
+    timings = []
+    for n in range(repeat + 1):
+        body, headers = webhook_request(1, f"{size}_{n}")
+        started = time.perf_counter()
+        response = webhook_client.post('/subscription/webhook', data=body, headers=headers, base_url=BASE_URL)
+        timings.append(time.perf_counter() - started)
+    results.append(summarise('webhook', size, timings[1:], response))
+    print(f"  {'webhook':<28} {results[-1]['median_ms']:>10.2f} ms  status={response.status_code}")
+    return results
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {(r['size'], r['name']): r for r in json.load(f)['results']}
+
+    print(f"\n{'scenario':<36} {'before':>10} {'after':>10} {'change':>8}")
+    for result in results:
+        before = baseline.get((result['size'], result['name']))
+        if not before:
+            continue
+        change = (result['median_ms'] - before['median_ms']) / before['median_ms'] * 100 if before['median_ms'] else 0
+        print(f"{result['name'] + ' @' + str(result['size']):<36} "
+              f"{before['median_ms']:>10.2f} {result['median_ms']:>10.2f} {change:>+7.1f}%")
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='100,1000', help='Comma separated student counts')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed requests per scenario')
+    parser.add_argument('--enquiries-ratio', type=float, default=0.25, help='Enquiries per student')
+    parser.add_argument('--database', default='sqlite:////tmp/lerzo_benchmark.db', help='Database URL')
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON results file')
+    parser.add_argument('--compare', help='Earlier results file to compare against')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database
+    os.environ.setdefault('SESSION_SECRET', 'benchmark')
+    os.environ['FLASK_ENV'] = 'production'
+    os.environ['QUERY_AUDIT'] = 'true'
+    os.environ['RAZORPAY_WEBHOOK_SECRET'] = WEBHOOK_SECRET
+    os.environ['PAYMENT_GATEWAY'] = 'local'
+
+    from app import create_app
+    app = create_app()
+    app.config['QUERY_BUDGET_STRICT'] = False
+
+    results = []
+    for size in [int(s) for s in args.sizes.split(',')]:
+        print(f"Dataset: {size} students")
+        results.extend(run_size(app, size, args.repeat, args.enquiries_ratio))
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'database': app.config['SQLALCHEMY_DATABASE_URI'].split(':', 1)[0],
+            'repeat': args.repeat
+        },
+        'results': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
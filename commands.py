@@ -0,0 +1,198 @@
+"""
+Flask CLI commands
+"""
+
+import click
+
+
+def register_commands(app):
+    @app.cli.command('seed')
+    @click.option('--centres', default=1, show_default=True, help='Number of centres to create')
+    @click.option('--students', default=200, show_default=True, help='Students per centre')
+    @click.option('--enquiries', default=50, show_default=True, help='Enquiries per centre')
+    @click.option('--seed', 'random_seed', default=42, show_default=True, help='Random seed')
+    def seed_command(centres, students, enquiries, random_seed):
+        """Generate a synthetic multi-tenant dataset."""
+        from seed import seed_database, SEED_PASSWORD
+
+        counts = seed_database(centres=centres, students=students,
+                               enquiries=enquiries, seed=random_seed)
+        for table, count in counts.items():
+            click.echo(f"{table:>14}: {count}")
+        click.echo(f"Log in as seed-centre-<n>@example.com with password '{SEED_PASSWORD}'")
+
+    @app.cli.group('webhooks')
+    def webhooks_group():
+        """Razorpay webhook inbox."""
+
+    @webhooks_group.command('process')
+    @click.option('--loop', is_flag=True, help='Keep polling instead of exiting when the inbox is empty')
+    def webhooks_process(loop):
+        """Apply pending webhook events."""
+        from webhooks import process_pending, run_worker
+
+        if loop:
+            click.echo('Processing webhook events, press Ctrl+C to stop')
+            run_worker(app, app.config['WEBHOOK_POLL_INTERVAL'])
+        click.echo(f"Processed {process_pending(limit=10000)} events")
+
+    @webhooks_group.command('requeue')
+    def webhooks_requeue():
+        """Retry events that exhausted their attempts."""
+        from webhooks import requeue_failed
+
+        click.echo(f"Requeued {requeue_failed()} events")
+
+    @app.cli.group('fees')
+    def fees_group():
+        """Fee rollups."""
+
+    @fees_group.command('refresh-summaries')
+    @click.option('--centre', 'centres', type=int, multiple=True, help='Only rebuild these centre ids')
+    @click.option('--loop', is_flag=True, help='Keep refreshing instead of running once')
+    @click.option('--interval', type=int, help='Seconds between refreshes with --loop [default: FEE_SUMMARY_REFRESH_INTERVAL]')
+    def fees_refresh_summaries(centres, loop, interval):
+        """Rebuild the per-centre fee summaries that reports read."""
+        from fee_summaries import refresh, run_forever
+
+        if loop:
+            interval = interval or app.config['FEE_SUMMARY_REFRESH_INTERVAL']
+            click.echo(f"Refreshing fee summaries every {interval}s, press Ctrl+C to stop")
+            run_forever(app, interval)
+        rows = refresh(centres or None)
+        click.echo(f"Wrote {rows} fee summary rows")
+
+    @app.cli.group('subscriptions')
+    def subscriptions_group():
+        """Subscription lifecycle."""
+
+    @subscriptions_group.command('sweep')
+    @click.option('--loop', is_flag=True, help='Keep sweeping instead of running once')
+    @click.option('--interval', default=300, show_default=True, help='Seconds between sweeps with --loop')
+    def subscriptions_sweep(loop, interval):
+        """Expire lapsed trials and plans and refresh days left."""
+        from subscriptions import sweep, run_forever
+
+        if loop:
+            click.echo(f"Sweeping subscriptions every {interval}s, press Ctrl+C to stop")
+            run_forever(app, interval)
+        result = sweep()
+        click.echo(f"Expired {result['expired']} centres, refreshed days left for {result['days_left_updated']}")
+
+    @app.cli.command('logos')
+    def logos_command():
+        """Render resized variants for logos uploaded before variants existed."""
+        import os
+        import shutil
+        from logos import process_logo, logo_folder
+        from models import Centre
+
+        centres = Centre.query.filter(Centre.logo_filename.isnot(None), Centre.logo_variants.is_(None)).all()
+        for centre in centres:
+            original = os.path.join(app.root_path, 'static', 'uploads', centre.logo_filename)
+            if not os.path.exists(original):
+                click.echo(f"Centre {centre.id}: {centre.logo_filename} is missing, skipped")
+                continue
+            source = os.path.join(logo_folder(app), f"{centre.id}-legacy")
+            shutil.copyfile(original, source)
+            process_logo(app, centre.id, source)
+            click.echo(f"Centre {centre.id}: variants rendered")
+
+    @app.cli.group('assets')
+    def assets_group():
+        """Static asset pipeline."""
+
+    @assets_group.command('build')
+    def assets_build():
+        """Fingerprint static files and write .br/.gz siblings."""
+        from assets import build
+
+        manifest = build(app.static_folder)
+        for source, hashed in sorted(manifest.items()):
+            click.echo(f"{source} -> {hashed}")
+        click.echo(f"Built {len(manifest)} assets; restart the app to serve them")
+
+    @app.cli.group('templates')
+    def templates_group():
+        """Jinja templates."""
+
+    @templates_group.command('compile')
+    def templates_compile():
+        """Compile every template into the bytecode cache."""
+        from template_cache import compile_templates
+
+        compiled, errors = compile_templates(app)
+        for name, error in sorted(errors.items()):
+            click.echo(f"{name}: {error}", err=True)
+        click.echo(f"Compiled {len(compiled)} templates into {app.config['TEMPLATE_CACHE_DIR'] or 'memory only'}")
+        if errors:
+            raise SystemExit(1)
+
+    @app.cli.command('import-profile')
+    @click.option('--module', default='main', show_default=True, help='Module to import, as gunicorn would')
+    @click.option('--top', default=20, show_default=True, help='Number of packages to list')
+    def import_profile(module, top):
+        """Report import time per package for a cold start."""
+        import os
+        import subprocess
+        import sys
+        from collections import Counter
+
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            cwd=app.root_path, env=os.environ.copy(), capture_output=True, text=True
+        )
+        if result.returncode:
+            click.echo(result.stderr, err=True)
+            raise SystemExit(result.returncode)
+
+        # Lines look like "import time:  self [us] | cumulative | imported package"
+        self_time = Counter()
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            own, _, name = line[len('import time:'):].split('|')
+            self_time[name.strip().split('.')[0]] += int(own)
+
+        total = sum(self_time.values())
+        click.echo(f"{'package':<30} {'ms':>9} {'share':>7}")
+        for package, micros in self_time.most_common(top):
+            click.echo(f"{package:<30} {micros / 1000:>9.1f} {micros / total:>7.1%}")
+        click.echo(f"{'total imports':<30} {total / 1000:>9.1f}")
+
+    @app.cli.group('db')
+    def db_group():
+        """Database connections."""
+
+    @db_group.command('fork-check')
+    @click.option('--workers', default=3, show_default=True, help='Worker processes to fork')
+    def db_fork_check(workers):
+        """Fork like gunicorn and verify no connection is shared across processes."""
+        from db_pool import fork_check
+
+        parent, reports, problems = fork_check(app, workers)
+        click.echo(f"master {parent['pid']}: backend {parent['backend']}")
+        for report in reports:
+            click.echo(f"worker {report['pid']}: opened by {report.get('opened_by')}, backend {report.get('backend')}")
+        for problem in problems:
+            click.echo(f"FAIL {problem}", err=True)
+        if problems:
+            raise SystemExit(1)
+        click.echo('OK: every worker uses its own connections')
+
+    @db_group.command('replicas')
+    def db_replicas():
+        """Show replication lag and whether each replica would take reads."""
+        from replicas import replica_status
+
+        status = replica_status(app)
+        if not status:
+            click.echo('No replicas configured (set DATABASE_REPLICA_URLS)')
+            return
+        max_lag = app.config['DB_REPLICA_MAX_LAG']
+        for key, lag in status:
+            if isinstance(lag, str):
+                click.echo(f"{key}: unreachable ({lag})")
+            else:
+                state = 'in use' if lag <= max_lag else f"skipped, over {max_lag:g}s"
+                click.echo(f"{key}: {lag:.2f}s behind, {state}")
@@ -0,0 +1,159 @@
+"""
+Brotli and gzip compression for dynamic responses.
+
+CompressionMiddleware wraps the WSGI app and compresses text/html,
+application/json and other text responses for clients that send a matching
+Accept-Encoding. Brotli is preferred when the brotli package is installed.
+Responses with a Content-Length are compressed in one pass, and only when
+they are at least COMPRESSION_MIN_SIZE bytes. Streamed responses have no
+Content-Length, so each chunk is compressed and flushed as it is produced
+and the browser can start rendering before the stream ends.
+
+Excel and PDF downloads, images, ranges and precompressed static assets
+pass through untouched. Set COMPRESSION_ALGORITHMS to an
+empty string when a reverse proxy does the compression instead.
+"""
+
+import os
+import zlib
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = (
+    'text/html', 'application/json', 'text/csv', 'text/plain',
+    'text/css', 'application/javascript', 'text/javascript', 'image/svg+xml'
+)
+
+
+class CompressionMiddleware:
+    """WSGI middleware that negotiates br or gzip for text responses"""
+
+    def __init__(self, app, algorithms=('br', 'gzip'), gzip_level=6, brotli_quality=4,
+                 min_size=1024, mimetypes=COMPRESSIBLE_MIMETYPES):
+        self.app = app
+        self.algorithms = [a for a in algorithms if a != 'br' or brotli is not None]
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.min_size = min_size
+        self.mimetypes = set(mimetypes)
+
+    def negotiate(self, environ):
+        """The best encoding both sides support, or None"""
+        if not self.algorithms or environ.get('REQUEST_METHOD') == 'HEAD':
+            return None
+        accepted = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        return accepted.best_match(self.algorithms)
+
+    def should_compress(self, status, headers):
+        code = int(status.split(' ', 1)[0])
+        if code < 200 or code in (204, 206, 304):
+            return False
+        if 'Content-Encoding' in headers or 'Content-Range' in headers:
+            return False
+        if 'no-transform' in headers.get('Cache-Control', ''):
+            return False
+        mimetype = headers.get('Content-Type', '').split(';', 1)[0].strip().lower()
+        if mimetype not in self.mimetypes:
+            return False
+        length = headers.get('Content-Length')
+        return length is None or int(length) >= self.min_size
+
+    def compressor(self, encoding):
+        """Return (compress, flush, finish) callables for one response"""
+        if encoding == 'br':
+            c = brotli.Compressor(quality=self.brotli_quality)
+            return c.process, c.flush, c.finish
+        c = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)
+        return c.compress, lambda: c.flush(zlib.Z_SYNC_FLUSH), c.flush
+
+    def __call__(self, environ, start_response):
+        encoding = self.negotiate(environ)
+        if encoding is None:
+            return self.app(environ, start_response)
+
+        captured = {}
+
+        def capture(status, headers, exc_info=None):
+            if captured.get('passthrough'):
+                return start_response(status, headers, exc_info)
+            captured.update(status=status, headers=Headers(headers), exc_info=exc_info)
+            return captured.setdefault('written', []).append
+
+        app_iter = self.app(environ, capture)
+
+        # Apps that defer start_response until iteration are left alone
+        if 'status' not in captured:
+            captured['passthrough'] = True
+            return app_iter
+
+        status, headers = captured['status'], captured['headers']
+        if not self.should_compress(status, headers):
+            start_response(status, headers.to_wsgi_list(), captured['exc_info'])
+            if captured.get('written'):
+                return _prepend(captured['written'], app_iter)
+            return app_iter
+
+        headers['Content-Encoding'] = encoding
+        vary = [v.strip() for v in headers.get('Vary', '').split(',') if v.strip()]
+        headers['Vary'] = ', '.join(vary + ['Accept-Encoding'])
+        etag = headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            headers['ETag'] = 'W/' + etag
+
+        if 'Content-Length' in headers:
+            body = b''.join(captured.get('written', [])) + _read_all(app_iter)
+            compress, _, finish = self.compressor(encoding)
+            body = compress(body) + finish()
+            headers['Content-Length'] = str(len(body))
+            start_response(status, headers.to_wsgi_list(), captured['exc_info'])
+            return [body]
+
+        start_response(status, headers.to_wsgi_list(), captured['exc_info'])
+        return self._stream(captured.get('written', []), app_iter, encoding)
+
+    def _stream(self, written, app_iter, encoding):
+        compress, flush, finish = self.compressor(encoding)
+        try:
+            for chunk in _prepend(written, app_iter):
+                if chunk:
+                    yield compress(chunk) + flush()
+            yield finish()
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+
+def _prepend(written, app_iter):
+    yield from written
+    yield from app_iter
+
+
+def _read_all(app_iter):
+    try:
+        return b''.join(app_iter)
+    finally:
+        if hasattr(app_iter, 'close'):
+            app_iter.close()
+
+
+def init_compression(app):
+    """Wrap the WSGI app with response compression"""
+    app.config.setdefault('COMPRESSION_ALGORITHMS', os.environ.get('COMPRESSION_ALGORITHMS', 'br,gzip'))
+    app.config.setdefault('COMPRESSION_LEVEL', int(os.environ.get('COMPRESSION_LEVEL', 6)))
+    app.config.setdefault('COMPRESSION_BROTLI_QUALITY', int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 4)))
+    app.config.setdefault('COMPRESSION_MIN_SIZE', int(os.environ.get('COMPRESSION_MIN_SIZE', 1024)))
+
+    algorithms = [a.strip() for a in app.config['COMPRESSION_ALGORITHMS'].split(',') if a.strip()]
+    app.wsgi_app = CompressionMiddleware(
+        app.wsgi_app,
+        algorithms=algorithms,
+        gzip_level=app.config['COMPRESSION_LEVEL'],
+        brotli_quality=app.config['COMPRESSION_BROTLI_QUALITY'],
+        min_size=app.config['COMPRESSION_MIN_SIZE']
+    )
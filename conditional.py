@@ -0,0 +1,104 @@
+"""
+Conditional GETs for pages built from a centre's own data.
+
+    @app.route('/reports/fees')
+    @login_required
+    @subscription_required
+    @conditional
+    def reports_fees(): ...
+
+A decorated page gets a weak ETag built from the logged in centre's id and
+data_version, the full URL with its query string, the current date and the
+release. It also gets a Last-Modified from Centre.data_changed_at, moved
+forward to the start of the day or the start of the release when either is
+later, so a browser that only sends If-Modified-Since is covered by the same
+parts as the ETag.
+Centre.touch() bumps both whenever the centre's rows are written, so an
+unchanged page is answered with 304 Not Modified before the view runs any
+of its queries. The only cost is loading the centre, which login_required
+has already done. Responses are marked private, no-cache, so the browser
+revalidates on back/forward and refresh instead of showing stale data.
+
+The date is in the tag because reports bucket by month and the
+subscription banner counts days. The release is in the tag so a deploy
+that changes templates never serves an old page. Requests with pending
+flashed messages always render, otherwise the message would be lost.
+"""
+
+import hashlib
+import os
+from datetime import date, datetime, time, timezone
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+
+
+def release_id(app):
+    """RELEASE, or the newest code or template mtime when it is not set"""
+    release = os.environ.get('RELEASE')
+    if release:
+        return release
+    newest = max(entry.stat().st_mtime_ns for entry in os.scandir(app.root_path) if entry.name.endswith('.py'))
+    for root, _, files in os.walk(os.path.join(app.root_path, app.template_folder)):
+        for name in files:
+            newest = max(newest, os.stat(os.path.join(root, name)).st_mtime_ns)
+    return str(newest)
+
+
+def page_etag():
+    """Weak validator for the current page and the centre's data version"""
+    key = '|'.join((
+        str(current_user.id),
+        str(current_user.data_version or 0),
+        request.full_path,
+        date.today().isoformat(),
+        current_app.config['RELEASE'],
+    ))
+    return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+
+def page_last_modified():
+    """Newest of the centre's data change, today's start and the release start"""
+    changed = current_user.data_changed_at
+    if not changed:
+        return None
+    # data_changed_at is naive UTC; the day starts at local midnight, as date.today() in the ETag
+    day_start = datetime.combine(date.today(), time.min).astimezone(timezone.utc).replace(tzinfo=None)
+    return max(changed, day_start, current_app.config['RELEASED_AT'])
+
+
+def conditional(f):
+    """Answer 304 when the centre's data has not changed since the browser's copy"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or not current_user.is_authenticated or session.get('_flashes'):
+            return f(*args, **kwargs)
+
+        etag = page_etag()
+        last_modified = page_last_modified()
+        if request.if_none_match:
+            unchanged = request.if_none_match.contains_weak(etag)
+        else:
+            unchanged = bool(
+                last_modified and request.if_modified_since
+                and last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+            )
+
+        response = current_app.response_class(status=304) if unchanged else make_response(f(*args, **kwargs))
+        if response.status_code in (200, 304):
+            response.set_etag(etag, weak=True)
+            if last_modified:
+                response.last_modified = last_modified
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+        return response
+    return decorated_function
+
+
+def init_conditional(app):
+    """Fix the release part of every ETag and Last-Modified for the life of the process"""
+    app.config.setdefault('RELEASE', release_id(app))
+    # When this process started serving the release; Last-Modified never predates it
+    app.config.setdefault('RELEASED_AT', datetime.utcnow().replace(microsecond=0))
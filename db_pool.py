@@ -0,0 +1,131 @@
+"""
+Database connection pools under gunicorn's preload_app.
+
+create_app() runs in the gunicorn master and opens connections there, for
+db.create_all() and the schema upgrade. Forked workers inherit that pool,
+and two processes writing to one socket corrupt the SSL stream. The
+post_fork hook in gunicorn.conf.py calls after_fork(), which drops the
+inherited pool without closing the master's sockets, then opens
+DB_POOL_WARM fresh connections so the worker's first requests do not wait
+for TCP and TLS handshakes.
+
+As a second line of defence, every connection records the pid that opened
+it, and a connection checked out in any other process is discarded and
+replaced. `flask db fork-check` forks workers the way gunicorn does and
+fails if any of them ends up on a connection it did not open.
+"""
+
+import json
+import os
+
+from sqlalchemy import event, exc, text
+
+from app import db
+
+
+def _guard(engine):
+    @event.listens_for(engine, 'connect')
+    def record_pid(dbapi_connection, connection_record):
+        connection_record.info['pid'] = os.getpid()
+
+    @event.listens_for(engine, 'checkout')
+    def check_pid(dbapi_connection, connection_record, connection_proxy):
+        pid = os.getpid()
+        if connection_record.info.get('pid') != pid:
+            # Detach rather than close: the socket still belongs to the parent
+            connection_record.dbapi_connection = connection_proxy.dbapi_connection = None
+            raise exc.DisconnectionError(
+                f"Connection opened by pid {connection_record.info.get('pid')} checked out in pid {pid}"
+            )
+
+
+def warm_pool(app, size=None):
+    """Open ``size`` connections per engine and return them to the pool"""
+    size = app.config['DB_POOL_WARM'] if size is None else size
+    opened = 0
+    with app.app_context():
+        for engine in db.engines.values():
+            pool_size = getattr(engine.pool, 'size', lambda: size)()
+            connections = []
+            try:
+                for _ in range(min(size, pool_size)):
+                    connection = engine.connect()
+                    connection.execute(text('SELECT 1'))
+                    connections.append(connection)
+            finally:
+                for connection in connections:
+                    connection.close()
+            opened += len(connections)
+    return opened
+
+
+def after_fork(app):
+    """Replace the pool inherited from the master with this process's own"""
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    return warm_pool(app)
+
+
+def _backend_id(connection):
+    """Server-side identity of a connection where the database exposes one"""
+    if connection.dialect.name == 'postgresql':
+        return connection.execute(text('SELECT pg_backend_pid()')).scalar()
+    return None
+
+
+def fork_check(app, workers=3):
+    """Fork like gunicorn and report which connections each worker used"""
+    with app.app_context():
+        with db.engine.connect() as connection:
+            parent = {'pid': os.getpid(), 'backend': _backend_id(connection)}
+
+    children = []
+    for _ in range(workers):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            try:
+                after_fork(app)
+                with app.app_context():
+                    with db.engine.connect() as connection:
+                        report = {
+                            'pid': os.getpid(),
+                            'opened_by': connection.connection.info.get('pid'),
+                            'backend': _backend_id(connection)
+                        }
+            except Exception as e:
+                report = {'pid': os.getpid(), 'error': str(e)}
+            with os.fdopen(write_fd, 'w') as f:
+                json.dump(report, f)
+            os._exit(0)
+        os.close(write_fd)
+        children.append((pid, read_fd))
+
+    reports = []
+    for pid, read_fd in children:
+        with os.fdopen(read_fd) as f:
+            reports.append(json.load(f))
+        os.waitpid(pid, 0)
+
+    problems = []
+    backends = [parent['backend']]
+    for report in reports:
+        if 'error' in report:
+            problems.append(f"worker {report['pid']}: {report['error']}")
+        elif report['opened_by'] != report['pid']:
+            problems.append(f"worker {report['pid']} used a connection opened by pid {report['opened_by']}")
+        backends.append(report.get('backend'))
+    known = [backend for backend in backends if backend is not None]
+    if len(known) != len(set(known)):
+        problems.append(f"server connections shared between processes: {backends}")
+    return parent, reports, problems
+
+
+def init_db_pool(app):
+    """Tag connections with their process and read the warm-up size"""
+    app.config.setdefault('DB_POOL_WARM', int(os.environ.get('DB_POOL_WARM', 2)))
+    with app.app_context():
+        for engine in db.engines.values():
+            _guard(engine)
@@ -32,6 +32,17 @@ chmod 755 static/uploads
 
 echo "✅ Permissions set"
 
+# Scheduled jobs: expire lapsed subscriptions and rebuild fee summaries.
+# Request-time checks use the end dates, so these only keep stored state fresh.
+APP_DIR="$(pwd)"
+CRON_SWEEP="*/5 * * * * cd $APP_DIR && flask --app app subscriptions sweep >> logs/cron.log 2>&1"
+CRON_SUMMARIES="*/15 * * * * cd $APP_DIR && flask --app app fees refresh-summaries >> logs/cron.log 2>&1"
+( crontab -l 2>/dev/null | grep -v 'flask --app app subscriptions sweep' | grep -v 'flask --app app fees refresh-summaries'
+  echo "$CRON_SWEEP"
+  echo "$CRON_SUMMARIES" ) | crontab -
+
+echo "✅ Cron jobs installed (subscription sweep, fee summaries)"
+
 # For local development with Gunicorn
 echo "🔧 To start the application in production mode:"
 echo "   gunicorn --config gunicorn.conf.py main:app"
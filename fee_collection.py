@@ -0,0 +1,107 @@
+"""
+Bulk fee collection for a batch or a pasted list of enrollment numbers.
+
+Balances for every target student come from one aggregate query over
+fee_payments, amounts are checked against them in memory and all payments
+are written with a single bulk INSERT, so recording fees for a whole batch
+costs the same handful of statements as recording one.
+"""
+
+import math
+import re
+from collections import namedtuple
+
+from sqlalchemy import func, insert
+
+from app import db
+from models import Centre, Student, FeePayment
+import fee_summaries
+
+_SEPARATORS = re.compile(r"[\s,;]+")
+
+
+class StudentBalance(namedtuple('StudentBalance', 'id enrollment_number name net_fees paid')):
+    __slots__ = ()
+
+    @property
+    def balance(self):
+        return self.net_fees - self.paid
+
+
+def parse_enrollment_numbers(text):
+    """Split pasted enrollment numbers on whitespace, commas or semicolons"""
+    numbers = []
+    for number in _SEPARATORS.split((text or '').upper()):
+        if number and number not in numbers:
+            numbers.append(number)
+    return numbers
+
+
+def student_balances(centre_id, batch_id=None, enrollment_numbers=None, student_ids=None):
+    """Return a StudentBalance per matching student, ordered by name"""
+    paid = func.coalesce(func.sum(FeePayment.amount), 0)
+    query = db.session.query(
+        Student.id, Student.enrollment_number, Student.name, Student.net_fees, paid
+    ).outerjoin(FeePayment, FeePayment.student_id == Student.id)\
+     .filter(Student.centre_id == centre_id)
+
+    if batch_id:
+        query = query.filter(Student.batch_id == batch_id)
+    if enrollment_numbers is not None:
+        query = query.filter(Student.enrollment_number.in_(enrollment_numbers))
+    if student_ids is not None:
+        query = query.filter(Student.id.in_(student_ids))
+
+    rows = query.group_by(Student.id, Student.enrollment_number, Student.name, Student.net_fees)\
+                .order_by(Student.name, Student.id).all()
+    return [StudentBalance(*row) for row in rows]
+
+
+def record_payments(centre_id, entries, payment_date, payment_method, notes=None):
+    """Validate and insert payments for many students in one transaction.
+
+    ``entries`` maps student id to ``(amount, receipt_number)``. Nothing is
+    written unless every amount is a finite positive number within the student's
+    balance; the return value is ``(payments_recorded, errors)`` where
+    ``errors`` maps student id to a message.
+    """
+    if not entries:
+        return 0, {}
+
+    balances = {row.id: row for row in student_balances(centre_id, student_ids=list(entries))}
+    errors = {}
+    rows = []
+    for student_id, (amount, receipt_number) in entries.items():
+        student = balances.get(student_id)
+        if student is None:
+            errors[student_id] = 'Student not found'
+        elif not math.isfinite(amount):
+            errors[student_id] = 'Not a valid amount'
+        elif amount <= 0:
+            errors[student_id] = 'Amount must be greater than zero'
+        elif amount > student.balance:
+            errors[student_id] = f'Amount cannot exceed balance fees of ₹{student.balance:.2f}'
+        else:
+            rows.append({
+                'amount': amount,
+                'payment_date': payment_date,
+                'payment_method': payment_method,
+                'receipt_number': receipt_number or None,
+                'notes': notes or None,
+                'student_id': student_id,
+                'centre_id': centre_id
+            })
+
+    if errors:
+        return 0, errors
+
+    try:
+        before = fee_summaries.capture(entries)
+        db.session.execute(insert(FeePayment), rows)
+        Centre.touch([centre_id])
+        fee_summaries.apply_changes(before)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(rows), {}
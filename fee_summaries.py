@@ -0,0 +1,328 @@
+"""
+Per-centre fee rollup.
+
+fee_summaries holds one row per centre, course, batch and month. It
+records the students who joined that month, with their net fees, amount
+paid, balance and fee status counts, plus the payments received that month.
+Summing any column over months gives the centre's totals, so the fee and
+student reports read a few dozen rows instead of every student and payment.
+
+Writes keep the rollup current inside their own transaction. Before a flush
+that adds, changes or deletes students or payments, the affected students
+are locked and their contribution to the rollup is aggregated; after the
+flush it is aggregated again and only the difference is added to the
+matching (course, batch, month) rows with an upsert. A payment therefore
+costs a few queries over one student, whatever the size of the centre.
+The bulk payment and import paths, which write with Core INSERTs, do the
+same with capture() and apply_changes().
+
+A full rebuild of a centre deletes and re-inserts its rows after locking
+the centre's row. Every fee write also holds that lock (Centre.touch), so
+a rebuild never misses a write in flight. Full rebuilds run on a schedule
+from `flask fees refresh-summaries --loop` to repair any drift, and from
+`flask seed`. The unique key on (centre_id, course_id, batch_id, month)
+turns any overlap into an error instead of doubled totals.
+"""
+
+import os
+import time
+from collections import defaultdict
+from datetime import date, datetime
+from itertools import chain
+
+from sqlalchemy import case, delete, event, extract, func, insert, inspect, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+from models import Centre, Course, FeePayment, FeeSummary, Student
+
+PENDING = 'fee_summary_changes'
+KEY = ('centre_id', 'course_id', 'batch_id', 'month')
+TOTALS = ('students', 'net_fees', 'paid', 'balance', 'fully_paid', 'partially_paid', 'unpaid', 'collected', 'payments')
+
+
+def _flushed_student_ids(session):
+    """Ids of the students whose rollup contribution this flush may change"""
+    student_ids = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Student):
+            student_ids.add(obj.id)
+        elif isinstance(obj, FeePayment):
+            student_ids.add(obj.student_id or (obj.student.id if obj.student else None))
+            # A payment moved to another student changes the old one too
+            student_ids.update(inspect(obj).attrs.student_id.history.deleted or ())
+    student_ids.discard(None)
+    return student_ids
+
+
+@event.listens_for(db.session, 'before_flush')
+def _capture_flushed_students(session, flush_context, instances):
+    student_ids = _flushed_student_ids(session)
+    if student_ids:
+        session.info[PENDING] = capture(student_ids, session.connection())
+
+
+@event.listens_for(db.session, 'after_flush')
+def _apply_flushed_students(session, flush_context):
+    before = session.info.pop(PENDING, None)
+    # New students have their ids now
+    student_ids = _flushed_student_ids(session)
+    if before is not None or student_ids:
+        apply_changes(before, student_ids, session.connection())
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_captured_students(session):
+    session.info.pop(PENDING, None)
+
+
+def _month(year, month):
+    return date(int(year), int(month), 1)
+
+
+def build_rows(connection, centre_ids=None, student_ids=None):
+    """Aggregate students and payments into fee_summaries rows"""
+    paid = select(FeePayment.student_id, func.sum(FeePayment.amount).label('amount'))
+    if centre_ids is not None:
+        paid = paid.where(FeePayment.centre_id.in_(centre_ids))
+    if student_ids is not None:
+        paid = paid.where(FeePayment.student_id.in_(student_ids))
+    paid = paid.group_by(FeePayment.student_id).subquery()
+    student_paid = func.coalesce(paid.c.amount, 0)
+    balance = Student.net_fees - student_paid
+    joined_year, joined_month = extract('year', Student.date_of_joining), extract('month', Student.date_of_joining)
+
+    students = select(
+        Student.centre_id, Student.course_id, Student.batch_id, joined_year, joined_month,
+        func.count(Student.id),
+        func.sum(Student.net_fees),
+        func.sum(student_paid),
+        func.sum(balance),
+        # Same rules as Student.get_fee_status()
+        func.sum(case((balance <= 0, 1), else_=0)),
+        func.sum(case((balance <= 0, 0), (student_paid == 0, 0), else_=1)),
+        func.sum(case((balance <= 0, 0), (student_paid == 0, 1), else_=0))
+    ).outerjoin(paid, paid.c.student_id == Student.id)\
+     .group_by(Student.centre_id, Student.course_id, Student.batch_id, joined_year, joined_month)
+
+    paid_year, paid_month = extract('year', FeePayment.payment_date), extract('month', FeePayment.payment_date)
+    collections = select(
+        Student.centre_id, Student.course_id, Student.batch_id, paid_year, paid_month,
+        func.sum(FeePayment.amount),
+        func.count(FeePayment.id)
+    ).join(Student, Student.id == FeePayment.student_id)\
+     .group_by(Student.centre_id, Student.course_id, Student.batch_id, paid_year, paid_month)
+
+    if centre_ids is not None:
+        students = students.where(Student.centre_id.in_(centre_ids))
+        collections = collections.where(Student.centre_id.in_(centre_ids))
+    if student_ids is not None:
+        students = students.where(Student.id.in_(student_ids))
+        collections = collections.where(Student.id.in_(student_ids))
+
+    now = datetime.utcnow()
+    rows = defaultdict(lambda: {
+        'students': 0, 'net_fees': 0, 'paid': 0, 'balance': 0,
+        'fully_paid': 0, 'partially_paid': 0, 'unpaid': 0,
+        'collected': 0, 'payments': 0, 'refreshed_at': now
+    })
+    for centre_id, course_id, batch_id, year, month, *totals in connection.execute(students):
+        row = rows[centre_id, course_id or 0, batch_id or 0, _month(year, month)]
+        row.update(zip(('students', 'net_fees', 'paid', 'balance', 'fully_paid', 'partially_paid', 'unpaid'),
+                       (value or 0 for value in totals)))
+    for centre_id, course_id, batch_id, year, month, collected, payments in connection.execute(collections):
+        row = rows[centre_id, course_id or 0, batch_id or 0, _month(year, month)]
+        row.update(collected=collected or 0, payments=payments)
+
+    return [
+        dict(values, centre_id=centre_id, course_id=course_id, batch_id=batch_id, month=month)
+        for (centre_id, course_id, batch_id, month), values in rows.items()
+    ]
+
+
+def capture(student_ids, connection=None):
+    """Lock these students and return their current rollup contribution, for apply_changes()"""
+    connection = connection or db.session.connection()
+    student_ids = sorted(student_ids)
+    connection.execute(select(Student.id).where(Student.id.in_(student_ids)).order_by(Student.id).with_for_update()).all()
+    return set(student_ids), build_rows(connection, student_ids=student_ids)
+
+
+def _keyed(rows):
+    return {tuple(row[column] for column in KEY): row for row in rows}
+
+
+def apply_changes(before, student_ids=(), connection=None):
+    """Add the change in these students' contribution since capture() to the rollup"""
+    connection = connection or db.session.connection()
+    captured_ids, before_rows = before or (set(), [])
+    student_ids = sorted(captured_ids | set(student_ids))
+    before_rows = _keyed(before_rows)
+    after_rows = _keyed(build_rows(connection, student_ids=student_ids)) if student_ids else {}
+
+    now = datetime.utcnow()
+    deltas = []
+    # In key order, so concurrent writers lock summary rows in the same order
+    for key in sorted(before_rows.keys() | after_rows.keys()):
+        old, new = before_rows.get(key, {}), after_rows.get(key, {})
+        delta = {column: new.get(column, 0) - old.get(column, 0) for column in TOTALS}
+        if any(delta.values()):
+            deltas.append(dict(delta, **dict(zip(KEY, key)), refreshed_at=now))
+    if deltas:
+        _add(connection, deltas)
+    return len(deltas)
+
+
+def _add(connection, deltas):
+    """Add ``deltas`` to their fee_summaries rows, creating missing rows"""
+    table = FeeSummary.__table__
+    dialect = {'postgresql': postgresql, 'sqlite': sqlite}.get(connection.dialect.name)
+    if dialect is not None:
+        stmt = dialect.insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c[column] for column in KEY],
+            set_=dict({column: table.c[column] + stmt.excluded[column] for column in TOTALS},
+                      refreshed_at=stmt.excluded.refreshed_at)
+        )
+        connection.execute(stmt, deltas)
+        return
+    for delta in deltas:
+        matched = connection.execute(
+            update(table).where(*(table.c[column] == delta[column] for column in KEY))
+                         .values({column: table.c[column] + delta[column] for column in TOTALS},
+                                 refreshed_at=delta['refreshed_at'])
+        ).rowcount
+        if not matched:
+            connection.execute(insert(table), delta)
+
+
+def _rebuild(connection, centre_ids):
+    """Lock the centres, then replace their rows; returns the rows written"""
+    connection.execute(
+        select(Centre.id).where(Centre.id.in_(centre_ids)).order_by(Centre.id).with_for_update()
+    ).all()
+    rows = build_rows(connection, centre_ids)
+    connection.execute(delete(FeeSummary).where(FeeSummary.centre_id.in_(centre_ids)))
+    if rows:
+        connection.execute(insert(FeeSummary), rows)
+    return len(rows)
+
+
+def refresh(centre_ids=None):
+    """Rebuild the summaries of ``centre_ids``, or of every centre; returns the rows written.
+
+    A full refresh rebuilds one centre per transaction, so it never holds
+    more than one centre lock.
+    """
+    if centre_ids is not None:
+        with db.engine.begin() as connection:
+            return _rebuild(connection, sorted(set(centre_ids)))
+
+    with db.engine.connect() as connection:
+        all_centres = connection.execute(select(Centre.id).order_by(Centre.id)).scalars().all()
+    written = 0
+    for centre_id in all_centres:
+        with db.engine.begin() as connection:
+            written += _rebuild(connection, [centre_id])
+    with db.engine.begin() as connection:
+        # Rows of centres that no longer exist
+        connection.execute(delete(FeeSummary).where(FeeSummary.centre_id.not_in(select(Centre.id))))
+    return written
+
+
+def _centre_totals(centre_id, *columns):
+    return db.session.query(*(func.coalesce(func.sum(column), 0) for column in columns))\
+                     .filter(FeeSummary.centre_id == centre_id).one()
+
+
+def student_report(centre_id):
+    """Student counts by fee status and per course"""
+    total, fully_paid, partially_paid, unpaid = _centre_totals(
+        centre_id, FeeSummary.students, FeeSummary.fully_paid, FeeSummary.partially_paid, FeeSummary.unpaid
+    )
+    course_stats = db.session.query(Course.name, func.sum(FeeSummary.students).label('student_count'))\
+                             .join(Course, Course.id == FeeSummary.course_id)\
+                             .filter(FeeSummary.centre_id == centre_id)\
+                             .group_by(Course.name)\
+                             .having(func.sum(FeeSummary.students) > 0).all()
+    return {
+        'total_students': total,
+        'fully_paid': fully_paid,
+        'partially_paid': partially_paid,
+        'unpaid': unpaid,
+        'course_stats': course_stats
+    }
+
+
+def batch_student_counts(centre_id):
+    """Students per batch id"""
+    return dict(
+        db.session.query(FeeSummary.batch_id, func.sum(FeeSummary.students))
+                  .filter(FeeSummary.centre_id == centre_id)
+                  .group_by(FeeSummary.batch_id).all()
+    )
+
+
+def fee_report(centre_id, months=12, today=None):
+    """Fee totals and collections for each of the last ``months`` months"""
+    total_fees, collected_fees, pending_fees = _centre_totals(
+        centre_id, FeeSummary.net_fees, FeeSummary.paid, FeeSummary.balance
+    )
+    today = today or date.today()
+    starts = []
+    for offset in range(months - 1, -1, -1):
+        year, month = divmod(today.year * 12 + today.month - 1 - offset, 12)
+        starts.append(date(year, month + 1, 1))
+
+    collected = dict(
+        db.session.query(FeeSummary.month, func.sum(FeeSummary.collected))
+                  .filter(FeeSummary.centre_id == centre_id, FeeSummary.month >= starts[0])
+                  .group_by(FeeSummary.month).all()
+    )
+    return {
+        'total_fees': total_fees,
+        'collected_fees': collected_fees,
+        'pending_fees': pending_fees,
+        'monthly_collections': [
+            {'month': start.strftime('%b %Y'), 'amount': collected.get(start, 0)} for start in starts
+        ]
+    }
+
+
+def filter_by_fee_status(query, status):
+    """Restrict a Student query to 'paid', 'partial' or 'unpaid' students in SQL"""
+    if status not in ('paid', 'partial', 'unpaid'):
+        return query
+    paid = select(func.coalesce(func.sum(FeePayment.amount), 0))\
+        .where(FeePayment.student_id == Student.id)\
+        .correlate(Student).scalar_subquery()
+    if status == 'paid':
+        return query.filter(Student.net_fees - paid <= 0)
+    if status == 'unpaid':
+        return query.filter(Student.net_fees - paid > 0, paid == 0)
+    return query.filter(Student.net_fees - paid > 0, paid != 0)
+
+
+def run_forever(app, interval):
+    """Rebuild every centre's summaries every ``interval`` seconds until interrupted"""
+    while True:
+        try:
+            with app.app_context():
+                started = time.perf_counter()
+                rows = refresh()
+            app.logger.info(f"Fee summaries refreshed: {rows} rows in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            app.logger.error(f"Fee summary refresh failed: {e}", exc_info=True)
+        time.sleep(interval)
+
+
+def backfill():
+    """Build every summary on first start, when the table is still empty"""
+    if db.session.query(FeeSummary.id).first() is None and db.session.query(Student.id).first() is not None:
+        return refresh()
+    return 0
+
+
+def init_fee_summaries(app):
+    """Register the incremental refresh and read the schedule"""
+    app.config.setdefault('FEE_SUMMARY_REFRESH_INTERVAL', int(os.environ.get('FEE_SUMMARY_REFRESH_INTERVAL', 900)))
@@ -1,5 +1,5 @@
 from flask_wtf import FlaskForm
-from flask_wtf.file import FileField, FileAllowed
+from flask_wtf.file import FileField, FileAllowed, FileRequired
 from wtforms import StringField, TextAreaField, SelectField, IntegerField, FloatField, DateField, PasswordField, BooleanField
 from wtforms.validators import DataRequired, Email, Length, Optional, NumberRange, Regexp
 
@@ -118,12 +118,28 @@ class FeePaymentForm(FlaskForm):
     receipt_number = StringField('Receipt Number', validators=[Optional(), Length(max=50)])
     notes = TextAreaField('Notes', validators=[Optional()])
 
+class BulkFeeCollectionForm(FlaskForm):
+    class Meta:
+        csrf = False  # Disable CSRF for this form
+    
+    payment_date = DateField('Payment Date', validators=[DataRequired()], default=date.today)
+    payment_method = SelectField('Payment Method', 
+                                choices=[('CASH', 'Cash'), ('CARD', 'Card'), ('ONLINE', 'Online'), ('CHEQUE', 'Cheque')],
+                                validators=[DataRequired()])
+    notes = TextAreaField('Notes', validators=[Optional()])
+
 class LogoUploadForm(FlaskForm):
     class Meta:
         csrf = False  # Disable CSRF for this form
     
     logo = FileField('Logo', validators=[FileAllowed(['jpg', 'png', 'jpeg'], 'Images only!')])
 
+class StudentImportForm(FlaskForm):
+    class Meta:
+        csrf = False  # Disable CSRF for this form
+    
+    file = FileField('Student File', validators=[FileRequired(), FileAllowed(['xlsx', 'csv'], 'Excel (.xlsx) or CSV files only!')])
+
 class BatchForm(FlaskForm):
     class Meta:
         csrf = False  # Disable CSRF for this form
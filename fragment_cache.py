@@ -0,0 +1,184 @@
+"""
+Fragment caching for templates.
+
+    {% cache 'sidebar', 600 %} ... {% endcache %}
+
+renders the block once and reuses the HTML until the TTL (in seconds) runs
+out. Extra arguments after the TTL become part of the key. Every key also
+includes the logged in centre's id and data_version. Centre.data_version is
+bumped whenever a flush or bulk statement writes that centre's rows, so a
+cached block stays valid until the centre changes something.
+
+Each worker keeps an LRU of FRAGMENT_CACHE_SIZE entries. If FRAGMENT_CACHE_DIR
+is set, fragments are also written there, so all gunicorn workers on a host
+share them. Call bypass() before rendering to skip the cache for a request,
+for example when rendering an error fallback.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, has_request_context
+from flask_login import current_user
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+PRUNE_EVERY = 500
+
+
+class MemoryStore:
+    """Thread-safe LRU of (expires, html) entries"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, expires):
+        with self.lock:
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+
+class DiskStore:
+    """One file per fragment, with the expiry time stored as its mtime"""
+
+    def __init__(self, path):
+        self.path = path
+        self.writes = 0
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, hashlib.sha256(key.encode()).hexdigest() + '.html')
+
+    def get(self, key):
+        path = self._file(key)
+        try:
+            expires = os.stat(path).st_mtime
+            if expires < time.time():
+                os.remove(path)
+                return None
+            with open(path, encoding='utf-8') as f:
+                return expires, f.read()
+        except OSError:
+            return None
+
+    def set(self, key, value, expires):
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(value)
+        os.utime(tmp, (expires, expires))
+        os.replace(tmp, self._file(key))
+
+        self.writes += 1
+        if self.writes % PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self):
+        """Delete expired fragments"""
+        now = time.time()
+        for entry in os.scandir(self.path):
+            try:
+                if entry.stat().st_mtime < now:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+
+class FragmentCache:
+    def __init__(self, size, directory=None, default_ttl=300):
+        self.memory = MemoryStore(size)
+        self.disk = DiskStore(directory) if directory else None
+        self.default_ttl = default_ttl
+
+    def get(self, key):
+        entry = self.memory.get(key)
+        if entry is None and self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self.memory.set(key, entry[1], entry[0])
+        return entry[1] if entry else None
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + (ttl or self.default_ttl)
+        self.memory.set(key, value, expires)
+        if self.disk is not None:
+            self.disk.set(key, value, expires)
+
+
+def _scope():
+    """Centre id and data version that every key is bound to"""
+    if has_request_context() and current_user.is_authenticated:
+        return f"{current_user.id}.{current_user.data_version or 0}"
+    return 'anonymous'
+
+
+def bypass():
+    """Render this request's fragments without reading or writing the cache"""
+    g.fragment_cache_bypass = True
+
+
+class FragmentCacheExtension(Extension):
+    """The {% cache name[, ttl[, vary...]] %} ... {% endcache %} tag"""
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_render', [nodes.List(args)]), [], [], body
+        ).set_lineno(lineno)
+
+    def _render(self, args, caller):
+        cache = self.environment.fragment_cache
+        if cache is None or (has_request_context() and g.get('fragment_cache_bypass')):
+            return caller()
+
+        name, ttl, *vary = list(args) + [None] * (2 - len(args))
+        key = ':'.join(['fragment', str(name), _scope()] + [str(v) for v in vary])
+        html = cache.get(key)
+        if html is None:
+            html = str(caller())
+            cache.set(key, html, ttl)
+        return Markup(html)
+
+
+def init_fragment_cache(app):
+    """Register the {% cache %} tag with a per-worker (and optional on-disk) store"""
+    app.config.setdefault('FRAGMENT_CACHE_SIZE', int(os.environ.get('FRAGMENT_CACHE_SIZE', 2000)))
+    app.config.setdefault('FRAGMENT_CACHE_DIR', os.environ.get('FRAGMENT_CACHE_DIR'))
+    app.config.setdefault('FRAGMENT_CACHE_TTL', int(os.environ.get('FRAGMENT_CACHE_TTL', 300)))
+
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    if app.config['FRAGMENT_CACHE_SIZE'] > 0:
+        app.jinja_env.fragment_cache = FragmentCache(
+            app.config['FRAGMENT_CACHE_SIZE'],
+            app.config['FRAGMENT_CACHE_DIR'],
+            app.config['FRAGMENT_CACHE_TTL']
+        )
@@ -3,6 +3,7 @@ Gunicorn production configuration for Student Management System
 """
 
 import os
+import shutil
 import multiprocessing
 
 # Server socket
@@ -41,6 +42,38 @@ tmp_upload_dir = None
 # keyfile = "/path/to/keyfile"
 # certfile = "/path/to/certfile"
 
+# Metrics: workers share samples through this directory (see metrics.py)
+prometheus_multiproc_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', '/tmp/student_management_system_metrics'
+)
+
+def on_starting(server):
+    """Start every master with an empty metrics directory"""
+    shutil.rmtree(prometheus_multiproc_dir, ignore_errors=True)
+    os.makedirs(prometheus_multiproc_dir, exist_ok=True)
+
+def post_fork(server, worker):
+    """Give each worker its own database pool instead of the master's sockets"""
+    from db_pool import after_fork
+    opened = after_fork(server.app.wsgi())
+    server.log.info(f"Worker {worker.pid}: database pool reset, {opened} connections warmed")
+
+def post_request(worker, req, environ, resp):
+    """Recycle a worker gracefully once its RSS passes WORKER_MAX_RSS_MB"""
+    from memory import over_rss_limit
+    over, rss = over_rss_limit(worker.app.wsgi().config['WORKER_MAX_RSS_MB'])
+    if over and worker.alive:
+        worker.log.info(f"Worker {worker.pid}: RSS {rss // (1024 * 1024)} MB over limit, recycling")
+        worker.alive = False
+
+def child_exit(server, worker):
+    """Drop live gauges of a worker that has exited"""
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
+
 # Environment variables for production
 raw_env = [
     f"FLASK_ENV=production",
@@ -0,0 +1,284 @@
+"""
+Bulk student import from Excel (.xlsx) or CSV uploads.
+
+Rows are streamed from the upload, validated with the same StudentForm used
+by the Add Student page and inserted with chunked bulk INSERTs inside one
+transaction. Course, batch and scheme names are resolved with one query
+each, enrollment number collisions are checked against a single set of
+the centre's existing numbers and blank numbers are allocated from the
+centre's sequence in one statement.
+"""
+
+import csv
+import io
+import os
+import secrets
+from datetime import datetime, date
+
+from sqlalchemy import insert
+from werkzeug.datastructures import MultiDict
+
+from app import db
+from models import Centre, Student, FeePayment, Course, Batch, Scheme
+import fee_summaries
+from forms import StudentForm
+from utils import calculate_net_fees, generate_enrollment_numbers, reserve_enrollment_numbers
+
+CHUNK_SIZE = 500
+
+# Accepted spellings of each column header, after lower-casing and
+# replacing spaces with underscores
+COLUMN_ALIASES = {
+    'enrollment_number': ['enrollment_number', 'enrollment_no', 'enrolment_number', 'enrollment'],
+    'name': ['name', 'student_name'],
+    'father_name': ['father_name', "father's_name", 'fathers_name'],
+    'sex': ['sex', 'gender'],
+    'age': ['age'],
+    'date_of_birth': ['date_of_birth', 'dob'],
+    'date_of_joining': ['date_of_joining', 'joining_date', 'doj'],
+    'mobile1': ['mobile1', 'mobile', 'mobile_number', 'mobile_1', 'phone'],
+    'mobile2': ['mobile2', 'mobile_2', 'alternate_mobile'],
+    'address_line1': ['address_line1', 'address_line_1', 'address'],
+    'address_line2': ['address_line2', 'address_line_2'],
+    'city': ['city'],
+    'pincode': ['pincode', 'pin_code', 'pin'],
+    'qualification': ['qualification'],
+    'course': ['course', 'course_name'],
+    'batch': ['batch', 'batch_name'],
+    'scheme': ['scheme', 'scheme_name'],
+    'total_fees': ['total_fees', 'fees'],
+    'concession': ['concession', 'discount'],
+    'bill_number': ['bill_number', 'bill_no'],
+    'initial_payment_amount': ['initial_payment_amount', 'initial_payment', 'paid_amount'],
+    'initial_payment_date': ['initial_payment_date', 'payment_date'],
+    'initial_payment_method': ['initial_payment_method', 'payment_method']
+}
+HEADER_LOOKUP = {alias: field for field, aliases in COLUMN_ALIASES.items() for alias in aliases}
+DATE_FIELDS = ('date_of_birth', 'date_of_joining', 'initial_payment_date')
+DATE_FORMATS = ('%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y', '%d.%m.%Y', '%Y/%m/%d')
+UPPERCASE_FIELDS = ('name', 'father_name', 'address_line1', 'address_line2', 'city', 'qualification')
+
+
+class ImportResult:
+    """Outcome of an import: counts plus one entry per rejected row"""
+
+    def __init__(self):
+        self.total_rows = 0
+        self.imported = 0
+        self.payments = 0
+        self.errors = []
+        self.report_token = None
+
+    def add_error(self, row_number, row, messages):
+        self.errors.append({
+            'row': row_number,
+            'enrollment_number': row.get('enrollment_number', ''),
+            'name': row.get('name', ''),
+            'errors': '; '.join(messages)
+        })
+
+
+def _normalise_header(value):
+    return HEADER_LOOKUP.get(str(value or '').strip().lower().replace(' ', '_'))
+
+
+def _cell_text(value):
+    """Render a spreadsheet cell the way a user would have typed it"""
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def _iter_xlsx(stream):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [_normalise_header(cell) for cell in next(rows, [])]
+        for values in rows:
+            yield {field: _cell_text(value) for field, value in zip(header, values) if field}
+    finally:
+        workbook.close()
+
+
+def _iter_csv(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.reader(text)
+    header = [_normalise_header(cell) for cell in next(reader, [])]
+    for values in reader:
+        yield {field: value.strip() for field, value in zip(header, values) if field}
+
+
+def iter_rows(file_storage):
+    """Yield one dict per data row of an uploaded .xlsx or .csv file"""
+    extension = os.path.splitext(file_storage.filename or '')[1].lower()
+    if extension == '.xlsx':
+        return _iter_xlsx(file_storage.stream)
+    if extension == '.csv':
+        return _iter_csv(file_storage.stream)
+    raise ValueError('Only .xlsx and .csv files can be imported')
+
+
+def _iso_date(value):
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return value
+
+
+def _lookup(model, centre_id):
+    rows = db.session.query(model.id, model.name).filter(model.centre_id == centre_id).all()
+    return {name.strip().upper(): id for id, name in rows}
+
+
+def _assign_enrollment_numbers(students, centre_id, taken):
+    """Fill blank enrollment numbers from the centre's sequence, one allocation per pass"""
+    pending = [values for values in students if not values['enrollment_number']]
+    while pending:
+        numbers = [number for number in generate_enrollment_numbers(centre_id, len(pending))
+                   if number not in taken]
+        for values, number in zip(pending, numbers):
+            values['enrollment_number'] = number
+        pending = pending[len(numbers):]
+
+
+def import_students(file_storage, centre_id):
+    """Validate and insert every row of an upload, returning an ImportResult"""
+    result = ImportResult()
+
+    courses = _lookup(Course, centre_id)
+    batches = _lookup(Batch, centre_id)
+    schemes = _lookup(Scheme, centre_id)
+    choices = {
+        'course_id': [(0, '')] + [(id, name) for name, id in courses.items()],
+        'batch_id': [(0, '')] + [(id, name) for name, id in batches.items()],
+        'scheme_id': [(0, '')] + [(id, name) for name, id in schemes.items()]
+    }
+
+    taken = set(
+        number for (number,) in
+        db.session.query(Student.enrollment_number).filter(Student.centre_id == centre_id)
+    )
+    students, payments = [], []
+    for row_number, row in enumerate(iter_rows(file_storage), start=2):
+        if not any(row.values()):
+            continue
+        result.total_rows += 1
+        messages = []
+
+        formdata = MultiDict(row)
+        for field in DATE_FIELDS:
+            if row.get(field):
+                formdata[field] = _iso_date(row[field])
+        if not row.get('date_of_joining'):
+            formdata['date_of_joining'] = date.today().isoformat()
+        for field, lookup in (('course', courses), ('batch', batches), ('scheme', schemes)):
+            name = row.get(field, '').upper()
+            if name and name not in lookup:
+                messages.append(f"Unknown {field} '{row[field]}'")
+            formdata[f'{field}_id'] = str(lookup.get(name, 0))
+        if row.get('sex'):
+            formdata['sex'] = row['sex'].upper()
+        if row.get('initial_payment_method'):
+            formdata['initial_payment_method'] = row['initial_payment_method'].upper()
+
+        form = StudentForm(formdata=formdata, meta={'csrf': False})
+        for field, field_choices in choices.items():
+            getattr(form, field).choices = field_choices
+        if not form.validate():
+            messages.extend(
+                f"{getattr(form, field).label.text}: {error}"
+                for field, errors in form.errors.items() for error in errors
+            )
+
+        enrollment_number = (form.enrollment_number.data or '').strip().upper()
+        if enrollment_number and enrollment_number in taken:
+            messages.append(f"Enrollment number {enrollment_number} already exists")
+
+        if messages:
+            result.add_error(row_number, row, messages)
+            continue
+        if enrollment_number:
+            taken.add(enrollment_number)
+
+        values = {field: (getattr(form, field).data or '').upper() or None for field in UPPERCASE_FIELDS}
+        values.update(
+            enrollment_number=enrollment_number or None,
+            sex=form.sex.data or None,
+            age=form.age.data,
+            date_of_birth=form.date_of_birth.data,
+            date_of_joining=form.date_of_joining.data,
+            mobile1=form.mobile1.data,
+            mobile2=form.mobile2.data or None,
+            pincode=form.pincode.data or None,
+            total_fees=form.total_fees.data,
+            net_fees=calculate_net_fees(form.total_fees.data, form.concession.data),
+            concession=form.concession.data or 0,
+            bill_number=form.bill_number.data or None,
+            centre_id=centre_id,
+            course_id=form.course_id.data,
+            scheme_id=form.scheme_id.data or None,
+            batch_id=form.batch_id.data or None
+        )
+        students.append(values)
+
+        amount = form.initial_payment_amount.data
+        payments.append({
+            'amount': amount,
+            'payment_date': form.initial_payment_date.data or date.today(),
+            'payment_method': form.initial_payment_method.data or None,
+            'receipt_number': form.bill_number.data or None,
+            'notes': 'Initial payment',
+            'centre_id': centre_id
+        } if amount and amount > 0 else None)
+
+    try:
+        reserve_enrollment_numbers(centre_id, [values['enrollment_number'] for values in students])
+        _assign_enrollment_numbers(students, centre_id, taken)
+        student_ids = []
+        for start in range(0, len(students), CHUNK_SIZE):
+            chunk = students[start:start + CHUNK_SIZE]
+            ids = db.session.execute(
+                insert(Student).returning(Student.id, sort_by_parameter_order=True), chunk
+            ).scalars().all()
+            student_ids.extend(ids)
+
+            chunk_payments = [
+                dict(payment, student_id=student_id)
+                for student_id, payment in zip(ids, payments[start:start + CHUNK_SIZE])
+                if payment
+            ]
+            if chunk_payments:
+                db.session.execute(insert(FeePayment), chunk_payments)
+            result.payments += len(chunk_payments)
+        if students:
+            Centre.touch([centre_id])
+            fee_summaries.apply_changes(None, student_ids)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    result.imported = len(students)
+    return result
+
+
+def write_error_report(result, folder, centre_id):
+    """Save rejected rows as CSV and remember the download token"""
+    os.makedirs(folder, exist_ok=True)
+    result.report_token = secrets.token_hex(8)
+    path = os.path.join(folder, f"{centre_id}_{result.report_token}.csv")
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=['row', 'enrollment_number', 'name', 'errors'])
+        writer.writeheader()
+        writer.writerows(result.errors)
+    return path
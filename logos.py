@@ -0,0 +1,148 @@
+"""
+Centre logo pipeline.
+
+An upload is written to disk as-is and the request returns straight away. A
+background thread then decodes it once and renders every size in LOGO_SIZES
+as both WebP and PNG. Each file is named after a hash of its own content, so
+a URL never changes meaning and /logos/<filename> can be cached for a year
+as immutable. The variants are recorded in Centre.logo_variants. Pages use
+the smallest variant that covers the displayed size, and PDF exports embed
+the PNG variant.
+"""
+
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from flask import send_from_directory, url_for
+
+from app import db
+
+LOGO_SIZES = (64, 128, 256)
+LOGO_FORMATS = {'webp': {'format': 'WEBP', 'quality': 85, 'method': 6}, 'png': {'format': 'PNG', 'optimize': True}}
+CACHE_SECONDS = 365 * 24 * 3600
+
+_executor = None
+_executor_pid = None
+
+
+def logo_folder(app):
+    return app.config['LOGO_FOLDER']
+
+
+def render_variants(source, folder, centre_id):
+    """Decode an image once and write every size and format, returning their filenames"""
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA')
+
+    variants = {}
+    for size in LOGO_SIZES:
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.Resampling.LANCZOS)
+        variants[str(size)] = {}
+        for extension, options in LOGO_FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, **options)
+            data = buffer.getvalue()
+            filename = f"{centre_id}-{size}-{hashlib.sha256(data).hexdigest()[:16]}.{extension}"
+            path = os.path.join(folder, filename)
+            if not os.path.exists(path):
+                with open(path, 'wb') as f:
+                    f.write(data)
+            variants[str(size)][extension] = filename
+    return variants
+
+
+def _filenames(variants):
+    return {filename for files in (variants or {}).values() for filename in files.values()}
+
+
+def process_logo(app, centre_id, source):
+    """Render variants for an uploaded logo and attach them to the centre"""
+    from models import Centre
+
+    with app.app_context():
+        try:
+            variants = render_variants(source, logo_folder(app), centre_id)
+            centre = db.session.get(Centre, centre_id)
+            previous = _filenames(centre.logo_variants)
+            centre.logo_variants = variants
+            centre.logo_filename = None
+            db.session.commit()
+            for filename in previous - _filenames(variants):
+                os.remove(os.path.join(logo_folder(app), filename))
+            app.logger.info(f"Processed logo for centre {centre_id}")
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Logo processing failed for centre {centre_id}: {e}", exc_info=True)
+        finally:
+            if os.path.exists(source):
+                os.remove(source)
+
+
+def submit_logo(app, centre_id, file_storage):
+    """Store an upload and queue it for processing; runs inline under testing"""
+    global _executor, _executor_pid
+
+    folder = os.path.join(logo_folder(app), 'incoming')
+    os.makedirs(folder, exist_ok=True)
+    source = os.path.join(folder, f"{centre_id}-{os.urandom(8).hex()}")
+    file_storage.save(source)
+
+    if app.testing:
+        process_logo(app, centre_id, source)
+        return
+
+    # Executor threads do not survive gunicorn's fork, so create one per process
+    if _executor_pid != os.getpid():
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='logo')
+        _executor_pid = os.getpid()
+    _executor.submit(process_logo, app, centre_id, source)
+
+
+def variant(centre, size):
+    """Filenames of the smallest variant at least ``size`` pixels wide"""
+    variants = centre.logo_variants or {}
+    for candidate in sorted(variants, key=int):
+        if int(candidate) >= size:
+            return variants[candidate]
+    return variants[max(variants, key=int)] if variants else None
+
+
+def logo_url(centre, size=64, fmt='png'):
+    """URL of the centre's logo for display at ``size`` pixels, or None"""
+    files = variant(centre, size)
+    if files:
+        return url_for('logo_file', filename=files[fmt])
+    if centre.logo_filename:
+        return url_for('static', filename='uploads/' + centre.logo_filename)
+    return None
+
+
+def logo_path(app, centre, size=128):
+    """Filesystem path of the PNG variant, for embedding in PDFs"""
+    files = variant(centre, size)
+    if files:
+        return os.path.join(logo_folder(app), files['png'])
+    if centre.logo_filename:
+        return os.path.join(app.root_path, 'static', 'uploads', centre.logo_filename)
+    return None
+
+
+def init_logos(app):
+    """Register the immutable /logos route and template helpers"""
+    app.config.setdefault('LOGO_FOLDER', os.path.join(app.config['UPLOAD_FOLDER'], 'logos'))
+    os.makedirs(app.config['LOGO_FOLDER'], exist_ok=True)
+
+    @app.route('/logos/<filename>')
+    def logo_file(filename):
+        response = send_from_directory(app.config['LOGO_FOLDER'], filename, max_age=CACHE_SECONDS)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    app.jinja_env.globals['logo_url'] = logo_url
@@ -11,6 +11,10 @@ from app import create_app
 # Create the Flask application
 app = create_app()
 
+# Load every template before gunicorn forks, so each worker starts warm
+from template_cache import compile_templates
+compile_templates(app)
+
 if __name__ == '__main__':
     # Production server configuration
     host = os.environ.get('HOST', '103.25.175.157')  # Default to your production IP
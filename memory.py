@@ -0,0 +1,120 @@
+"""
+Worker memory: RSS-based recycling and per-endpoint allocation peaks.
+
+gunicorn's post_request hook (gunicorn.conf.py) calls over_rss_limit() after
+every request. When the worker's resident set is above WORKER_MAX_RSS_MB,
+the worker finishes the request and exits gracefully, exactly as it does
+when it reaches max_requests, and the master forks a fresh one. One large
+export can no longer leave a worker bloated for the rest of its life.
+
+With MEMORY_TRACE=on, tracemalloc runs in every worker. The peak Python
+allocation of each request is recorded per endpoint, in the
+lerzo_request_peak_alloc_bytes histogram when metrics are enabled and at
+/admin/memory. When a request sets a new peak for its endpoint, the top
+allocation sites still live at the end of that request are kept as well.
+tracemalloc slows Python allocation noticeably, so turn it on to measure
+rather than leaving it on.
+"""
+
+import os
+import resource
+import sys
+import threading
+import tracemalloc
+
+from flask import g, request
+
+try:
+    from metrics import REQUEST_PEAK_ALLOC
+except ImportError:
+    REQUEST_PEAK_ALLOC = None
+
+TOP_SITES = 10
+
+
+def rss_bytes():
+    """Current resident set size of this process"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # No /proc (macOS): fall back to the peak, which is what ru_maxrss reports
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def over_rss_limit(limit_mb):
+    """(True, rss) when this process is above ``limit_mb``; 0 disables the check"""
+    rss = rss_bytes()
+    return bool(limit_mb) and rss > limit_mb * 1024 * 1024, rss
+
+
+class AllocationStats:
+    """Peak allocation per endpoint in this worker"""
+
+    def __init__(self, root_path):
+        self.root_path = root_path
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, peak):
+        with self.lock:
+            stats = self.endpoints.setdefault(endpoint, {'requests': 0, 'total': 0, 'max': 0, 'sites': []})
+            stats['requests'] += 1
+            stats['total'] += peak
+            new_max = peak > stats['max']
+            if new_max:
+                stats['max'] = peak
+        if new_max:
+            sites = self.top_sites()
+            with self.lock:
+                stats['sites'] = sites
+
+    def top_sites(self):
+        """Largest live allocations by source line, application code only"""
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(True, os.path.join(self.root_path, '*')),
+            tracemalloc.Filter(False, __file__),
+        ))
+        return [
+            (f"{os.path.relpath(stat.traceback[0].filename, self.root_path)}:{stat.traceback[0].lineno}", stat.size)
+            for stat in snapshot.statistics('lineno')[:TOP_SITES]
+        ]
+
+    def summary(self):
+        """Endpoints ordered by their largest request"""
+        with self.lock:
+            rows = [
+                dict(stats, endpoint=endpoint, average=stats['total'] / stats['requests'])
+                for endpoint, stats in self.endpoints.items()
+            ]
+        return sorted(rows, key=lambda row: row['max'], reverse=True)
+
+
+def init_memory_tracking(app):
+    """Read the RSS limit and, when enabled, trace allocations per request"""
+    app.config.setdefault('WORKER_MAX_RSS_MB', int(os.environ.get('WORKER_MAX_RSS_MB', 512)))
+    app.config.setdefault('MEMORY_TRACE', os.environ.get('MEMORY_TRACE', 'off').lower() == 'on')
+
+    stats = AllocationStats(app.root_path) if app.config['MEMORY_TRACE'] else None
+    app.extensions['allocation_stats'] = stats
+    if stats is None:
+        return
+
+    @app.before_request
+    def start_allocation_trace():
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        g.allocation_baseline = tracemalloc.get_traced_memory()[0]
+
+    @app.teardown_request
+    def record_allocation_peak(exc):
+        baseline = g.pop('allocation_baseline', None)
+        if baseline is None or not tracemalloc.is_tracing():
+            return
+        peak = max(tracemalloc.get_traced_memory()[1] - baseline, 0)
+        endpoint = request.endpoint or 'unmatched'
+        stats.record(endpoint, peak)
+        if REQUEST_PEAK_ALLOC is not None:
+            REQUEST_PEAK_ALLOC.labels(endpoint=endpoint).observe(peak)
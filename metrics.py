@@ -0,0 +1,183 @@
+"""
+Prometheus metrics for request latency, SQL usage, exports and PDF rendering.
+
+When PROMETHEUS_MULTIPROC_DIR is set (gunicorn.conf.py sets it) every worker
+writes its samples into that directory and /metrics aggregates all of them,
+so a scrape reports the whole server instead of whichever worker answered.
+
+/metrics needs `Authorization: Bearer $METRICS_TOKEN`. Without a token it
+only answers scrapes from the same host.
+"""
+
+import os
+import time
+from functools import wraps
+
+from flask import g, request, Response, abort, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess
+)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REQUEST_LATENCY = Histogram(
+    'lerzo_request_duration_seconds',
+    'Request latency by Flask endpoint',
+    ['endpoint', 'method', 'status'],
+    buckets=LATENCY_BUCKETS
+)
+REQUEST_QUERIES = Histogram(
+    'lerzo_request_queries',
+    'SQL statements executed per request',
+    ['endpoint'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 250, 500, 1000)
+)
+REQUEST_DB_TIME = Histogram(
+    'lerzo_request_db_seconds',
+    'Time spent executing SQL per request',
+    ['endpoint'],
+    buckets=LATENCY_BUCKETS
+)
+DB_QUERIES_TOTAL = Counter(
+    'lerzo_db_queries_total',
+    'SQL statements executed',
+    ['endpoint']
+)
+DB_SECONDS_TOTAL = Counter(
+    'lerzo_db_seconds_total',
+    'Time spent executing SQL',
+    ['endpoint']
+)
+EXPORT_DURATION = Histogram(
+    'lerzo_export_duration_seconds',
+    'Time taken to build an export file',
+    ['kind', 'format'],
+    buckets=LATENCY_BUCKETS
+)
+EXPORT_SIZE = Histogram(
+    'lerzo_export_bytes',
+    'Size of generated export files',
+    ['kind', 'format'],
+    buckets=(1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7, 5e7)
+)
+PDF_RENDER_SECONDS = Histogram(
+    'lerzo_pdf_render_seconds',
+    'WeasyPrint render time',
+    ['document'],
+    buckets=LATENCY_BUCKETS
+)
+REQUEST_PEAK_ALLOC = Histogram(
+    'lerzo_request_peak_alloc_bytes',
+    'Peak Python allocation during a request (MEMORY_TRACE=on)',
+    ['endpoint'],
+    buckets=(1e5, 5e5, 1e6, 5e6, 1e7, 2.5e7, 5e7, 1e8, 2.5e8, 5e8)
+)
+
+
+def _current_endpoint():
+    if has_request_context():
+        return request.endpoint or 'unmatched'
+    return 'background'
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('metrics_query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    endpoint = _current_endpoint()
+
+    DB_QUERIES_TOTAL.labels(endpoint=endpoint).inc()
+    DB_SECONDS_TOTAL.labels(endpoint=endpoint).inc(elapsed)
+
+    if has_request_context() and 'metrics_start' in g:
+        g.metrics_queries += 1
+        g.metrics_db_time += elapsed
+
+
+def timed_export(kind, fmt):
+    """Record duration and output size of an exporter returning a BytesIO"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            started = time.perf_counter()
+            result = f(*args, **kwargs)
+            output = result[0] if isinstance(result, tuple) else result
+            EXPORT_DURATION.labels(kind=kind, format=fmt).observe(time.perf_counter() - started)
+            EXPORT_SIZE.labels(kind=kind, format=fmt).observe(output.getbuffer().nbytes)
+            return result
+        return decorated_function
+    return decorator
+
+
+def _collect():
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+LOOPBACK = ('127.0.0.1', '::1')
+
+
+def _is_local_request():
+    """True when the client, and the peer that forwarded it, are this host"""
+    # ProxyFix has already replaced REMOTE_ADDR with X-Forwarded-For; check the real peer too
+    peer = request.environ.get('werkzeug.proxy_fix.orig', {}).get('REMOTE_ADDR', request.remote_addr)
+    return request.remote_addr in LOOPBACK and peer in LOOPBACK
+
+
+def init_metrics(app):
+    """Register request hooks and the /metrics endpoint"""
+    app.config.setdefault('METRICS_TOKEN', os.environ.get('METRICS_TOKEN'))
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_start = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_db_time = 0.0
+
+    @app.after_request
+    def capture_response_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def record_request_metrics(exc):
+        if 'metrics_start' not in g or request.endpoint == 'metrics':
+            return
+        endpoint = request.endpoint or 'unmatched'
+        status = g.get('metrics_status', 500 if exc else 200)
+
+        REQUEST_LATENCY.labels(
+            endpoint=endpoint,
+            method=request.method,
+            status=str(status)
+        ).observe(time.perf_counter() - g.metrics_start)
+        REQUEST_QUERIES.labels(endpoint=endpoint).observe(g.metrics_queries)
+        REQUEST_DB_TIME.labels(endpoint=endpoint).observe(g.metrics_db_time)
+
+    @app.route('/metrics')
+    def metrics():
+        token = app.config.get('METRICS_TOKEN')
+        if token:
+            if request.headers.get('Authorization') != f"Bearer {token}":
+                abort(401)
+        elif not _is_local_request():
+            abort(403)
+        return Response(_collect(), content_type=CONTENT_TYPE_LATEST)
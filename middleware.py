@@ -1,4 +1,4 @@
-from flask import request, redirect, url_for, session, flash, g
+from flask import request, redirect, url_for, session, flash, g, abort, current_app
 from flask_login import current_user
 from functools import wraps
 
@@ -14,6 +14,14 @@ def subscription_middleware():
         'subscription_payment',
         'subscription_webhook',
         'subscription_success',
+        'metrics',
+        'logo_file',
+        'admin_slow_queries',
+        'admin_slow_queries_reset',
+        'admin_profiles',
+        'admin_profile_file',
+        'admin_profiler_stacks',
+        'admin_memory',
         'static'
     ]
     
@@ -45,3 +53,16 @@ def subscription_required(f):
         
         return f(*args, **kwargs)
     return decorated_function
+
+def admin_required(f):
+    """Decorator restricting a view to the accounts listed in ADMIN_EMAILS"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return redirect(url_for('auth_login'))
+        
+        if current_user.email.lower() not in current_app.config['ADMIN_EMAILS']:
+            abort(403)
+        
+        return f(*args, **kwargs)
+    return decorated_function
@@ -1,10 +1,26 @@
 from datetime import datetime, timedelta
+from itertools import chain
 from flask_login import UserMixin
-from sqlalchemy import func
+from sqlalchemy import case, event, func, inspect, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import joinedload, selectinload, defer
 from app import db
 
+def dialect_insert(model):
+    """INSERT construct with ON CONFLICT support for the configured database"""
+    if db.engine.dialect.name == 'postgresql':
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+ACTIVE_SUBSCRIPTION_TYPES = ('trial', 'monthly', 'yearly')
+
 class Centre(UserMixin, db.Model):
     __tablename__ = 'centres'
+    __table_args__ = (
+        # Used by the subscription sweep to find lapsed trials and plans
+        db.Index('ix_centres_trial_end', 'subscription_type', 'trial_end_date'),
+        db.Index('ix_centres_subscription_end', 'subscription_type', 'subscription_end_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
@@ -14,7 +30,8 @@ class Centre(UserMixin, db.Model):
     address = db.Column(db.Text)
     city = db.Column(db.String(100))
     pincode = db.Column(db.String(10))
-    logo_filename = db.Column(db.String(255))
+    logo_filename = db.Column(db.String(255))  # uploads from before logo variants
+    logo_variants = db.Column(db.JSON)  # {"64": {"webp": ..., "png": ...}, ...} see logos.py
     
     # Subscription fields
     trial_start_date = db.Column(db.DateTime, default=datetime.utcnow)
@@ -23,6 +40,9 @@ class Centre(UserMixin, db.Model):
     subscription_start_date = db.Column(db.DateTime)
     subscription_end_date = db.Column(db.DateTime)
     razorpay_subscription_id = db.Column(db.String(100))
+    days_left = db.Column(db.Integer)  # refreshed by `flask subscriptions sweep`
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # see Centre.touch
+    data_changed_at = db.Column(db.DateTime, default=datetime.utcnow)  # Last-Modified for conditional GETs
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -34,18 +54,32 @@ class Centre(UserMixin, db.Model):
     schemes = db.relationship('Scheme', backref='centre', lazy=True, cascade='all, delete-orphan')
     fee_payments = db.relationship('FeePayment', backref='centre', lazy=True, cascade='all, delete-orphan')
     
+    @staticmethod
+    def touch(centre_ids, connection=None):
+        """Bump data_version so cached fragments and ETags for these centres go stale"""
+        centres = Centre.__table__
+        stmt = update(centres).where(centres.c.id.in_(list(set(centre_ids)))).values(
+            data_version=centres.c.data_version + 1,
+            data_changed_at=datetime.utcnow(),
+            updated_at=centres.c.updated_at
+        )
+        (connection or db.session).execute(stmt)
+    
     def is_subscription_active(self):
+        # The end date is the guard; the sweep only updates the stored state
+        if self.subscription_type not in ACTIVE_SUBSCRIPTION_TYPES:
+            return False
         now = datetime.utcnow()
         if self.subscription_type == 'trial':
-            return now <= self.trial_end_date
-        elif self.subscription_type in ['monthly', 'yearly']:
-            return now <= self.subscription_end_date if self.subscription_end_date else False
-        return False
+            return self.trial_end_date is not None and now <= self.trial_end_date
+        return self.subscription_end_date is not None and now <= self.subscription_end_date
     
     def get_subscription_status(self):
         if self.is_subscription_active():
             if self.subscription_type == 'trial':
-                days_left = (self.trial_end_date - datetime.utcnow()).days
+                days_left = self.days_left
+                if days_left is None:
+                    days_left = (self.trial_end_date - datetime.utcnow()).days
                 return f"Trial - {days_left} days left"
             else:
                 return f"{self.subscription_type.title()} - Active"
@@ -84,6 +118,9 @@ class Scheme(db.Model):
 
 class Student(db.Model):
     __tablename__ = 'students'
+    __table_args__ = (
+        db.Index('uq_students_centre_enrollment', 'centre_id', 'enrollment_number', unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     enrollment_number = db.Column(db.String(50), nullable=False)
@@ -136,6 +173,40 @@ class Student(db.Model):
             return "Unpaid"
         else:
             return "Partial"
+    
+    @classmethod
+    def loader_profile(cls, name):
+        """Eager-loading options for a named query profile"""
+        payments = selectinload(cls.fee_payments).load_only(FeePayment.amount)
+        rarely_shown = [
+            defer(cls.date_of_birth), defer(cls.mobile2), defer(cls.address_line1),
+            defer(cls.address_line2), defer(cls.city), defer(cls.pincode),
+            defer(cls.qualification), defer(cls.bill_number)
+        ]
+        profiles = {
+            # Tables of students with course, batch and fee status
+            'list': [
+                joinedload(cls.course).load_only(Course.name),
+                joinedload(cls.batch).load_only(Batch.name, Batch.start_time, Batch.end_time),
+                payments,
+                *rarely_shown
+            ],
+            # A single student's page
+            'detail': [
+                joinedload(cls.course),
+                joinedload(cls.batch),
+                joinedload(cls.scheme),
+                selectinload(cls.fee_payments)
+            ],
+            # Fee totals and status counts only
+            'fees': [payments, *rarely_shown],
+            # Excel and PDF exports
+            'export': [
+                joinedload(cls.course).load_only(Course.name),
+                payments
+            ]
+        }
+        return profiles[name]
 
 class Enquiry(db.Model):
     __tablename__ = 'enquiries'
@@ -168,6 +239,18 @@ class Enquiry(db.Model):
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    @classmethod
+    def loader_profile(cls, name):
+        """Eager-loading options for a named query profile"""
+        profiles = {
+            'list': [
+                joinedload(cls.course_interested).load_only(Course.name),
+                defer(cls.address), defer(cls.reason_for_interest)
+            ],
+            'export': [joinedload(cls.course_interested).load_only(Course.name)]
+        }
+        return profiles[name]
 
 class FeePayment(db.Model):
     __tablename__ = 'fee_payments'
@@ -187,6 +270,14 @@ class FeePayment(db.Model):
 
 class SubscriptionPayment(db.Model):
     __tablename__ = 'subscription_payments'
+    __table_args__ = (
+        db.Index('uq_subscription_payments_payment', 'razorpay_payment_id', unique=True),
+        db.Index('ix_subscription_payments_subscription', 'razorpay_subscription_id'),
+        # One payment-less record per subscription (created on subscription.activated)
+        db.Index('uq_subscription_payments_subscription_pending', 'razorpay_subscription_id', unique=True,
+                 postgresql_where=db.text('razorpay_payment_id IS NULL'),
+                 sqlite_where=db.text('razorpay_payment_id IS NULL')),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     centre_id = db.Column(db.Integer, db.ForeignKey('centres.id'), nullable=False)
@@ -194,10 +285,24 @@ class SubscriptionPayment(db.Model):
     plan_type = db.Column(db.String(20), nullable=False)  # monthly, yearly
     payment_date = db.Column(db.DateTime, default=datetime.utcnow)
     razorpay_payment_id = db.Column(db.String(100))
+    razorpay_subscription_id = db.Column(db.String(100))
     razorpay_order_id = db.Column(db.String(100))
     status = db.Column(db.String(20), default='pending')  # pending, completed, failed
+    notes = db.Column(db.Text)
     
     centre = db.relationship('Centre', backref='subscription_payments')
+    
+    @classmethod
+    def record(cls, **values):
+        """Insert a payment unless its Razorpay keys are already recorded.
+
+        Uses INSERT ... ON CONFLICT DO NOTHING against the unique indexes, so
+        concurrent webhook deliveries and the checkout redirect cannot create
+        duplicates. Returns the new row id, or None when it already existed.
+        """
+        values.setdefault('payment_date', datetime.utcnow())
+        stmt = dialect_insert(cls).values(**values).on_conflict_do_nothing().returning(cls.id)
+        return db.session.execute(stmt).scalar_one_or_none()
 
 
 class Batch(db.Model):
@@ -211,4 +316,145 @@ class Batch(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     
     # Relationship
-    students = db.relationship('Student', backref='batch', lazy=True)
\ No newline at end of file
+    students = db.relationship('Student', backref='batch', lazy=True)
+
+class EnrollmentCounter(db.Model):
+    __tablename__ = 'enrollment_counters'
+    
+    centre_id = db.Column(db.Integer, db.ForeignKey('centres.id'), primary_key=True)
+    period = db.Column(db.String(10), primary_key=True, default='')  # e.g. '2025' for yearly sequences
+    last_value = db.Column(db.Integer, nullable=False, default=0)
+    
+    @classmethod
+    def allocate(cls, centre_id, period='', count=1):
+        """Reserve ``count`` consecutive values and return the last one.
+
+        A single INSERT ... ON CONFLICT DO UPDATE ... RETURNING creates or
+        increments the counter row. The row stays locked until the caller's
+        transaction ends, so concurrent workers never receive the same value
+        and a rolled back transaction gives its values back.
+        """
+        stmt = dialect_insert(cls).values(centre_id=centre_id, period=period, last_value=count)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.centre_id, cls.period],
+            set_={'last_value': cls.last_value + count}
+        ).returning(cls.last_value)
+        return db.session.execute(stmt).scalar_one()
+    
+    @classmethod
+    def raise_to(cls, centre_id, period, value):
+        """Move the counter up to ``value`` so allocation continues past a number entered by hand"""
+        stmt = dialect_insert(cls).values(centre_id=centre_id, period=period, last_value=value)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.centre_id, cls.period],
+            set_={'last_value': case((cls.last_value < value, value), else_=cls.last_value)}
+        )
+        db.session.execute(stmt)
+
+class SubscriptionTransition(db.Model):
+    __tablename__ = 'subscription_transitions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    centre_id = db.Column(db.Integer, db.ForeignKey('centres.id'), nullable=False, index=True)
+    from_type = db.Column(db.String(20))
+    to_type = db.Column(db.String(20), nullable=False)
+    reason = db.Column(db.String(50))  # e.g. 'trial_ended', 'plan_ended'
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class WebhookEvent(db.Model):
+    __tablename__ = 'webhook_events'
+    __table_args__ = (
+        db.Index('ix_webhook_events_pending', 'status', 'next_attempt_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.String(100), unique=True, nullable=False)  # X-Razorpay-Event-Id
+    event = db.Column(db.String(100), nullable=False)  # e.g. subscription.charged
+    payload = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, processed, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime)
+
+class SlowQuery(db.Model):
+    __tablename__ = 'slow_queries'
+    __table_args__ = (
+        db.Index('uq_slow_queries_statement', 'fingerprint_hash', 'endpoint', unique=True),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    fingerprint_hash = db.Column(db.String(16), nullable=False)
+    fingerprint = db.Column(db.Text, nullable=False)  # SQL with literals replaced by ?
+    endpoint = db.Column(db.String(100), nullable=False)  # 'background' outside requests
+    calls = db.Column(db.Integer, nullable=False, default=0)
+    total_ms = db.Column(db.Float, nullable=False, default=0)
+    max_ms = db.Column(db.Float, nullable=False, default=0)
+    params_shape = db.Column(db.Text)  # parameter types of the latest call, never values
+    centre_id = db.Column(db.Integer)  # centre of the latest call
+    explain_plan = db.Column(db.Text)  # latest sampled plan, see slow_queries.py
+    first_seen = db.Column(db.DateTime, default=datetime.utcnow)
+    last_seen = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @property
+    def avg_ms(self):
+        return self.total_ms / self.calls if self.calls else 0
+
+
+class FeeSummary(db.Model):
+    """Fee rollup per centre, course, batch and month; kept current by fee_summaries"""
+    __tablename__ = 'fee_summaries'
+    __table_args__ = (
+        db.Index('uq_fee_summaries_key', 'centre_id', 'course_id', 'batch_id', 'month', unique=True),
+    )
+
+    # No foreign keys: rows are derived from the students and payments they summarise.
+    # 0 stands for no course or batch, so the unique key never contains NULLs.
+    id = db.Column(db.Integer, primary_key=True)
+    centre_id = db.Column(db.Integer, nullable=False)
+    course_id = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    batch_id = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    month = db.Column(db.Date, nullable=False)  # first day of the month
+
+    # Students who joined this month, with their fees to date
+    students = db.Column(db.Integer, nullable=False, default=0)
+    net_fees = db.Column(db.Float, nullable=False, default=0)
+    paid = db.Column(db.Float, nullable=False, default=0)
+    balance = db.Column(db.Float, nullable=False, default=0)
+    fully_paid = db.Column(db.Integer, nullable=False, default=0)
+    partially_paid = db.Column(db.Integer, nullable=False, default=0)
+    unpaid = db.Column(db.Integer, nullable=False, default=0)
+
+    # Payments received this month
+    collected = db.Column(db.Float, nullable=False, default=0)
+    payments = db.Column(db.Integer, nullable=False, default=0)
+
+    refreshed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# Rows shown on a centre's pages, and the centre's own columns that appear on them.
+# Writes to anything else (logs, webhooks, logo variants) leave caches and ETags valid.
+DISPLAYED = (Student, FeePayment, Enquiry, Course, Batch, Scheme)
+CENTRE_DISPLAYED_COLUMNS = ('name', 'phone', 'address', 'city', 'pincode', 'logo_filename',
+                            'subscription_type', 'trial_end_date', 'subscription_end_date')
+
+
+@event.listens_for(db.session, 'after_flush')
+def touch_flushed_centres(session, flush_context):
+    """Bump data_version for every centre whose displayed rows this flush wrote"""
+    centre_ids = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Centre):
+            state = inspect(obj)
+            if obj in session.dirty and any(state.attrs[column].history.has_changes()
+                                            for column in CENTRE_DISPLAYED_COLUMNS):
+                centre_ids.add(obj.id)
+        elif isinstance(obj, DISPLAYED):
+            if obj in session.dirty and not session.is_modified(obj, include_collections=False):
+                continue
+            if obj.centre_id:
+                centre_ids.add(obj.centre_id)
+    if centre_ids:
+        # Core statement on the flush's connection; an ORM execute would autoflush
+        Centre.touch(centre_ids, session.connection())
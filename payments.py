@@ -0,0 +1,172 @@
+"""
+Payment gateway shared by every request in a worker process.
+
+RazorpayGateway wraps one razorpay.Client whose requests.Session keeps TLS
+connections to api.razorpay.com alive in a bounded pool, with connect and
+read timeouts applied to every call. LocalGateway has the same interface but
+never leaves the process. Select it with PAYMENT_GATEWAY=local for tests,
+benchmarks and offline development.
+
+The gateway is created on first use in each process, not at import time,
+because gunicorn preloads the app and forked workers must not share sockets.
+"""
+
+import hashlib
+import hmac
+import os
+import secrets
+
+import requests
+from flask import current_app
+from requests.adapters import HTTPAdapter
+
+# Subscription plans offered on the plans page, keyed by plan type
+PLANS = {
+    'monthly': {
+        'id': os.environ.get('RAZORPAY_MONTHLY_PLAN_ID', 'plan_QiyHYDfCNwOii0'),
+        'amount': 69900,
+        'price': 699.00,
+        'days': 30,
+        'total_count': 12,
+        'duration': 'Monthly',
+        'name': 'Monthly Plan',
+        'display_name': 'Monthly Plan',
+        'amount_display': '699.00'
+    },
+    'yearly': {
+        'id': os.environ.get('RAZORPAY_YEARLY_PLAN_ID', 'plan_QiyHxYGHqd3KLz'),
+        'amount': 699900,
+        'price': 6999.00,
+        'days': 365,
+        'total_count': 1,
+        'duration': 'Yearly',
+        'name': 'Yearly Plan',
+        'display_name': 'Yearly Plan',
+        'amount_display': '6,999.00'
+    }
+}
+PLAN_TYPES_BY_ID = {plan['id']: plan_type for plan_type, plan in PLANS.items()}
+
+
+def checkout_signature(payment_id, subscription_id, secret):
+    """Hex HMAC-SHA256 of "payment_id|subscription_id" that Checkout returns"""
+    message = f"{payment_id}|{subscription_id}".encode()
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def signature_matches(payment_id, subscription_id, signature, secret):
+    if not (payment_id and subscription_id and signature and secret):
+        return False
+    return hmac.compare_digest(checkout_signature(payment_id, subscription_id, secret), signature)
+
+
+def plan_type_for(plan_id):
+    """Map a Razorpay plan id to 'monthly' or 'yearly' (monthly when unknown)"""
+    return PLAN_TYPES_BY_ID.get(plan_id, 'monthly')
+
+
+class _TimeoutSession(requests.Session):
+    """requests.Session that applies a default timeout to every request"""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+class RazorpayGateway:
+    """Razorpay API client with a keep-alive connection pool"""
+
+    def __init__(self, key_id, key_secret, timeout=(3.05, 10), pool_size=10):
+        import razorpay
+
+        self.key_id = key_id
+        self.key_secret = key_secret
+        self.session = _TimeoutSession(timeout)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=False)
+        self.session.mount('https://', adapter)
+        self.client = razorpay.Client(session=self.session, auth=(key_id, key_secret))
+
+    def create_subscription(self, plan_type, notes):
+        plan = PLANS[plan_type]
+        return self.client.subscription.create({
+            'plan_id': plan['id'],
+            'customer_notify': 1,
+            'quantity': 1,
+            'total_count': plan['total_count'],
+            'notes': notes
+        })
+
+    def fetch_subscription(self, subscription_id):
+        return self.client.subscription.fetch(subscription_id)
+
+    def verify_checkout(self, payment_id, subscription_id, signature):
+        """True when Checkout really returned this payment for this subscription"""
+        return signature_matches(payment_id, subscription_id, signature, self.key_secret)
+
+    def close(self):
+        self.session.close()
+
+
+class LocalGateway:
+    """In-process stand-in for RazorpayGateway that returns canned responses"""
+
+    key_id = 'rzp_test_local'
+    key_secret = 'local_secret'
+
+    def __init__(self):
+        self.subscriptions = {}
+
+    def create_subscription(self, plan_type, notes):
+        subscription = {
+            'id': f"sub_local_{secrets.token_hex(7)}",
+            'entity': 'subscription',
+            'plan_id': PLANS[plan_type]['id'],
+            'status': 'created',
+            'quantity': 1,
+            'total_count': PLANS[plan_type]['total_count'],
+            'notes': notes
+        }
+        self.subscriptions[subscription['id']] = subscription
+        return subscription
+
+    def fetch_subscription(self, subscription_id):
+        return self.subscriptions[subscription_id]
+
+    def verify_checkout(self, payment_id, subscription_id, signature):
+        return signature_matches(payment_id, subscription_id, signature, self.key_secret)
+
+    def close(self):
+        pass
+
+
+def _build_gateway(app):
+    if app.config['PAYMENT_GATEWAY'] == 'local':
+        return LocalGateway()
+    return RazorpayGateway(
+        os.environ.get('RAZORPAY_KEY_ID'),
+        os.environ.get('RAZORPAY_KEY_SECRET'),
+        timeout=(app.config['RAZORPAY_CONNECT_TIMEOUT'], app.config['RAZORPAY_READ_TIMEOUT']),
+        pool_size=app.config['RAZORPAY_POOL_SIZE']
+    )
+
+
+def get_gateway():
+    """Return this process's payment gateway, creating it on first use"""
+    app = current_app._get_current_object()
+    pid, gateway = app.extensions.get('payment_gateway', (None, None))
+    if pid != os.getpid():
+        gateway = _build_gateway(app)
+        app.extensions['payment_gateway'] = (os.getpid(), gateway)
+    return gateway
+
+
+def init_payments(app):
+    """Read payment gateway settings"""
+    app.config.setdefault('PAYMENT_GATEWAY', os.environ.get('PAYMENT_GATEWAY', 'razorpay'))
+    app.config.setdefault('RAZORPAY_CONNECT_TIMEOUT', float(os.environ.get('RAZORPAY_CONNECT_TIMEOUT', 3.05)))
+    app.config.setdefault('RAZORPAY_READ_TIMEOUT', float(os.environ.get('RAZORPAY_READ_TIMEOUT', 10)))
+    app.config.setdefault('RAZORPAY_POOL_SIZE', int(os.environ.get('RAZORPAY_POOL_SIZE', 10)))
@@ -0,0 +1,170 @@
+"""
+Request profiling for production.
+
+On demand: an admin who sends the X-Profile: 1 header, or adds ?_profile=1,
+gets that request run under cProfile. The .prof stats and a text summary
+sorted by cumulative time are written to PROFILE_DIR, and the response
+carries an X-Profile-Id header naming them. /admin/profiles lists recent
+profiles.
+
+Continuous: with SAMPLING_PROFILER=on, each worker runs a daemon thread
+that samples the stacks of threads handling requests every
+SAMPLING_PROFILER_INTERVAL seconds. It aggregates them as collapsed stacks.
+/admin/profiler/stacks returns them as "frame;frame;frame count" lines,
+ready for flamegraph.pl or speedscope. Only request threads are sampled, so
+idle workers cost nothing beyond the timer.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import current_app, g, request
+from flask_login import current_user
+
+MAX_STACK_DEPTH = 128
+OTHER = '[other]'
+
+
+def is_admin():
+    return current_user.is_authenticated and current_user.email.lower() in current_app.config['ADMIN_EMAILS']
+
+
+def profile_requested():
+    return request.headers.get('X-Profile') == '1' or request.args.get('_profile') == '1'
+
+
+def save_profile(profiler, folder, endpoint):
+    """Write the .prof file and a text summary; returns the profile id"""
+    os.makedirs(folder, exist_ok=True)
+    profile_id = f"{datetime.utcnow():%Y%m%d-%H%M%S}-{endpoint or 'unmatched'}-{os.getpid()}"
+    path = os.path.join(folder, profile_id)
+    profiler.dump_stats(path + '.prof')
+
+    summary = io.StringIO()
+    stats = pstats.Stats(profiler, stream=summary)
+    stats.strip_dirs().sort_stats('cumulative').print_stats(60)
+    with open(path + '.txt', 'w') as f:
+        f.write(f"{request.method} {request.full_path}\n")
+        f.write(summary.getvalue())
+    return profile_id
+
+
+def list_profiles(folder, limit=50):
+    """Most recent profiles as (id, size of .prof, modified time)"""
+    if not os.path.isdir(folder):
+        return []
+    entries = [entry for entry in os.scandir(folder) if entry.name.endswith('.prof')]
+    entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    return [
+        (entry.name[:-len('.prof')], entry.stat().st_size, datetime.fromtimestamp(entry.stat().st_mtime))
+        for entry in entries[:limit]
+    ]
+
+
+class StackSampler:
+    """Aggregates collapsed stacks of request threads"""
+
+    def __init__(self, interval, root_path, max_stacks=20000):
+        self.interval = interval
+        self.root_path = root_path
+        self.max_stacks = max_stacks
+        self.stacks = Counter()
+        self.samples = 0
+        self.active = set()
+        self.lock = threading.Lock()
+        self.pid = None
+        self.started_at = None
+
+    def _label(self, frame):
+        code = frame.f_code
+        filename = code.co_filename
+        if filename.startswith(self.root_path):
+            filename = os.path.relpath(filename, self.root_path)
+        else:
+            filename = os.path.basename(filename)
+        return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+    def sample(self):
+        frames = sys._current_frames()
+        collapsed = []
+        for ident in list(self.active):
+            frame = frames.get(ident)
+            labels = []
+            while frame is not None and len(labels) < MAX_STACK_DEPTH:
+                labels.append(self._label(frame))
+                frame = frame.f_back
+            if labels:
+                collapsed.append(';'.join(reversed(labels)))
+        with self.lock:
+            for stack in collapsed:
+                if stack in self.stacks or len(self.stacks) < self.max_stacks:
+                    self.stacks[stack] += 1
+                else:
+                    self.stacks[OTHER] += 1
+            self.samples += 1
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            if self.active:
+                self.sample()
+
+    def ensure_started(self):
+        # Threads do not survive gunicorn's fork, so each worker starts its own
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid != os.getpid():
+                self.stacks, self.samples, self.active = Counter(), 0, set()
+                self.pid = os.getpid()
+                self.started_at = datetime.utcnow()
+                threading.Thread(target=self.run, name='stack-sampler', daemon=True).start()
+
+    def collapsed(self, reset=False):
+        with self.lock:
+            lines = [f"{stack} {count}" for stack, count in self.stacks.most_common()]
+            if reset:
+                self.stacks.clear()
+                self.samples = 0
+        return '\n'.join(lines) + ('\n' if lines else '')
+
+
+def init_profiling(app):
+    """Register the per-request profiler hooks and the stack sampler"""
+    app.config.setdefault('PROFILE_DIR', os.environ.get('PROFILE_DIR', os.path.join(app.instance_path, 'profiles')))
+    app.config.setdefault('SAMPLING_PROFILER', os.environ.get('SAMPLING_PROFILER', 'off').lower() == 'on')
+    app.config.setdefault('SAMPLING_PROFILER_INTERVAL', float(os.environ.get('SAMPLING_PROFILER_INTERVAL', 0.02)))
+
+    sampler = None
+    if app.config['SAMPLING_PROFILER']:
+        sampler = StackSampler(app.config['SAMPLING_PROFILER_INTERVAL'], app.root_path)
+    app.extensions['stack_sampler'] = sampler
+
+    @app.before_request
+    def start_profiling():
+        if sampler is not None:
+            sampler.ensure_started()
+            sampler.active.add(threading.get_ident())
+        if profile_requested() and is_admin():
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def finish_profiling(response):
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            response.headers['X-Profile-Id'] = save_profile(profiler, app.config['PROFILE_DIR'], request.endpoint)
+        return response
+
+    @app.teardown_request
+    def stop_sampling(exc):
+        if sampler is not None:
+            sampler.active.discard(threading.get_ident())
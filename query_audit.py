@@ -0,0 +1,147 @@
+"""
+Per-request SQL auditing for development and tests.
+
+Every statement executed while handling a request is fingerprinted. When the
+same fingerprint runs QUERY_AUDIT_NPLUSONE_THRESHOLD times or more the
+request is flagged as an N+1 pattern and logged together with the template
+line (or Python frame) that triggered it. Views can declare a ceiling with
+@query_budget; with QUERY_BUDGET_STRICT enabled (the default under TESTING)
+going over budget raises QueryBudgetExceeded so the test client fails loudly.
+Auditing is on in development and whenever app.testing is set.
+"""
+
+import os
+import re
+import sys
+from collections import Counter
+from functools import wraps
+
+from flask import g, request, current_app, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|:\w+|\$\d+|\?")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+_THIS_FILE = os.path.abspath(__file__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a view executes more statements than its declared budget"""
+
+
+def fingerprint(statement):
+    """Normalise a SQL statement so repeated shapes compare equal"""
+    sql = _STRING.sub('?', statement)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('(?)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def query_budget(max_queries):
+    """Declare the maximum number of SQL statements a view may execute"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            return f(*args, **kwargs)
+        decorated_function.query_budget = max_queries
+        return decorated_function
+    return decorator
+
+
+def _origin(root_path):
+    """Return the template line or application frame that issued a statement"""
+    frame = sys._getframe(2)
+    fallback = None
+    while frame is not None:
+        template = frame.f_globals.get('__jinja_template__')
+        if template is not None:
+            lineno = template.get_corresponding_lineno(frame.f_lineno)
+            return f"{template.name or template.filename}:{lineno}"
+
+        filename = frame.f_code.co_filename
+        if not filename.startswith('<'):
+            filename = os.path.abspath(filename)
+        if (fallback is None and filename != _THIS_FILE
+                and filename.startswith(root_path) and 'site-packages' not in filename):
+            fallback = f"{os.path.relpath(filename, root_path)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return fallback or 'unknown'
+
+
+class QueryAudit:
+    """Statements seen while handling the current request"""
+
+    def __init__(self, threshold, root_path):
+        self.threshold = threshold
+        self.root_path = root_path
+        self.count = 0
+        self.fingerprints = Counter()
+        self.origins = {}
+
+    def record(self, statement):
+        self.count += 1
+        key = fingerprint(statement)
+        self.fingerprints[key] += 1
+        if self.fingerprints[key] == 2:
+            self.origins[key] = _origin(self.root_path)
+
+    def repeated(self):
+        """Fingerprints that crossed the N+1 threshold, most frequent first"""
+        return [
+            (key, count, self.origins.get(key, 'unknown'))
+            for key, count in self.fingerprints.most_common()
+            if count >= self.threshold
+        ]
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _audit_statement(conn, cursor, statement, parameters, context, executemany):
+    # Internal probes, such as replica lag checks, opt out with query_audit=False
+    if has_request_context() and 'query_audit' in g and conn.get_execution_options().get('query_audit', True):
+        g.query_audit.record(statement)
+
+
+def view_query_budget(endpoint):
+    """Return the budget declared on a view, if any"""
+    view = current_app.view_functions.get(endpoint)
+    return getattr(view, 'query_budget', None)
+
+
+def init_query_audit(app):
+    """Register the N+1 detector and query budget checks"""
+    app.config.setdefault('QUERY_AUDIT', os.environ.get('QUERY_AUDIT', str(app.config['ENV'] == 'development')).lower() == 'true')
+    app.config.setdefault('QUERY_AUDIT_NPLUSONE_THRESHOLD', int(os.environ.get('QUERY_AUDIT_NPLUSONE_THRESHOLD', 5)))
+    app.config.setdefault('QUERY_BUDGET_STRICT', None)
+
+    @app.before_request
+    def start_query_audit():
+        if app.config['QUERY_AUDIT'] or app.testing:
+            g.query_audit = QueryAudit(app.config['QUERY_AUDIT_NPLUSONE_THRESHOLD'], app.root_path)
+
+    @app.after_request
+    def check_query_audit(response):
+        audit = g.pop('query_audit', None)
+        if audit is None:
+            return response
+
+        for key, count, origin in audit.repeated():
+            app.logger.warning(
+                f"Possible N+1 in {request.endpoint}: {count}x from {origin}: {key[:200]}"
+            )
+
+        budget = view_query_budget(request.endpoint)
+        response.headers['X-Query-Count'] = str(audit.count)
+        if budget is not None:
+            response.headers['X-Query-Budget'] = str(budget)
+            if audit.count > budget:
+                message = f"{request.endpoint} executed {audit.count} queries, budget is {budget}"
+                strict = app.config['QUERY_BUDGET_STRICT']
+                if strict or (strict is None and app.testing):
+                    raise QueryBudgetExceeded(message)
+                app.logger.warning(message)
+        return response
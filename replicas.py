@@ -0,0 +1,159 @@
+"""
+Read replicas for reports, exports and counts.
+
+DATABASE_REPLICA_URLS is a comma-separated list of replica URLs. Each
+becomes a SQLAlchemy bind named replica_1, replica_2, ... and all of them
+share the primary's engine options. No model is bound to a replica, so
+create_all() and the schema upgrade only ever touch the primary.
+
+Reads are sent to a replica only inside ``with replica():`` or a view
+decorated with @use_replica. Everything else, and every statement on a
+session that has already flushed or executed a write, goes to the primary.
+A replica is used only while its replication lag, checked at most every
+DB_REPLICA_LAG_CHECK seconds per process, is below DB_REPLICA_MAX_LAG. It
+must also have replayed the logged in centre's last write: the probe's own
+time minus the lag it measured has to be at or after that write, and a
+probe taken before the write is repeated rather than trusted. A report
+opened right after a payment therefore never misses it. When no replica
+qualifies, the read falls back to the primary. The choice is made once and
+kept for the rest of the session, so one page never mixes two replicas.
+
+To try it locally, point DATABASE_REPLICA_URLS at a copy of the SQLite
+file, or at a Postgres standby. `flask db replicas` shows each replica's
+lag and whether it would be used.
+"""
+
+import os
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, has_request_context
+from flask_login import current_user
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+
+REPLICA_PREFIX = 'replica_'
+PROBE_OPTION = 'query_audit'
+
+# None outside replica(); otherwise the time the reader must see writes from
+_reading = ContextVar('replica_reading', default=None)
+_lag = {}
+
+POSTGRES_LAG = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+def replica_binds(urls):
+    """SQLALCHEMY_BINDS entries for a comma-separated list of replica URLs"""
+    urls = [url.strip() for url in (urls or '').split(',') if url.strip()]
+    return {f"{REPLICA_PREFIX}{number}": url for number, url in enumerate(urls, 1)}
+
+
+def measure_lag(engine):
+    """Seconds the replica is behind its primary; 0 where the database cannot tell"""
+    with engine.connect().execution_options(**{PROBE_OPTION: False, 'slow_query_log': False}) as connection:
+        if connection.dialect.name == 'postgresql':
+            return float(connection.execute(POSTGRES_LAG).scalar() or 0)
+    return 0.0
+
+
+def replica_lag(key, engine, max_age, fresh_since=True):
+    """(lag, wall-clock time of the probe) of one replica; lag is infinite while it cannot be reached
+
+    The cached probe is reused for ``max_age`` seconds, unless it was taken
+    before ``fresh_since`` and so cannot tell whether that write has arrived.
+    """
+    checked_at, probed_at, lag = _lag.get(key, (None, None, None))
+    now = time.monotonic()
+    if checked_at is None or now - checked_at > max_age or (fresh_since is not True and probed_at < fresh_since):
+        probed_at = datetime.utcnow()
+        try:
+            lag = measure_lag(engine)
+        except Exception as e:
+            current_app.logger.warning(f"Replica {key} unavailable: {e}")
+            lag = float('inf')
+        _lag[key] = (now, probed_at, lag)
+    return lag, probed_at
+
+
+def choose_replica(engines, fresh_since):
+    """A random replica that is fresh enough, or None to use the primary"""
+    config = current_app.config
+    candidates = []
+    for key, engine in engines.items():
+        if not key or not key.startswith(REPLICA_PREFIX):
+            continue
+        lag, probed_at = replica_lag(key, engine, config['DB_REPLICA_LAG_CHECK'], fresh_since)
+        if lag > config['DB_REPLICA_MAX_LAG']:
+            continue
+        # The replica has to have replayed the reader's own last write
+        if fresh_since is not True and probed_at - timedelta(seconds=lag) < fresh_since:
+            continue
+        candidates.append(engine)
+    return random.choice(candidates) if candidates else None
+
+
+class RoutingSession(Session):
+    """Session that sends reads inside replica() to a replica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        fresh_since = _reading.get()
+        if self._flushing or getattr(clause, 'is_dml', False):
+            # Once this session has written, it reads its own writes from the primary
+            self.info['wrote'] = True
+        elif bind is None and fresh_since is not None and not self.info.get('wrote'):
+            # Chosen once, so every read in this session sees the same snapshot
+            if 'replica_engine' not in self.info:
+                self.info['replica_engine'] = choose_replica(self._db.engines, fresh_since)
+            engine = self.info['replica_engine']
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@contextmanager
+def replica(fresh_since=True):
+    """Send reads in this block to a replica; ``fresh_since`` is the oldest data the reader accepts"""
+    token = _reading.set(fresh_since)
+    try:
+        yield
+    finally:
+        _reading.reset(token)
+
+
+def use_replica(f):
+    """Run a read-only view against a replica when one is fresh enough"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        fresh_since = True
+        if has_request_context() and current_user.is_authenticated and current_user.data_changed_at:
+            fresh_since = current_user.data_changed_at
+        with replica(fresh_since):
+            return f(*args, **kwargs)
+    return decorated_function
+
+
+def replica_status(app):
+    """(bind key, lag in seconds or error) for every configured replica"""
+    status = []
+    with app.app_context():
+        db = app.extensions['sqlalchemy']
+        for key, engine in db.engines.items():
+            if key and key.startswith(REPLICA_PREFIX):
+                try:
+                    status.append((key, measure_lag(engine)))
+                except Exception as e:
+                    status.append((key, str(e)))
+    return status
+
+
+def init_replicas(app):
+    """Read the lag limits for replica routing"""
+    app.config.setdefault('DB_REPLICA_MAX_LAG', float(os.environ.get('DB_REPLICA_MAX_LAG', 5)))
+    app.config.setdefault('DB_REPLICA_LAG_CHECK', float(os.environ.get('DB_REPLICA_LAG_CHECK', 5)))
@@ -1,13 +1,17 @@
+import math
 import os
+from collections import defaultdict
 from datetime import datetime, timedelta, date
-from flask import render_template, redirect, url_for, flash, request, send_file, jsonify, current_app
+from flask import render_template, redirect, url_for, flash, request, send_file, send_from_directory, jsonify, current_app, abort, Response
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import func, or_
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
 from app import db
-from models import Centre, Student, Enquiry, Course, Scheme, FeePayment, SubscriptionPayment, Batch
+from models import Centre, Student, Enquiry, Course, Scheme, FeePayment, SubscriptionPayment, Batch, SlowQuery
 from forms import (LoginForm, RegisterForm, StudentForm, EnquiryForm, CourseForm, 
-                  SchemeForm, FeePaymentForm, LogoUploadForm, BatchForm)
+                  SchemeForm, FeePaymentForm, BulkFeeCollectionForm, LogoUploadForm, BatchForm,
+                  StudentImportForm)
 from utils import (
     export_students_excel,
     export_students_pdf,
@@ -15,9 +19,23 @@ from utils import (
     export_enquiries_pdf,
     generate_invoice_pdf,
     generate_enrollment_number,
+    reserve_enrollment_numbers,
     calculate_net_fees
 )
-from middleware import subscription_required
+from importer import import_students, write_error_report, COLUMN_ALIASES
+from fee_collection import parse_enrollment_numbers, student_balances, record_payments
+from webhooks import verify_signature, enqueue
+from payments import PLANS, PLAN_TYPES_BY_ID, get_gateway
+from logos import submit_logo, logo_path
+from slow_queries import top_offenders
+from profiling import list_profiles
+from memory import rss_bytes
+from middleware import subscription_required, admin_required
+import fragment_cache
+from query_audit import query_budget
+from conditional import conditional
+from replicas import use_replica
+from fee_summaries import student_report, fee_report, batch_student_counts, filter_by_fee_status
 
 def register_routes(app):
     @app.route('/terms-of-service')
@@ -45,7 +63,7 @@ def register_routes(app):
         
         if request.method == 'POST':
             current_app.logger.info(f"Login attempt from {request.remote_addr}")
-            current_app.logger.debug(f"Form data: {request.form}")
+            current_app.logger.debug('Form data', extra={'form': request.form})
         
         if form.validate_on_submit():
             try:
@@ -151,43 +169,51 @@ def register_routes(app):
     @app.route('/dashboard')
     @login_required
     @subscription_required
+    @query_budget(10)
     def dashboard():
-        try:
-            total_students = Student.query.filter_by(centre_id=current_user.id).count()
-            total_enquiries = Enquiry.query.filter_by(centre_id=current_user.id, status='active').count()
-            
-            paid_students = Student.query.filter_by(centre_id=current_user.id).all()
-            total_fees_collected = sum(student.get_total_paid() for student in paid_students)
-            pending_fees = sum(student.get_balance_fees() for student in paid_students)
-            
-            fully_paid = sum(1 for student in paid_students if student.get_fee_status() == 'Paid')
-            partially_paid = sum(1 for student in paid_students if student.get_fee_status() == 'Partial')
-            unpaid = sum(1 for student in paid_students if student.get_fee_status() == 'Unpaid')
-            
-            recent_students = Student.query.filter_by(centre_id=current_user.id)\
+        centre_id = current_user.id
+        
+        # Queried from inside the template's cached blocks, so a cache hit skips them
+        def dashboard_stats():
+            paid_students = Student.query.filter_by(centre_id=centre_id)\
+                                         .options(*Student.loader_profile('fees')).all()
+            statuses = [student.get_fee_status() for student in paid_students]
+            return {
+                'total_students': len(paid_students),
+                'total_enquiries': Enquiry.query.filter_by(centre_id=centre_id, status='active').count(),
+                'total_fees_collected': sum(student.get_total_paid() for student in paid_students),
+                'pending_fees': sum(student.get_balance_fees() for student in paid_students),
+                'fully_paid': statuses.count('Paid'),
+                'partially_paid': statuses.count('Partial'),
+                'unpaid': statuses.count('Unpaid')
+            }
+        
+        def recent_activity():
+            recent_students = Student.query.filter_by(centre_id=centre_id)\
+                                        .options(*Student.loader_profile('list'))\
                                         .order_by(Student.created_at.desc()).limit(5).all()
             
-            recent_enquiries = Enquiry.query.filter_by(centre_id=current_user.id, status='active')\
+            recent_enquiries = Enquiry.query.filter_by(centre_id=centre_id, status='active')\
+                                          .options(*Enquiry.loader_profile('list'))\
                                           .order_by(Enquiry.created_at.desc()).limit(5).all()
-            
+            return {'recent_students': recent_students, 'recent_enquiries': recent_enquiries}
+        
+        try:
             return render_template('dashboard/index.html',
-                                 total_students=total_students,
-                                 total_enquiries=total_enquiries,
-                                 total_fees_collected=total_fees_collected,
-                                 pending_fees=pending_fees,
-                                 fully_paid=fully_paid,
-                                 partially_paid=partially_paid,
-                                 unpaid=unpaid,
-                                 recent_students=recent_students,
-                                 recent_enquiries=recent_enquiries)
+                                 dashboard_stats=dashboard_stats,
+                                 recent_activity=recent_activity)
         except Exception as e:
             current_app.logger.error(f"Dashboard error: {e}")
             flash('Error loading dashboard data', 'error')
-            return render_template('dashboard/index.html', stats={})
+            fragment_cache.bypass()
+            return render_template('dashboard/index.html',
+                                 dashboard_stats=lambda: defaultdict(int),
+                                 recent_activity=lambda: {})
     
     @app.route('/batches')
     @login_required
     @subscription_required
+    @conditional
     def batches_list():
         batches = Batch.query.filter_by(centre_id=current_user.id).order_by(Batch.start_time).all()
         return render_template('batches/list.html', batches=batches)
@@ -200,7 +226,7 @@ def register_routes(app):
         
         if request.method == 'POST':
             current_app.logger.info(f"Batch add attempt from {request.remote_addr}")
-            current_app.logger.debug(f"Form data: {request.form}")
+            current_app.logger.debug('Form data', extra={'form': request.form})
         
         if form.validate_on_submit():
             try:
@@ -244,7 +270,7 @@ def register_routes(app):
         
         if request.method == 'POST':
             current_app.logger.info(f"Batch edit attempt for batch {id} from {request.remote_addr}")
-            current_app.logger.debug(f"Form data: {request.form}")
+            current_app.logger.debug('Form data', extra={'form': request.form})
         
         if form.validate_on_submit():
             try:
@@ -302,19 +328,14 @@ def register_routes(app):
         
         if request.method == 'POST':
             current_app.logger.info(f"Student add attempt from {request.remote_addr}")
-            current_app.logger.debug(f"Form data: {request.form}")
+            current_app.logger.debug('Form data', extra={'form': request.form})
         
         if form.validate_on_submit():
-            enrollment_number = form.enrollment_number.data or generate_enrollment_number()
-            
-            existing_student = Student.query.filter_by(
-                centre_id=current_user.id, 
-                enrollment_number=enrollment_number
-            ).first()
-            
-            if existing_student:
-                flash('Enrollment number already exists', 'error')
-                return render_template('students/add.html', form=form, batches=batches)
+            if form.enrollment_number.data:
+                enrollment_number = form.enrollment_number.data
+                reserve_enrollment_numbers(current_user.id, [enrollment_number])
+            else:
+                enrollment_number = generate_enrollment_number(current_user.id)
             
             net_fees = calculate_net_fees(form.total_fees.data, form.concession.data)
             
@@ -344,7 +365,12 @@ def register_routes(app):
             )
             
             db.session.add(student)
-            db.session.flush()
+            try:
+                db.session.flush()
+            except IntegrityError:
+                db.session.rollback()
+                flash('Enrollment number already exists', 'error')
+                return render_template('students/add.html', form=form, batches=batches)
             
             if form.initial_payment_amount.data and float(form.initial_payment_amount.data) > 0:
                 payment = FeePayment(
@@ -365,16 +391,59 @@ def register_routes(app):
         
         return render_template('students/add.html', form=form, batches=batches)
         
+    @app.route('/students/import', methods=['GET', 'POST'])
+    @login_required
+    @subscription_required
+    def students_import():
+        form = StudentImportForm()
+        
+        if request.method == 'POST':
+            current_app.logger.info(f"Student import attempt from {request.remote_addr}")
+        
+        result = None
+        if form.validate_on_submit():
+            try:
+                result = import_students(form.file.data, current_user.id)
+            except Exception as e:
+                current_app.logger.error(f"Student import failed: {e}", exc_info=True)
+                flash('Import failed. Please check the file and try again.', 'error')
+                return render_template('students/import.html', form=form, columns=COLUMN_ALIASES)
+            
+            if result.errors:
+                write_error_report(result, os.path.join(current_app.config['UPLOAD_FOLDER'], 'import_reports'),
+                                   current_user.id)
+            current_app.logger.info(f"Imported {result.imported} of {result.total_rows} students for centre {current_user.id}")
+            flash(f'Imported {result.imported} of {result.total_rows} students',
+                  'success' if not result.errors else 'warning')
+        
+        return render_template('students/import.html', form=form, result=result, columns=COLUMN_ALIASES)
+    
+    @app.route('/students/import/report/<token>')
+    @login_required
+    @subscription_required
+    def students_import_report(token):
+        if not token.isalnum():
+            abort(404)
+        folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'import_reports')
+        path = os.path.join(folder, f"{current_user.id}_{token}.csv")
+        if not os.path.exists(path):
+            abort(404)
+        return send_file(path, as_attachment=True, download_name='student_import_errors.csv',
+                         mimetype='text/csv')
+    
     @app.route('/students')
     @login_required
     @subscription_required
+    @conditional
+    @query_budget(6)
     def students_list():
         page = request.args.get('page', 1, type=int)
         fee_status = request.args.get('fee_status', 'all')
         search = request.args.get('search', '')
         batch_id = request.args.get('batch_id', None, type=int)
         
-        query = Student.query.filter_by(centre_id=current_user.id)
+        query = Student.query.filter_by(centre_id=current_user.id)\
+                             .options(*Student.loader_profile('list'))
         
         if batch_id:
             query = query.filter_by(batch_id=batch_id)
@@ -454,7 +523,7 @@ def register_routes(app):
         
         if request.method == 'POST':
             current_app.logger.info(f"Student edit attempt for student {id} from {request.remote_addr}")
-            current_app.logger.debug(f"Form data: {request.form}")
+            current_app.logger.debug('Form data', extra={'form': request.form})
         
         if form.validate_on_submit():
             existing_student = Student.query.filter(
@@ -469,6 +538,8 @@ def register_routes(app):
             
             net_fees = calculate_net_fees(form.total_fees.data, form.concession.data)
             
+            if form.enrollment_number.data != student.enrollment_number:
+                reserve_enrollment_numbers(current_user.id, [form.enrollment_number.data])
             student.enrollment_number = form.enrollment_number.data
             student.name = form.name.data.upper()
             student.father_name = form.father_name.data.upper() if form.father_name.data else None
@@ -522,10 +593,11 @@ def register_routes(app):
     @app.route('/students/<int:id>')
     @login_required
     @subscription_required
+    @query_budget(4)
     def students_view(id):
-        student = Student.query.filter_by(id=id, centre_id=current_user.id).first_or_404()
-        fee_payments = FeePayment.query.filter_by(student_id=student.id)\
-                                     .order_by(FeePayment.payment_date.desc()).all()
+        student = Student.query.filter_by(id=id, centre_id=current_user.id)\
+                               .options(*Student.loader_profile('detail')).first_or_404()
+        fee_payments = sorted(student.fee_payments, key=lambda p: p.payment_date, reverse=True)
         return render_template('students/view.html', student=student, fee_payments=fee_payments)
     
     @app.route('/students/<int:id>/delete', methods=['POST'])
@@ -547,7 +619,7 @@ def register_routes(app):
         
         if request.method == 'POST':
             current_app.logger.info(f"Fee payment attempt for student {id} from {request.remote_addr}")
-            current_app.logger.debug(f"Form data: {request.form}")
+            current_app.logger.debug('Form data', extra={'form': request.form})
         
         if form.validate_on_submit():
             balance = student.get_balance_fees()
@@ -573,15 +645,76 @@ def register_routes(app):
         
         return render_template('fees/payment.html', form=form, student=student)
     
+    @app.route('/fees/collect', methods=['GET', 'POST'])
+    @login_required
+    @subscription_required
+    @query_budget(12)
+    def fees_collect():
+        form = BulkFeeCollectionForm()
+        batches = Batch.query.filter_by(centre_id=current_user.id, is_active=True).order_by(Batch.start_time).all()
+        batch_id = request.values.get('batch_id', None, type=int)
+        enrollment_text = request.values.get('enrollment_numbers', '')
+        enrollment_numbers = parse_enrollment_numbers(enrollment_text)
+        
+        if request.method == 'POST':
+            current_app.logger.info(f"Bulk fee collection attempt from {request.remote_addr}")
+        
+        errors = {}
+        if form.validate_on_submit():
+            entries = {}
+            for key, value in request.form.items():
+                prefix, _, student_id = key.partition('-')
+                if prefix != 'amount' or not student_id.isdigit() or not value.strip():
+                    continue
+                student_id = int(student_id)
+                try:
+                    amount = float(value)
+                except ValueError:
+                    amount = None
+                # float() also accepts 'nan' and 'inf', which would corrupt every balance
+                if amount is None or not math.isfinite(amount):
+                    errors[student_id] = 'Not a valid amount'
+                    continue
+                receipt_number = request.form.get(f'receipt-{student_id}', '').strip()[:50]
+                entries[student_id] = (amount, receipt_number)
+            
+            if not entries and not errors:
+                flash('Enter an amount for at least one student', 'error')
+            elif not errors:
+                recorded, errors = record_payments(current_user.id, entries, form.payment_date.data,
+                                                   form.payment_method.data, form.notes.data)
+                if recorded:
+                    current_app.logger.info(f"Recorded {recorded} fee payments for centre {current_user.id}")
+                    flash(f'{recorded} fee payments recorded successfully', 'success')
+                    return redirect(url_for('fees_collect', batch_id=batch_id,
+                                            enrollment_numbers=enrollment_text or None))
+            if errors:
+                flash('No payments were recorded. Please correct the highlighted amounts.', 'error')
+        
+        students = []
+        missing = []
+        if batch_id or enrollment_numbers:
+            students = student_balances(current_user.id, batch_id=batch_id,
+                                        enrollment_numbers=enrollment_numbers or None)
+            found = {student.enrollment_number for student in students}
+            missing = [number for number in enrollment_numbers if number not in found]
+        
+        return render_template('fees/collect.html', form=form, batches=batches, students=students,
+                             batch_id=batch_id, enrollment_text=enrollment_text,
+                             missing=missing, errors=errors)
+    
     @app.route('/enquiries')
     @login_required
     @subscription_required
+    @conditional
+    @query_budget(4)
     def enquiries_list():
         page = request.args.get('page', 1, type=int)
         status = request.args.get('status', 'active')
         search = request.args.get('search', '')
         
-        query = Enquiry.query.filter_by(centre_id=current_user.id, status=status)
+        query = Enquiry.query.filter_by(centre_id=current_user.id, status=status)\
+                             .options(*Enquiry.loader_profile('list'))
         
         if search:
             query = query.filter(or_(
@@ -607,7 +740,7 @@ def register_routes(app):
         
         if request.method == 'POST':
             current_app.logger.info(f"Enquiry add attempt from {request.remote_addr}")
-            current_app.logger.debug(f"Form data: {request.form}")
+            current_app.logger.debug('Form data', extra={'form': request.form})
         
         if form.validate_on_submit():
             enquiry = Enquiry(
@@ -651,7 +784,7 @@ def register_routes(app):
         
         if request.method == 'POST':
             current_app.logger.info(f"Enquiry edit attempt for enquiry {id} from {request.remote_addr}")
-            current_app.logger.debug(f"Form data: {request.form}")
+            current_app.logger.debug('Form data', extra={'form': request.form})
         
         if form.validate_on_submit():
             enquiry.name = form.name.data.upper()
@@ -682,7 +815,7 @@ def register_routes(app):
         enquiry = Enquiry.query.filter_by(id=id, centre_id=current_user.id).first_or_404()
         
         student = Student(
-            enrollment_number=generate_enrollment_number(),
+            enrollment_number=generate_enrollment_number(current_user.id),
             name=enquiry.name,
             father_name=enquiry.father_name,
             sex=enquiry.sex,
@@ -702,7 +835,12 @@ def register_routes(app):
         enquiry.status = 'converted'
         
         db.session.add(student)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            flash('Could not allocate an enrollment number, please try again', 'error')
+            return redirect(url_for('enquiries_list'))
         
         flash('Enquiry converted to student successfully', 'success')
         return redirect(url_for('students_edit', id=student.id))
@@ -720,6 +858,7 @@ def register_routes(app):
     @app.route('/courses')
     @login_required
     @subscription_required
+    @conditional
     def courses_list():
         courses = Course.query.filter_by(centre_id=current_user.id).all()
         return render_template('courses/list.html', courses=courses)
@@ -732,7 +871,7 @@ def register_routes(app):
         
         if request.method == 'POST':
             current_app.logger.info(f"Course add attempt from {request.remote_addr}")
-            current_app.logger.debug(f"Form data: {request.form}")
+            current_app.logger.debug('Form data', extra={'form': request.form})
         
         if form.validate_on_submit():
             course = Course(
@@ -760,7 +899,7 @@ def register_routes(app):
         
         if request.method == 'POST':
             current_app.logger.info(f"Course edit attempt for course {id} from {request.remote_addr}")
-            current_app.logger.debug(f"Form data: {request.form}")
+            current_app.logger.debug('Form data', extra={'form': request.form})
         
         if form.validate_on_submit():
             course.name = form.name.data.upper()
@@ -792,6 +931,7 @@ def register_routes(app):
     @app.route('/schemes')
     @login_required
     @subscription_required
+    @conditional
     def schemes_list():
         schemes = Scheme.query.filter_by(centre_id=current_user.id).all()
         return render_template('schemes/list.html', schemes=schemes)
@@ -804,7 +944,7 @@ def register_routes(app):
         
         if request.method == 'POST':
             current_app.logger.info(f"Scheme add attempt from {request.remote_addr}")
-            current_app.logger.debug(f"Form data: {request.form}")
+            current_app.logger.debug('Form data', extra={'form': request.form})
         
         if form.validate_on_submit():
             scheme = Scheme(
@@ -831,7 +971,7 @@ def register_routes(app):
         
         if request.method == 'POST':
             current_app.logger.info(f"Scheme edit attempt for scheme {id} from {request.remote_addr}")
-            current_app.logger.debug(f"Form data: {request.form}")
+            current_app.logger.debug('Form data', extra={'form': request.form})
         
         if form.validate_on_submit():
             scheme.name = form.name.data.upper()
@@ -873,23 +1013,14 @@ def register_routes(app):
         
         if request.method == 'POST':
             current_app.logger.info(f"Logo upload attempt from {request.remote_addr}")
-            current_app.logger.debug(f"Form data: {request.form}")
+            current_app.logger.debug('Form data', extra={'form': request.form})
         
         if form.validate_on_submit():
             if form.logo.data:
-                logo_file = form.logo.data
-                filename = f"logo_{current_user.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{logo_file.filename.split('.')[-1]}"
-                
-                upload_dir = os.path.join(current_app.root_path, 'static', 'uploads')
-                os.makedirs(upload_dir, exist_ok=True)
+                # Resized variants are rendered in the background
+                submit_logo(current_app._get_current_object(), current_user.id, form.logo.data)
                 
-                logo_path = os.path.join(upload_dir, filename)
-                logo_file.save(logo_path)
-                
-                current_user.logo_filename = filename
-                db.session.commit()
-                
-                flash('Logo updated successfully', 'success')
+                flash('Logo uploaded successfully. It will appear in a few seconds.', 'success')
                 return redirect(url_for('settings_logo'))
         
         return render_template('settings/logo.html', form=form)
@@ -903,7 +1034,7 @@ def register_routes(app):
         
         if request.method == 'POST':
             current_app.logger.info(f"Profile update attempt from {request.remote_addr}")
-            current_app.logger.debug(f"Form data: {request.form}")
+            current_app.logger.debug('Form data', extra={'form': request.form})
         
         if form.validate_on_submit():
             current_user.name = form.name.data
@@ -949,83 +1080,41 @@ def register_routes(app):
     @app.route('/reports')
     @login_required
     @subscription_required
+    @query_budget(2)
     def reports_index():
         return render_template('reports/index.html')
 
     @app.route('/reports/students')
     @login_required
     @subscription_required
+    @use_replica
+    @conditional
+    @query_budget(4)
     def reports_students():
-        total_students = Student.query.filter_by(centre_id=current_user.id).count()
-        
-        students = Student.query.filter_by(centre_id=current_user.id).all()
-        fully_paid = sum(1 for student in students if student.get_fee_status() == 'Paid')
-        partially_paid = sum(1 for student in students if student.get_fee_status() == 'Partial')
-        unpaid = sum(1 for student in students if student.get_fee_status() == 'Unpaid')
-        
-        try:
-            course_stats = db.session.query(
-                Course.name,
-                func.count(Student.id).label('student_count')
-            ).join(Student).filter(
-                Course.centre_id == current_user.id
-            ).group_by(Course.name).all()
-        except:
-            course_stats = []
-        
-        return render_template('reports/students.html',
-                             total_students=total_students,
-                             fully_paid=fully_paid,
-                             partially_paid=partially_paid,
-                             unpaid=unpaid,
-                             course_stats=course_stats)
+        return render_template('reports/students.html', **student_report(current_user.id))
 
     @app.route('/reports/fees')
     @login_required
     @subscription_required
+    @use_replica
+    @conditional
+    @query_budget(4)
     def reports_fees():
-        students = Student.query.filter_by(centre_id=current_user.id).all()
-        total_fees = sum(student.net_fees or 0 for student in students)
-        collected_fees = sum(student.get_total_paid() for student in students)
-        pending_fees = sum(student.get_balance_fees() for student in students)
-        
-        monthly_collections = []
-        for i in range(12):
-            month_start = (datetime.now().replace(day=1) - timedelta(days=30*i)).replace(day=1)
-            try:
-                month_end = (month_start.replace(month=month_start.month+1) if month_start.month < 12 
-                            else month_start.replace(year=month_start.year+1, month=1)) - timedelta(days=1)
-            except:
-                month_end = month_start.replace(day=28)
-            
-            month_payments = FeePayment.query.filter(
-                FeePayment.centre_id == current_user.id,
-                FeePayment.payment_date >= month_start.date(),
-                FeePayment.payment_date <= month_end.date()
-            ).all()
-            
-            monthly_collections.append({
-                'month': month_start.strftime('%b %Y'),
-                'amount': sum(p.amount for p in month_payments)
-            })
-        
-        monthly_collections.reverse()
-        
-        return render_template('reports/fees.html',
-                             total_fees=total_fees,
-                             collected_fees=collected_fees,
-                             pending_fees=pending_fees,
-                             monthly_collections=monthly_collections)
+        return render_template('reports/fees.html', **fee_report(current_user.id))
 
     @app.route('/reports/batches')
     @login_required
     @subscription_required
+    @use_replica
+    @conditional
+    @query_budget(4)
     def reports_batches():
         batches = Batch.query.filter_by(centre_id=current_user.id).all()
+        student_counts = batch_student_counts(current_user.id)
         batch_stats = []
         
         for batch in batches:
-            student_count = Student.query.filter_by(batch_id=batch.id).count()
+            student_count = student_counts.get(batch.id, 0)
             batch_stats.append({
                 'name': batch.name,
                 'time': f"{batch.start_time.strftime('%I:%M %p')} - {batch.end_time.strftime('%I:%M %p')}",
@@ -1038,6 +1127,9 @@ def register_routes(app):
     @app.route('/reports/enquiries')
     @login_required
     @subscription_required
+    @use_replica
+    @conditional
+    @query_budget(5)
     def reports_enquiries():
         total_enquiries = Enquiry.query.filter_by(centre_id=current_user.id).count()
         active_enquiries = Enquiry.query.filter_by(centre_id=current_user.id, status='active').count()
@@ -1051,6 +1143,8 @@ def register_routes(app):
     @app.route('/api/students/count')
     @login_required
     @subscription_required
+    @use_replica
+    @query_budget(3)
     def api_students_count():
         count = Student.query.filter_by(centre_id=current_user.id).count()
         return jsonify({'count': count})
@@ -1058,6 +1152,8 @@ def register_routes(app):
     @app.route('/api/enquiries/count')
     @login_required
     @subscription_required
+    @use_replica
+    @query_budget(3)
     def api_enquiries_count():
         count = Enquiry.query.filter_by(centre_id=current_user.id, status='active').count()
         return jsonify({'count': count})
@@ -1065,6 +1161,8 @@ def register_routes(app):
     @app.route('/api/batches/count')
     @login_required
     @subscription_required
+    @use_replica
+    @query_budget(3)
     def api_batches_count():
         count = Batch.query.filter_by(centre_id=current_user.id).count()
         return jsonify({'count': count})
@@ -1093,37 +1191,30 @@ def register_routes(app):
     @app.route('/export/options')
     @login_required
     @subscription_required
+    @query_budget(2)
     def export_options():
         return render_template('exports/options.html')
 
     @app.route('/export/excel', methods=['POST'])
     @login_required
     @subscription_required
+    @use_replica
+    @query_budget(4)
     def export_excel():
         export_type = request.form.get('export_type', 'students')
         
         if request.method == 'POST':
             current_app.logger.info(f"Excel export attempt from {request.remote_addr}")
-            current_app.logger.debug(f"Form data: {request.form}")
+            current_app.logger.debug('Form data', extra={'form': request.form})
         
         if export_type == 'students':
             fee_status = request.form.get('fee_status', 'all')
             fields = request.form.getlist('student_fields')
             
-            query = Student.query.filter_by(centre_id=current_user.id)
+            query = Student.query.filter_by(centre_id=current_user.id)\
+                                 .options(*Student.loader_profile('export'))
             
-            if fee_status != 'all':
-                students_temp = query.all()
-                students = []
-                for student in students_temp:
-                    if fee_status == 'paid' and student.get_fee_status() == 'Paid':
-                        students.append(student)
-                    elif fee_status == 'partial' and student.get_fee_status() == 'Partial':
-                        students.append(student)
-                    elif fee_status == 'unpaid' and student.get_fee_status() == 'Unpaid':
-                        students.append(student)
-            else:
-                students = query.all()
+            students = filter_by_fee_status(query, fee_status).all()
             
             output = export_students_excel(students, fields)
             filename = f'students_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
@@ -1132,7 +1223,8 @@ def register_routes(app):
             status = request.form.get('enquiry_status', 'all')
             fields = request.form.getlist('enquiry_fields')
             
-            query = Enquiry.query.filter_by(centre_id=current_user.id)
+            query = Enquiry.query.filter_by(centre_id=current_user.id)\
+                                 .options(*Enquiry.loader_profile('export'))
             if status != 'all':
                 query = query.filter_by(status=status)
                 
@@ -1150,45 +1242,40 @@ def register_routes(app):
     @app.route('/export/pdf', methods=['POST'])
     @login_required
     @subscription_required
+    @use_replica
+    @query_budget(4)
     def export_pdf():
         export_type = request.form.get('export_type', 'students')
         
         if request.method == 'POST':
             current_app.logger.info(f"PDF export attempt from {request.remote_addr}")
-            current_app.logger.debug(f"Form data: {request.form}")
+            current_app.logger.debug('Form data', extra={'form': request.form})
         
         if export_type == 'students':
             fee_status = request.form.get('fee_status', 'all')
             fields = request.form.getlist('student_fields')
             
-            query = Student.query.filter_by(centre_id=current_user.id)
+            query = Student.query.filter_by(centre_id=current_user.id)\
+                                 .options(*Student.loader_profile('export'))
             
-            if fee_status != 'all':
-                students_temp = query.all()
-                students = []
-                for student in students_temp:
-                    if fee_status == 'paid' and student.get_fee_status() == 'Paid':
-                        students.append(student)
-                    elif fee_status == 'partial' and student.get_fee_status() == 'Partial':
-                        students.append(student)
-                    elif fee_status == 'unpaid' and student.get_fee_status() == 'Unpaid':
-                        students.append(student)
-            else:
-                students = query.all()
+            students = filter_by_fee_status(query, fee_status).all()
             
-            output = export_students_pdf(students, fields, current_user.name)
+            output = export_students_pdf(students, fields, current_user.name,
+                                         logo_path(current_app, current_user))
             filename = f'students_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
             
         else:
             status = request.form.get('enquiry_status', 'all')
             fields = request.form.getlist('enquiry_fields')
             
-            query = Enquiry.query.filter_by(centre_id=current_user.id)
+            query = Enquiry.query.filter_by(centre_id=current_user.id)\
+                                 .options(*Enquiry.loader_profile('export'))
             if status != 'all':
                 query = query.filter_by(status=status)
                 
             enquiries = query.all()
-            output = export_enquiries_pdf(enquiries, fields, current_user.name)
+            output = export_enquiries_pdf(enquiries, fields, current_user.name,
+                                          logo_path(current_app, current_user))
             filename = f'enquiries_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
         
         return send_file(
@@ -1206,58 +1293,27 @@ def register_routes(app):
     @app.route('/subscription/payment')
     @login_required
     def subscription_payment():
-        import razorpay
-        
         plan = request.args.get('plan', 'monthly')
         
         try:
-            # Always use live keys in production
-            razorpay_key = os.environ.get('RAZORPAY_KEY_ID')
-            razorpay_secret = os.environ.get('RAZORPAY_KEY_SECRET')
-            client = razorpay.Client(auth=(razorpay_key, razorpay_secret))
-            
-            plans = {
-                'monthly': {
-                    'id': 'plan_QiyHYDfCNwOii0',
-                    'amount': 69900,
-                    'duration': 'Monthly',
-                    'name': 'Monthly Plan',
-                    'display_name': 'Monthly Plan',
-                    'amount_display': '699.00'
-                },
-                'yearly': {
-                    'id': 'plan_QiyHxYGHqd3KLz',
-                    'amount': 699900,
-                    'duration': 'Yearly',
-                    'name': 'Yearly Plan',
-                    'display_name': 'Yearly Plan',
-                    'amount_display': '6,999.00'
-                }
-            }
-            
-            if plan not in plans:
+            if plan not in PLANS:
                 flash('Invalid subscription plan selected', 'error')
                 return redirect(url_for('subscription_plans'))
             
-            subscription = client.subscription.create({
-                'plan_id': plans[plan]['id'],
-                'customer_notify': 1,
-                'quantity': 1,
-                'total_count': 12 if plan == 'monthly' else 1,
-                'notes': {
-                    'centre_id': current_user.id,
-                    'centre_name': current_user.name,
-                    'plan_type': plan,
-                    'plan_duration': plans[plan]['duration']
-                }
+            gateway = get_gateway()
+            subscription = gateway.create_subscription(plan, {
+                'centre_id': current_user.id,
+                'centre_name': current_user.name,
+                'plan_type': plan,
+                'plan_duration': PLANS[plan]['duration']
             })
 
             current_app.logger.info(f"Created subscription {subscription['id']} for user {current_user.id}")
             return render_template('subscription/payment.html',
                                 subscription=subscription,
-                                plan=plans[plan],
+                                plan=PLANS[plan],
                                 plan_type=plan,
-                                razorpay_key=razorpay_key,
+                                razorpay_key=gateway.key_id,
                                 current_user=current_user)
             
         except Exception as e:
@@ -1268,159 +1324,22 @@ def register_routes(app):
 
     @app.route('/subscription/webhook', methods=['POST'])
     def handle_webhook():
-        import razorpay
-        current_app.logger.info("Webhook received")
-        
         # Verify Razorpay signature
-        webhook_secret = os.getenv('RAZORPAY_WEBHOOK_SECRET')
-        received_sign = request.headers.get('X-Razorpay-Signature')
+        if not verify_signature(request.get_data(), request.headers.get('X-Razorpay-Signature'),
+                                os.getenv('RAZORPAY_WEBHOOK_SECRET')):
+            current_app.logger.warning(f"Webhook with invalid signature from {request.remote_addr}")
+            return jsonify({"status": "error", "message": "Invalid signature"}), 400
         
+        # Store the event and acknowledge; the webhook worker applies it
         try:
-            client = razorpay.Client(auth=(os.getenv('RAZORPAY_KEY_ID'), os.getenv('RAZORPAY_KEY_SECRET')))
-            client.utility.verify_webhook_signature(
-                request.data.decode('utf-8'),
-                received_sign,
-                webhook_secret
-            )
-            
-            payload = request.get_json()
-            event = payload['event']
-            current_app.logger.info(f"Processing webhook event: {event}")
-            
-            # Handle different subscription events
-            if event in ['subscription.activated', 'subscription.charged', 'payment.captured']:
-                subscription_data = payload['payload']['subscription']['entity'] if 'subscription' in payload['payload'] else None
-                payment_data = payload['payload']['payment']['entity'] if 'payment' in payload['payload'] else None
-                
-                if not subscription_data and payment_data:
-                    # Handle direct payments (non-subscription)
-                    current_app.logger.info("Processing direct payment")
-                    notes = payment_data.get('notes', {})
-                    centre_id = notes.get('centre_id')
-                    plan_type = notes.get('plan_type', 'monthly')
-                    
-                    if not centre_id:
-                        current_app.logger.error("No centre_id found in payment notes")
-                        return jsonify({"status": "error", "message": "Missing centre_id"}), 400
-                    
-                    # Update centre subscription
-                    centre = Centre.query.get(centre_id)
-                    if not centre:
-                        current_app.logger.error(f"Centre not found: {centre_id}")
-                        return jsonify({"status": "error", "message": "Centre not found"}), 404
-                    
-                    if plan_type == 'yearly':
-                        centre.subscription_type = 'yearly'
-                        centre.subscription_end_date = datetime.utcnow() + timedelta(days=365)
-                    else:
-                        centre.subscription_type = 'monthly'
-                        centre.subscription_end_date = datetime.utcnow() + timedelta(days=30)
-                    
-                    # Create payment record
-                    payment = SubscriptionPayment(
-                        amount=payment_data['amount'] / 100,
-                        payment_id=payment_data['id'],
-                        subscription_id=None,
-                        plan_type=plan_type,
-                        centre_id=centre_id,
-                        status='completed',
-                        notes=f"Direct payment via webhook: {event}"
-                    )
-                    db.session.add(payment)
-                    db.session.commit()
-                    current_app.logger.info(f"Processed direct payment {payment_data['id']}")
-                    return jsonify({"status": "success"}), 200
-                
-                if not subscription_data:
-                    current_app.logger.error("No subscription data in webhook payload")
-                    return jsonify({"status": "error", "message": "Missing subscription data"}), 400
-                
-                # Extract relevant data
-                subscription_id = subscription_data['id']
-                plan_id = subscription_data['plan_id']
-                notes = subscription_data.get('notes', {})
-                centre_id = notes.get('centre_id')
-                
-                if not centre_id:
-                    current_app.logger.error("No centre_id found in subscription notes")
-                    return jsonify({"status": "error", "message": "Missing centre_id"}), 400
-                
-                # Find or create subscription record
-                subscription = SubscriptionPayment.query.filter_by(
-                    subscription_id=subscription_id
-                ).first()
-                
-                if not subscription:
-                    # New subscription
-                    centre = Centre.query.get(centre_id)
-                    if not centre:
-                        current_app.logger.error(f"Centre not found: {centre_id}")
-                        return jsonify({"status": "error", "message": "Centre not found"}), 404
-                    
-                    # Determine plan type
-                    if plan_id == 'plan_QiyHxYGHqd3KLz':  # Yearly plan
-                        plan_type = 'yearly'
-                        amount = 6999.00
-                        end_date = datetime.utcnow() + timedelta(days=365)
-                    else:  # Default to monthly
-                        plan_type = 'monthly'
-                        amount = 699.00
-                        end_date = datetime.utcnow() + timedelta(days=30)
-                    
-                    # Update centre subscription
-                    centre.subscription_type = plan_type
-                    centre.subscription_end_date = end_date
-                    
-                    # Create subscription record
-                    subscription = SubscriptionPayment(
-                        amount=amount,
-                        payment_id=payment_data['id'] if payment_data else None,
-                        subscription_id=subscription_id,
-                        plan_type=plan_type,
-                        centre_id=centre_id,
-                        status='active' if event == 'subscription.activated' else 'completed',
-                        notes=f"Webhook: {event}"
-                    )
-                    db.session.add(subscription)
-                    
-                elif payment_data and not SubscriptionPayment.query.filter_by(payment_id=payment_data['id']).first():
-                    # Additional payment for existing subscription
-                    payment = SubscriptionPayment(
-                        amount=payment_data['amount'] / 100,
-                        payment_id=payment_data['id'],
-                        subscription_id=subscription_id,
-                        plan_type=subscription.plan_type,
-                        centre_id=centre_id,
-                        status='completed',
-                        notes=f"Recurring payment via webhook"
-                    )
-                    db.session.add(payment)
-                    
-                    # Update subscription end date
-                    centre = Centre.query.get(centre_id)
-                    if subscription.plan_type == 'yearly':
-                        centre.subscription_end_date = datetime.utcnow() + timedelta(days=365)
-                    else:
-                        centre.subscription_end_date = datetime.utcnow() + timedelta(days=30)
-                
-                db.session.commit()
-                current_app.logger.info(f"Processed {event} for subscription {subscription_id}")
-                
-            elif event == 'subscription.cancelled':
-                subscription_data = payload['payload']['subscription']['entity']
-                subscription_id = subscription_data['id']
-                
-                # Update subscription status
-                subscription = SubscriptionPayment.query.filter_by(subscription_id=subscription_id).first()
-                if subscription:
-                    subscription.status = 'cancelled'
-                    db.session.commit()
-                    current_app.logger.info(f"Marked subscription {subscription_id} as cancelled")
-            
+            event_id = request.headers.get('X-Razorpay-Event-Id')
+            if not enqueue(request.get_data(), event_id):
+                current_app.logger.info(f"Duplicate webhook event {event_id} ignored")
             return jsonify({"status": "success"}), 200
         
         except Exception as e:
-            current_app.logger.error(f"Webhook processing failed: {str(e)}", exc_info=True)
+            db.session.rollback()
+            current_app.logger.error(f"Webhook enqueue failed: {str(e)}", exc_info=True)
             return jsonify({"status": "error", "message": str(e)}), 400
         
 
@@ -1429,41 +1348,46 @@ def register_routes(app):
     def subscription_success():
         payment_id = request.args.get('razorpay_payment_id')
         subscription_id = request.args.get('razorpay_subscription_id')
-        plan = request.args.get('plan', 'monthly')
-        
+        signature = request.args.get('razorpay_signature')
+        gateway = get_gateway()
+
+        # Nothing in the query string is trusted until Checkout's signature matches
+        if not gateway.verify_checkout(payment_id, subscription_id, signature):
+            current_app.logger.warning(f"Unverified subscription callback for centre {current_user.id}")
+            flash('We could not verify this payment. If you were charged, your plan will be activated shortly.', 'error')
+            return redirect(url_for('subscription_plans'))
+
         try:
-            if payment_id and subscription_id:
-                if plan == 'yearly':
-                    current_user.subscription_type = 'yearly'
-                    current_user.subscription_end_date = datetime.utcnow() + timedelta(days=365)
-                    amount = 6999.00
-                else:
-                    current_user.subscription_type = 'monthly'
-                    current_user.subscription_end_date = datetime.utcnow() + timedelta(days=30)
-                    amount = 699.00
-                
-                # Check if this payment already exists
-                existing_payment = SubscriptionPayment.query.filter_by(payment_id=payment_id).first()
-                if not existing_payment:
-                    payment = SubscriptionPayment(
-                        amount=amount,
-                        payment_id=payment_id,
-                        subscription_id=subscription_id,
-                        plan_type=plan,
-                        centre_id=current_user.id,
-                        status='completed',
-                        notes='Payment successful via checkout'
-                    )
-                    db.session.add(payment)
-                    db.session.commit()
-                    current_app.logger.info(f"Created payment record for {current_user.id}")
-                
-                flash('Subscription activated successfully!', 'success')
-                return render_template('subscription/success.html')
-            else:
-                flash('Payment information missing', 'error')
+            subscription = gateway.fetch_subscription(subscription_id)
+            plan = PLAN_TYPES_BY_ID.get(subscription.get('plan_id'))
+            if plan is None or str(subscription.get('notes', {}).get('centre_id')) != str(current_user.id):
+                current_app.logger.warning(
+                    f"Subscription {subscription_id} does not belong to centre {current_user.id} or has an unknown plan"
+                )
+                flash('We could not verify this payment. Please contact support.', 'error')
                 return redirect(url_for('subscription_plans'))
-        
+
+            current_user.subscription_type = plan
+            current_user.subscription_end_date = datetime.utcnow() + timedelta(days=PLANS[plan]['days'])
+
+            # Skipped when the webhook already recorded this payment
+            if SubscriptionPayment.record(
+                amount=PLANS[plan]['price'],
+                razorpay_payment_id=payment_id,
+                razorpay_subscription_id=subscription_id,
+                plan_type=plan,
+                centre_id=current_user.id,
+                status='completed',
+                notes='Payment successful via checkout'
+            ):
+                db.session.commit()
+                current_app.logger.info(f"Created payment record for {current_user.id}")
+            else:
+                db.session.rollback()
+
+            flash('Subscription activated successfully!', 'success')
+            return render_template('subscription/success.html', plan=plan)
+
         except Exception as e:
             current_app.logger.error(f"Error processing success callback: {str(e)}", exc_info=True)
             db.session.rollback()
@@ -1474,4 +1398,58 @@ def register_routes(app):
     @login_required
     def subscription_failed():
         flash('Subscription payment failed. Please try again.', 'error')
-        return render_template('subscription/failed.html')
\ No newline at end of file
+        return render_template('subscription/failed.html')
+
+    # Admin Routes
+    @app.route('/admin/slow-queries')
+    @admin_required
+    def admin_slow_queries():
+        return render_template('admin/slow_queries.html',
+                             queries=top_offenders(),
+                             threshold=current_app.config['SLOW_QUERY_MS'],
+                             explain_rate=current_app.config['SLOW_QUERY_EXPLAIN_RATE'])
+
+    @app.route('/admin/slow-queries/reset', methods=['POST'])
+    @admin_required
+    def admin_slow_queries_reset():
+        deleted = SlowQuery.query.delete()
+        db.session.commit()
+        flash(f'Cleared {deleted} slow query records', 'success')
+        return redirect(url_for('admin_slow_queries'))
+
+    @app.route('/admin/profiles')
+    @admin_required
+    def admin_profiles():
+        sampler = current_app.extensions.get('stack_sampler')
+        return render_template('admin/profiles.html',
+                             profiles=list_profiles(current_app.config['PROFILE_DIR']),
+                             sampler=sampler)
+
+    @app.route('/admin/profiles/<profile_id>.<any(txt, prof):ext>')
+    @admin_required
+    def admin_profile_file(profile_id, ext):
+        return send_from_directory(current_app.config['PROFILE_DIR'], f"{profile_id}.{ext}",
+                                   mimetype='text/plain' if ext == 'txt' else 'application/octet-stream',
+                                   as_attachment=(ext == 'prof'))
+
+    @app.route('/admin/profiler/stacks')
+    @admin_required
+    def admin_profiler_stacks():
+        sampler = current_app.extensions.get('stack_sampler')
+        if sampler is None:
+            abort(404)
+        stacks = sampler.collapsed(reset=request.args.get('reset') == '1')
+        return Response(stacks, mimetype='text/plain', headers={
+            'X-Profiler-Pid': str(os.getpid()),
+            'X-Profiler-Samples': str(sampler.samples)
+        })
+
+    @app.route('/admin/memory')
+    @admin_required
+    def admin_memory():
+        stats = current_app.extensions.get('allocation_stats')
+        return render_template('admin/memory.html',
+                             rss=rss_bytes(),
+                             limit_mb=current_app.config['WORKER_MAX_RSS_MB'],
+                             endpoints=stats.summary() if stats is not None else None,
+                             pid=os.getpid())
@@ -0,0 +1,99 @@
+"""
+Additive schema upgrades for databases created by earlier releases.
+
+db.create_all() creates missing tables but never alters existing ones.
+upgrade_schema() compares every model table with the live database and adds
+missing columns and indexes, so new columns and unique constraints reach
+existing installs without a separate migration step. Each change runs in
+its own transaction; a column or plain index that cannot be applied is
+logged and skipped. A unique index that cannot be created is fatal: the
+duplicate rows are logged and SchemaUpgradeError stops startup, because the
+application relies on those indexes to enforce uniqueness.
+"""
+
+import logging
+
+from sqlalchemy import func, inspect, select, text
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+class SchemaUpgradeError(RuntimeError):
+    """A unique index could not be created, so uniqueness is not enforced"""
+
+
+def _duplicates(conn, table, index, limit=20):
+    """Key values that occur more than once for the columns of ``index``"""
+    columns = list(index.columns)
+    stmt = select(*columns, func.count()).select_from(table)\
+        .group_by(*columns).having(func.count() > 1).limit(limit)
+    return [tuple(row) for row in conn.execute(stmt)]
+
+
+def _column_ddl(table, column, dialect):
+    preparer = dialect.identifier_preparer
+    ddl = (f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN "
+           f"{preparer.format_column(column)} {column.type.compile(dialect=dialect)}")
+    default = column.server_default
+    if default is not None:
+        value = default.arg
+        if isinstance(value, str):
+            value = "'" + value.replace("'", "''") + "'"
+        else:
+            value = value.compile(dialect=dialect)
+        ddl += f" DEFAULT {value}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+    return ddl
+
+
+def upgrade_schema(engine=None):
+    """Add columns and indexes that exist on the models but not in the database"""
+    engine = engine or db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    applied = []
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in columns:
+                continue
+            if not column.nullable and column.server_default is None:
+                logger.warning(f"Adding {table.name}.{column.name} as nullable: no server default to backfill with")
+            ddl = _column_ddl(table, column, engine.dialect)
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(ddl))
+                applied.append(ddl)
+            except Exception as e:
+                logger.error(f"Schema upgrade failed: {ddl}: {e}")
+
+        indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        indexes.update(constraint['name'] for constraint in inspector.get_unique_constraints(table.name))
+        for index in table.indexes:
+            if index.name in indexes:
+                continue
+            try:
+                with engine.begin() as conn:
+                    index.create(conn)
+                applied.append(f"CREATE INDEX {index.name}")
+            except Exception as e:
+                logger.error(f"Schema upgrade failed: CREATE INDEX {index.name}: {e}")
+                if index.unique:
+                    with engine.connect() as conn:
+                        duplicates = _duplicates(conn, table, index)
+                    raise SchemaUpgradeError(
+                        f"Cannot create unique index {index.name} on {table.name}; "
+                        f"resolve these duplicate ({', '.join(c.name for c in index.columns)}) values first: "
+                        f"{duplicates}"
+                    ) from e
+
+    for change in applied:
+        logger.info(f"Schema upgrade applied: {change}")
+    return applied
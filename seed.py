@@ -0,0 +1,169 @@
+"""
+Synthetic multi-tenant dataset generator for local testing and benchmarks.
+
+Every table is filled with bulk INSERT statements, so seeding thousands of
+students takes a handful of round trips rather than one per row.
+"""
+
+import random
+from datetime import datetime, date, timedelta, time
+
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+
+from app import db
+import fee_summaries
+from models import Centre, Course, Scheme, Batch, Student, Enquiry, FeePayment
+
+SEED_PASSWORD = 'password'
+
+COURSE_CATALOGUE = [
+    ('BASIC COMPUTER', 3, 3000), ('MS OFFICE', 3, 4500), ('TALLY PRIME', 4, 7000),
+    ('DCA', 6, 9000), ('ADCA', 12, 15000), ('PGDCA', 12, 22000),
+    ('PYTHON PROGRAMMING', 4, 12000), ('WEB DESIGNING', 6, 14000),
+    ('GRAPHIC DESIGN', 6, 16000), ('DATA ANALYTICS', 6, 25000)
+]
+SCHEME_CATALOGUE = [
+    ('EARLY BIRD', 10), ('SIBLING DISCOUNT', 15), ('STUDENT OFFER', 20), ('FESTIVE OFFER', 5)
+]
+BATCH_SLOTS = [(6, 8), (8, 10), (10, 12), (12, 14), (14, 16), (16, 18), (18, 20), (20, 21)]
+FIRST_NAMES = ['AARAV', 'VIVAAN', 'ADITYA', 'ARJUN', 'SAI', 'RIYA', 'ANANYA', 'DIYA', 'ISHA',
+               'KAVYA', 'ROHAN', 'KARAN', 'NEHA', 'POOJA', 'PRIYA', 'RAHUL', 'SNEHA', 'VIKAS']
+LAST_NAMES = ['SHARMA', 'VERMA', 'PATEL', 'SINGH', 'KUMAR', 'GUPTA', 'YADAV', 'JOSHI', 'REDDY', 'NAIR']
+SOURCES = ['NEWSPAPER', 'FRIEND', 'INSTAGRAM', 'WALK-IN', 'PAMPHLET', 'GOOGLE']
+PAYMENT_METHODS = ['CASH', 'CASH', 'CASH', 'ONLINE', 'ONLINE', 'CARD', 'CHEQUE']
+
+
+def _bulk_insert(model, rows, chunk_size=1000):
+    """Insert rows in chunks and return their primary keys in order"""
+    ids = []
+    for start in range(0, len(rows), chunk_size):
+        result = db.session.execute(
+            insert(model).returning(model.id, sort_by_parameter_order=True),
+            rows[start:start + chunk_size]
+        )
+        ids.extend(result.scalars().all())
+    return ids
+
+
+def _person(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def _mobile(rng):
+    return f"{rng.choice('6789')}{rng.randrange(10**8, 10**9)}"
+
+
+def seed_database(centres=1, students=200, enquiries=50, seed=42, email_prefix='seed-centre'):
+    """Generate centres with courses, schemes, batches, students, enquiries and fee payments.
+
+    Student fee status is spread roughly 40% paid, 35% partial and 25% unpaid,
+    course popularity is skewed towards the cheaper courses and joining dates
+    cover the last 18 months. Returns a dict of row counts per table.
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    today = date.today()
+    password_hash = generate_password_hash(SEED_PASSWORD)
+    counts = {'centres': 0, 'courses': 0, 'schemes': 0, 'batches': 0,
+              'students': 0, 'enquiries': 0, 'fee_payments': 0}
+
+    offset = Centre.query.filter(Centre.email.like(f'{email_prefix}-%')).count()
+    centre_ids = _bulk_insert(Centre, [{
+        'name': f"Seed Computer Centre {offset + n + 1}",
+        'email': f"{email_prefix}-{offset + n + 1}@example.com",
+        'password_hash': password_hash,
+        'phone': _mobile(rng),
+        'city': rng.choice(['PUNE', 'JAIPUR', 'LUCKNOW', 'INDORE', 'PATNA']),
+        'subscription_type': 'trial',
+        'trial_start_date': now,
+        'trial_end_date': now + timedelta(days=14)
+    } for n in range(centres)])
+    counts['centres'] = len(centre_ids)
+
+    for centre_id in centre_ids:
+        catalogue = rng.sample(COURSE_CATALOGUE, rng.randint(4, len(COURSE_CATALOGUE)))
+        course_ids = _bulk_insert(Course, [{
+            'name': name, 'duration_months': months, 'fees': fees, 'centre_id': centre_id
+        } for name, months, fees in catalogue])
+        course_fees = {course_id: fees for course_id, (_, _, fees) in zip(course_ids, catalogue)}
+        course_weights = [1.0 / (rank + 1) for rank in range(len(course_ids))]
+
+        scheme_rows = rng.sample(SCHEME_CATALOGUE, rng.randint(0, len(SCHEME_CATALOGUE)))
+        scheme_ids = _bulk_insert(Scheme, [{
+            'name': name, 'discount_percentage': discount, 'centre_id': centre_id
+        } for name, discount in scheme_rows])
+        scheme_discounts = {scheme_id: discount for scheme_id, (_, discount) in zip(scheme_ids, scheme_rows)}
+
+        batch_ids = _bulk_insert(Batch, [{
+            'name': f"Slot {start:02d}-{end:02d}",
+            'start_time': time(start), 'end_time': time(end), 'centre_id': centre_id
+        } for start, end in BATCH_SLOTS])
+
+        student_rows = []
+        for n in range(students):
+            course_id = rng.choices(course_ids, weights=course_weights)[0]
+            scheme_id = rng.choice(scheme_ids) if scheme_ids and rng.random() < 0.3 else None
+            total_fees = float(course_fees[course_id])
+            concession = round(total_fees * scheme_discounts[scheme_id] / 100) if scheme_id else 0
+            name, father_name = _person(rng)
+            student_rows.append({
+                'enrollment_number': f"SEED{centre_id:04d}{n + 1:06d}",
+                'name': name,
+                'father_name': father_name,
+                'sex': rng.choice(['MALE', 'FEMALE']),
+                'age': rng.randint(15, 40),
+                'date_of_joining': today - timedelta(days=rng.randint(0, 540)),
+                'mobile1': _mobile(rng),
+                'city': 'PUNE',
+                'total_fees': total_fees,
+                'concession': concession,
+                'net_fees': max(0, total_fees - concession),
+                'centre_id': centre_id,
+                'course_id': course_id,
+                'scheme_id': scheme_id,
+                'batch_id': rng.choice(batch_ids),
+                'created_at': now
+            })
+        student_ids = _bulk_insert(Student, student_rows)
+
+        payment_rows = []
+        for student_id, row in zip(student_ids, student_rows):
+            roll = rng.random()
+            if roll < 0.25 or not row['net_fees']:
+                continue
+            target = row['net_fees'] if roll < 0.65 else round(row['net_fees'] * rng.uniform(0.2, 0.8))
+            installments = rng.randint(1, 4)
+            for i in range(installments):
+                payment_rows.append({
+                    'amount': round(target / installments, 2),
+                    'payment_date': min(today, row['date_of_joining'] + timedelta(days=30 * i)),
+                    'payment_method': rng.choice(PAYMENT_METHODS),
+                    'receipt_number': f"R{student_id}-{i + 1}",
+                    'student_id': student_id,
+                    'centre_id': centre_id
+                })
+        _bulk_insert(FeePayment, payment_rows)
+
+        enquiry_ids = _bulk_insert(Enquiry, [{
+            'name': _person(rng)[0],
+            'mobile1': _mobile(rng),
+            'qualification': rng.choice(['10TH', '12TH', 'GRADUATE', 'POST GRADUATE']),
+            'source_of_information': rng.choice(SOURCES),
+            'status': rng.choices(['active', 'converted', 'closed'], weights=[60, 25, 15])[0],
+            'centre_id': centre_id,
+            'course_interested_id': rng.choice(course_ids),
+            'created_at': now - timedelta(days=rng.randint(0, 180))
+        } for _ in range(enquiries)])
+
+        counts['courses'] += len(course_ids)
+        counts['schemes'] += len(scheme_ids)
+        counts['batches'] += len(batch_ids)
+        counts['students'] += len(student_ids)
+        counts['fee_payments'] += len(payment_rows)
+        counts['enquiries'] += len(enquiry_ids)
+
+    db.session.commit()
+    # Bulk inserts skip the flush listeners, so build the reports' rollup here
+    fee_summaries.refresh(centre_ids)
+    return counts
@@ -0,0 +1,221 @@
+"""
+Slow query log.
+
+Every statement is timed with SQLAlchemy cursor events. A statement slower
+than SLOW_QUERY_MS is put on a bounded in-process ring buffer with its
+fingerprint (the SQL with literals replaced by ?), the shape of its
+parameters, its duration, the endpoint and the centre. At the end of the
+request a background thread in the same process is woken to fold the buffer
+into slow_queries, so the request never waits for it. That table has one
+row per fingerprint and endpoint, holding call count, total and max time,
+so /admin/slow-queries can rank the worst offenders by total time.
+
+A sampled fraction (SLOW_QUERY_EXPLAIN_RATE) of slow SELECTs is re-run
+under EXPLAIN (ANALYZE, BUFFERS) on PostgreSQL, or EXPLAIN QUERY PLAN on
+SQLite, by that same thread, and the latest plan is kept with the row. Only
+plain SELECTs are explained, because ANALYZE executes the statement: a
+SELECT ... FOR UPDATE or FOR SHARE would take its row locks again.
+Parameter values are used for the EXPLAIN and then discarded; only their
+types are stored.
+"""
+
+import atexit
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from flask import g, has_request_context, request
+from sqlalchemy import case, event, func
+from sqlalchemy.engine import Engine
+
+from app import db
+from models import SlowQuery, dialect_insert
+from query_audit import fingerprint
+
+SKIP_OPTION = 'slow_query_log'
+_LOCKING = re.compile(r'\bFOR\s+(?:NO\s+KEY\s+)?(?:KEY\s+)?(?:UPDATE|SHARE)\b', re.IGNORECASE)
+
+_buffer = deque(maxlen=500)
+_settings = {'threshold': None, 'explain_rate': 0.0}
+
+
+def parameter_shape(parameters, executemany):
+    """Types of the bound parameters, without their values"""
+    if executemany and parameters:
+        return f"{len(parameters)} x {parameter_shape(parameters[0], False)}"
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f"{key}: {type(value).__name__}" for key, value in parameters.items()) + '}'
+    if isinstance(parameters, (list, tuple)):
+        return '(' + ', '.join(type(value).__name__ for value in parameters) + ')'
+    return ''
+
+
+def _context():
+    if not has_request_context():
+        return 'background', None
+    user = g.get('_login_user')
+    centre_id = user.id if user is not None and getattr(user, 'is_authenticated', False) else None
+    return request.endpoint or 'unmatched', centre_id
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('slow_query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _check_duration(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('slow_query_start')
+    if not starts:
+        return
+    elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+    threshold = _settings['threshold']
+    if threshold is None or elapsed_ms < threshold or not conn.get_execution_options().get(SKIP_OPTION, True):
+        return
+
+    endpoint, centre_id = _context()
+    explain = explainable(statement, executemany) and random.random() < _settings['explain_rate']
+    _buffer.append({
+        'statement': statement,
+        # Values are kept only for an EXPLAIN, never stored
+        'parameters': parameters if explain else None,
+        'params_shape': parameter_shape(parameters, executemany),
+        'duration_ms': elapsed_ms,
+        'endpoint': endpoint,
+        'centre_id': centre_id,
+        'seen_at': datetime.utcnow()
+    })
+
+
+def explainable(statement, executemany=False):
+    """True for a single SELECT that takes no row locks, which is safe to re-run"""
+    return not executemany and statement.lstrip()[:6].upper() == 'SELECT' and not _LOCKING.search(statement)
+
+
+def explain(connection, statement, parameters):
+    """Plan of a SELECT, executed and rolled back on its own connection"""
+    raw = connection.connection.dbapi_connection
+    cursor = raw.cursor()
+    try:
+        if connection.dialect.name == 'postgresql':
+            cursor.execute('SET LOCAL statement_timeout = 5000')
+            cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + statement, parameters)
+        else:
+            cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+        return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+    except Exception as e:
+        return f"EXPLAIN failed: {e}"
+    finally:
+        cursor.close()
+        raw.rollback()
+
+
+def flush():
+    """Fold buffered slow statements into slow_queries; returns how many"""
+    entries = []
+    while _buffer:
+        entries.append(_buffer.popleft())
+    if not entries:
+        return 0
+
+    engine = db.engine.execution_options(**{SKIP_OPTION: False})
+    table = SlowQuery.__table__
+    for entry in entries:
+        key = fingerprint(entry['statement'])
+        plan = None
+        if entry['parameters'] is not None:
+            with engine.connect() as connection:
+                plan = explain(connection, entry['statement'], entry['parameters'])
+
+        stmt = dialect_insert(SlowQuery).values(
+            fingerprint_hash=hashlib.sha1(key.encode()).hexdigest()[:16],
+            fingerprint=key,
+            endpoint=entry['endpoint'],
+            calls=1,
+            total_ms=entry['duration_ms'],
+            max_ms=entry['duration_ms'],
+            params_shape=entry['params_shape'],
+            centre_id=entry['centre_id'],
+            explain_plan=plan,
+            first_seen=entry['seen_at'],
+            last_seen=entry['seen_at']
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.fingerprint_hash, table.c.endpoint],
+            set_={
+                'calls': table.c.calls + 1,
+                'total_ms': table.c.total_ms + stmt.excluded.total_ms,
+                'max_ms': case((stmt.excluded.max_ms > table.c.max_ms, stmt.excluded.max_ms), else_=table.c.max_ms),
+                'params_shape': stmt.excluded.params_shape,
+                'centre_id': stmt.excluded.centre_id,
+                'explain_plan': func.coalesce(stmt.excluded.explain_plan, table.c.explain_plan),
+                'last_seen': stmt.excluded.last_seen
+            }
+        )
+        with engine.begin() as connection:
+            connection.execute(stmt)
+    return len(entries)
+
+
+def top_offenders(limit=50):
+    return SlowQuery.query.order_by(SlowQuery.total_ms.desc()).limit(limit).all()
+
+
+class BackgroundFlusher:
+    """Thread that folds the buffer into slow_queries after it is woken"""
+
+    def __init__(self, app):
+        self.app = app
+        self.wake = threading.Event()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def notify(self):
+        # Threads do not survive fork; each worker starts its own on first use
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self.wake = threading.Event()
+                    threading.Thread(target=self.run, name='slow-query-flush', daemon=True).start()
+                    self._pid = os.getpid()
+        self.wake.set()
+
+    def run(self):
+        while True:
+            self.wake.wait()
+            self.wake.clear()
+            self.flush()
+
+    def flush(self):
+        try:
+            with self.app.app_context():
+                flush()
+        except Exception as e:
+            self.app.logger.error(f"Slow query log flush failed: {e}")
+
+
+def init_slow_queries(app):
+    """Enable the slow query log and flush it in the background after each request"""
+    global _buffer
+    app.config.setdefault('SLOW_QUERY_MS', float(os.environ.get('SLOW_QUERY_MS', 200)))
+    app.config.setdefault('SLOW_QUERY_EXPLAIN_RATE', float(os.environ.get('SLOW_QUERY_EXPLAIN_RATE', 0)))
+    app.config.setdefault('SLOW_QUERY_BUFFER', int(os.environ.get('SLOW_QUERY_BUFFER', 500)))
+
+    _settings['threshold'] = app.config['SLOW_QUERY_MS'] if app.config['SLOW_QUERY_MS'] > 0 else None
+    _settings['explain_rate'] = app.config['SLOW_QUERY_EXPLAIN_RATE']
+    _buffer = deque(_buffer, maxlen=app.config['SLOW_QUERY_BUFFER'])
+
+    flusher = BackgroundFlusher(app)
+    app.extensions['slow_query_flusher'] = flusher
+    # CLI commands have no requests; keep what they recorded
+    atexit.register(lambda: _buffer and flusher.flush())
+
+    @app.teardown_request
+    def flush_slow_queries(exc):
+        if _buffer:
+            flusher.notify()
@@ -0,0 +1,190 @@
+"""
+Non-blocking JSON logging.
+
+Request threads never format or write log lines. The root logger has one
+QueueHandler, which only decides whether to keep a record, attaches the
+request context and puts the record on an in-memory queue. A QueueListener
+thread in each process turns records into one JSON object per line and
+writes them to LOG_FILE, or to stderr when LOG_FILE is empty. LOG_FILE
+defaults to app.log in the instance folder, and to stderr in development and
+tests. When the queue is full, records are dropped and counted rather than
+blocking the request. Records still queued when the process exits are
+written out by an atexit hook, so CLI commands do not lose their last lines.
+
+Noisy levels are sampled: LOG_DEBUG_SAMPLE_RATE and LOG_INFO_SAMPLE_RATE
+give the fraction of DEBUG and INFO records kept. Warnings and errors are
+always kept. Kept records carry their sample_rate, so counts can be scaled
+back up. Form data passed as ``extra={'form': request.form}`` is logged with
+passwords, tokens and signatures masked.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import traceback
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask import g, has_request_context, request
+
+SENSITIVE_FIELD = re.compile(r'pass|secret|token|signature|card|cvv|otp', re.IGNORECASE)
+REDACTED = '[redacted]'
+MAX_VALUE_LENGTH = 200
+QUEUE_SIZE = 10000
+
+# Attributes every LogRecord has; anything else came from ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+def redact_form(form):
+    """Form fields as a dict with sensitive values masked and long values cut"""
+    redacted = {}
+    for key in form:
+        values = form.getlist(key) if hasattr(form, 'getlist') else [form[key]]
+        values = [REDACTED if SENSITIVE_FIELD.search(key) else str(v)[:MAX_VALUE_LENGTH] for v in values]
+        redacted[key] = values[0] if len(values) == 1 else values
+    return redacted
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a random fraction of records at the sampled levels"""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno, 1.0)
+        if rate < 1.0 and random.random() >= rate:
+            return False
+        record.sample_rate = rate
+        return True
+
+
+class RequestContextFilter(logging.Filter):
+    """Copy request details onto the record while still on the request thread"""
+
+    def filter(self, record):
+        if has_request_context():
+            record.method = request.method
+            record.path = request.path
+            record.endpoint = request.endpoint
+            # Only read a user Flask-Login has already loaded; never query here
+            user = g.get('_login_user')
+            if user is not None and getattr(user, 'is_authenticated', False):
+                record.centre_id = user.id
+        if 'form' in record.__dict__:
+            record.form = redact_form(record.form)
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'pid': record.process,
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler with a listener thread per process that never blocks callers"""
+
+    def __init__(self, *handlers):
+        super().__init__(queue.Queue(QUEUE_SIZE))
+        self.handlers = handlers
+        self.dropped = 0
+        self._pid = None
+        self._listener = None
+        self._start_lock = threading.Lock()
+        # Threads and held locks do not survive fork; each worker starts its own
+        os.register_at_fork(after_in_child=self._after_fork)
+        atexit.register(self.flush)
+
+    def _after_fork(self):
+        self._pid = None
+        self._listener = None
+        self._start_lock = threading.Lock()
+        self.queue = queue.Queue(QUEUE_SIZE)
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._listener = QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+                self._listener.start()
+                self._pid = os.getpid()
+
+    def prepare(self, record):
+        # Resolve the message and traceback now; formatting to JSON happens on the listener thread
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = ''.join(traceback.format_exception(*record.exc_info))
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """Stop the listener, writing out every queued record"""
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._listener = None
+            self._pid = None
+
+
+def init_logging(app):
+    """Route all logging through a sampled, non-blocking JSON pipeline"""
+    development = app.config['ENV'] == 'development'
+    to_stderr = development or app.testing or app.config['ENV'] == 'testing'
+    app.config.setdefault('LOG_LEVEL', os.environ.get('LOG_LEVEL', 'DEBUG' if development else 'INFO').upper())
+    app.config.setdefault('LOG_FILE', os.environ.get(
+        'LOG_FILE', '' if to_stderr else os.path.join(app.instance_path, 'app.log')
+    ))
+    app.config.setdefault('LOG_DEBUG_SAMPLE_RATE', float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', 1.0 if development else 0.01)))
+    app.config.setdefault('LOG_INFO_SAMPLE_RATE', float(os.environ.get('LOG_INFO_SAMPLE_RATE', 1.0)))
+
+    if app.config['LOG_FILE']:
+        os.makedirs(os.path.dirname(os.path.abspath(app.config['LOG_FILE'])), exist_ok=True)
+        output = RotatingFileHandler(app.config['LOG_FILE'], maxBytes=1024 * 1024 * 10, backupCount=5)
+    else:
+        output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JSONFormatter())
+
+    handler = NonBlockingQueueHandler(output)
+    handler.addFilter(SamplingFilter({
+        logging.DEBUG: app.config['LOG_DEBUG_SAMPLE_RATE'],
+        logging.INFO: app.config['LOG_INFO_SAMPLE_RATE'],
+    }))
+    handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        if isinstance(existing, NonBlockingQueueHandler):
+            existing.flush()
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(app.config['LOG_LEVEL'])
+    app.extensions['log_handler'] = handler
+    return handler
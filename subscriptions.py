@@ -0,0 +1,93 @@
+"""
+Subscription lifecycle sweep.
+
+Requests only read Centre.subscription_type and Centre.days_left. This job
+keeps those columns current: lapsed trials and plans are moved to 'expired'
+with one UPDATE ... RETURNING per plan type, served by the
+(subscription_type, end date) indexes. Each change is written to
+subscription_transitions. Run it from cron with `flask subscriptions sweep`
+or keep it running with `flask subscriptions sweep --loop`.
+"""
+
+import time
+from datetime import datetime
+
+from sqlalchemy import insert, update, or_
+
+from app import db
+from models import Centre, SubscriptionTransition, ACTIVE_SUBSCRIPTION_TYPES
+
+# Plan type, the column holding its end date and the transition reason
+LIFECYCLE = (
+    ('trial', Centre.trial_end_date, 'trial_ended'),
+    ('monthly', Centre.subscription_end_date, 'plan_ended'),
+    ('yearly', Centre.subscription_end_date, 'plan_ended'),
+)
+
+
+def expire_lapsed(now):
+    """Move every lapsed centre to 'expired' and record the transitions"""
+    transitions = []
+    for plan_type, end_column, reason in LIFECYCLE:
+        stmt = update(Centre).where(
+            Centre.subscription_type == plan_type,
+            or_(end_column < now, end_column.is_(None))
+        ).values(
+            subscription_type='expired', days_left=0,
+            data_version=Centre.data_version + 1, data_changed_at=now
+        ).returning(Centre.id)
+        centre_ids = db.session.execute(stmt, execution_options={'synchronize_session': False}).scalars().all()
+        transitions.extend({
+            'centre_id': centre_id, 'from_type': plan_type, 'to_type': 'expired',
+            'reason': reason, 'created_at': now
+        } for centre_id in centre_ids)
+
+    if transitions:
+        db.session.execute(insert(SubscriptionTransition), transitions)
+    return transitions
+
+
+def refresh_days_left(now):
+    """Recompute days_left for active centres, writing only the rows that changed"""
+    rows = db.session.query(
+        Centre.id, Centre.subscription_type, Centre.trial_end_date,
+        Centre.subscription_end_date, Centre.days_left
+    ).filter(Centre.subscription_type.in_(ACTIVE_SUBSCRIPTION_TYPES)).all()
+
+    changes = []
+    for centre_id, plan_type, trial_end, subscription_end, current in rows:
+        end = trial_end if plan_type == 'trial' else subscription_end
+        days_left = (end - now).days
+        if days_left != current:
+            changes.append({'id': centre_id, 'days_left': days_left})
+
+    if changes:
+        db.session.execute(update(Centre), changes)
+        Centre.touch(change['id'] for change in changes)
+    return len(changes)
+
+
+def sweep(now=None):
+    """Expire lapsed subscriptions and refresh days left in one transaction"""
+    now = now or datetime.utcnow()
+    try:
+        transitions = expire_lapsed(now)
+        refreshed = refresh_days_left(now)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return {'expired': len(transitions), 'days_left_updated': refreshed}
+
+
+def run_forever(app, interval):
+    """Sweep every ``interval`` seconds until interrupted"""
+    while True:
+        try:
+            with app.app_context():
+                result = sweep()
+            if result['expired']:
+                app.logger.info(f"Subscription sweep expired {result['expired']} centres")
+        except Exception as e:
+            app.logger.error(f"Subscription sweep failed: {e}", exc_info=True)
+        time.sleep(interval)
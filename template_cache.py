@@ -0,0 +1,39 @@
+"""
+Compiled template cache.
+
+Jinja compiles a template to Python bytecode the first time it is rendered.
+With a FileSystemBytecodeCache in TEMPLATE_CACHE_DIR that work is done once
+per deploy instead of once per worker. `flask templates compile` fills the
+cache ahead of time, and main.py loads every template before gunicorn forks,
+so new and recycled workers start with all templates already compiled.
+Entries are keyed by the template source's checksum, so an edited template
+is simply recompiled.
+"""
+
+import os
+
+from jinja2 import FileSystemBytecodeCache, TemplateSyntaxError
+
+
+def compile_templates(app):
+    """Load every template, returning (compiled names, {name: error})"""
+    compiled, errors = [], {}
+    for name in app.jinja_env.list_templates(extensions=('html', 'txt', 'xml')):
+        try:
+            app.jinja_env.get_template(name)
+            compiled.append(name)
+        except TemplateSyntaxError as e:
+            errors[name] = f"line {e.lineno}: {e.message}"
+    return compiled, errors
+
+
+def init_template_cache(app):
+    """Store compiled templates on disk so they survive worker restarts"""
+    app.config.setdefault(
+        'TEMPLATE_CACHE_DIR', os.environ.get('TEMPLATE_CACHE_DIR', os.path.join(app.instance_path, 'jinja-cache'))
+    )
+    directory = app.config['TEMPLATE_CACHE_DIR']
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
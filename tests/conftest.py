@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'without_prometheus: runs even when prometheus_client is not installed')
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    os.environ.setdefault('SESSION_SECRET', 'test-secret')
+    os.environ.setdefault('FLASK_ENV', 'testing')
+    os.environ['DATABASE_URL'] = f"sqlite:///{tmp_path_factory.mktemp('db') / 'lerzo.db'}"
+
+    from app import create_app
+    app = create_app()
+    app.config.update(TESTING=True, QUERY_BUDGET_STRICT=True)
+    return app
+
+
+@pytest.fixture(scope='session')
+def seeded_centre(app):
+    """Login details of a centre with courses, batches, students, payments and enquiries"""
+    from seed import seed_database, SEED_PASSWORD
+    with app.app_context():
+        seed_database(centres=1, students=40, enquiries=20, email_prefix='test-centre')
+    return {'email': 'test-centre-1@example.com', 'password': SEED_PASSWORD}
+
+
+@pytest.fixture
+def client(app, seeded_centre):
+    client = app.test_client()
+    response = client.post('/login', data=seeded_centre)
+    assert response.status_code == 302
+    return client
@@ -0,0 +1,112 @@
+"""Unchanged pages are answered with 304 before the view runs"""
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, update
+from werkzeug.http import http_date
+
+from app import db
+from models import Centre
+
+PAGE = '/students?search=conditional'
+
+
+@contextmanager
+def student_queries(app):
+    statements = []
+    with app.app_context():
+        engine = db.engine
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if 'FROM students' in statement:
+            statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+@pytest.fixture
+def browser(client):
+    """A logged in client whose login flash has been shown"""
+    client.get(PAGE)
+    return client
+
+
+@pytest.fixture
+def set_changed_at(app, seeded_centre):
+    def set_changed_at(value):
+        with app.app_context():
+            db.session.execute(update(Centre).where(Centre.email == seeded_centre['email'])
+                               .values(data_changed_at=value))
+            db.session.commit()
+    return set_changed_at
+
+
+def test_unchanged_etag_skips_the_view(app, browser):
+    first = browser.get(PAGE)
+    assert first.status_code == 200
+    assert first.headers['ETag'].startswith('W/')
+    assert 'private' in first.headers['Cache-Control']
+
+    with student_queries(app) as statements:
+        second = browser.get(PAGE, headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 304
+    assert second.get_data() == b''
+    assert statements == []
+
+    other_page = browser.get('/students?search=other', headers={'If-None-Match': first.headers['ETag']})
+    assert other_page.status_code == 200
+
+
+def test_changed_data_renders_again(app, browser, seeded_centre):
+    etag = browser.get(PAGE).headers['ETag']
+    with app.app_context():
+        Centre.touch([Centre.query.filter_by(email=seeded_centre['email']).one().id])
+        db.session.commit()
+    assert browser.get(PAGE, headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_pending_flashes_always_render(browser):
+    etag = browser.get(PAGE).headers['ETag']
+    with browser.session_transaction() as session:
+        session['_flashes'] = [('success', 'Batch saved')]
+
+    response = browser.get(PAGE, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert 'Batch saved' in response.get_data(as_text=True)
+    assert browser.get(PAGE, headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_if_modified_since_alone(browser, set_changed_at):
+    set_changed_at(datetime.utcnow() - timedelta(seconds=5))
+    last_modified = browser.get(PAGE).headers['Last-Modified']
+
+    assert browser.get(PAGE, headers={'If-Modified-Since': last_modified}).status_code == 304
+
+    set_changed_at(datetime.utcnow() + timedelta(seconds=5))
+    assert browser.get(PAGE, headers={'If-Modified-Since': last_modified}).status_code == 200
+
+
+def test_if_modified_since_expires_with_the_day(browser, set_changed_at):
+    """A copy from yesterday renders, as the date in the ETag would force"""
+    set_changed_at(datetime.utcnow() - timedelta(days=3))
+    response = browser.get(PAGE)
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).astimezone()
+    assert response.last_modified >= today
+
+    yesterday = http_date(today - timedelta(hours=1))
+    assert browser.get(PAGE, headers={'If-Modified-Since': yesterday}).status_code == 200
+    assert browser.get(PAGE, headers={'If-Modified-Since': response.headers['Last-Modified']}).status_code == 304
+
+
+def test_if_modified_since_expires_with_the_release(app, browser, set_changed_at, monkeypatch):
+    set_changed_at(datetime.utcnow() - timedelta(seconds=30))
+    last_modified = browser.get(PAGE).headers['Last-Modified']
+
+    monkeypatch.setitem(app.config, 'RELEASED_AT', datetime.utcnow().replace(microsecond=0) + timedelta(seconds=1))
+    assert browser.get(PAGE, headers={'If-Modified-Since': last_modified}).status_code == 200
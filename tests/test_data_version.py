@@ -0,0 +1,44 @@
+"""Only writes to rows a centre's pages show invalidate its caches and ETags"""
+
+from datetime import datetime
+
+import pytest
+
+from app import db
+from models import Centre, Enquiry, SubscriptionTransition
+
+
+@pytest.fixture
+def centre(app, request):
+    with app.app_context():
+        centre = Centre(name='Version Centre', email=f'version-{request.node.name}@example.com', password_hash='x')
+        db.session.add(centre)
+        db.session.commit()
+        yield centre
+        db.session.rollback()
+
+
+def version(centre):
+    db.session.expire(centre, ['data_version'])
+    return centre.data_version
+
+
+def test_displayed_rows_bump_the_version(centre):
+    before = version(centre)
+    db.session.add(Enquiry(name='ENQUIRY', mobile1='9876543210', centre_id=centre.id))
+    db.session.commit()
+    assert version(centre) == before + 1
+
+    centre.name = 'Renamed Centre'
+    db.session.commit()
+    assert version(centre) == before + 2
+
+
+def test_bookkeeping_writes_leave_the_version(centre):
+    before = version(centre)
+    centre.logo_variants = {'64': {'webp': 'x.webp'}}
+    centre.days_left = 3
+    db.session.add(SubscriptionTransition(centre_id=centre.id, from_type='trial', to_type='expired',
+                                          reason='trial_ended', created_at=datetime.utcnow()))
+    db.session.commit()
+    assert version(centre) == before
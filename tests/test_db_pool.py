@@ -0,0 +1,87 @@
+"""Forked workers never use a connection opened by their parent"""
+
+import json
+import os
+
+import pytest
+
+from app import db
+from db_pool import after_fork, fork_check
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+
+
+def run_in_child(work):
+    """Run ``work()`` in a forked process and return its JSON result"""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            result = work()
+        except Exception as e:
+            result = {'error': repr(e)}
+        with os.fdopen(write_fd, 'w') as f:
+            json.dump(result, f)
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        result = json.load(f)
+    os.waitpid(pid, 0)
+    return result
+
+
+def warm_parent_pool(app):
+    with app.app_context():
+        with db.engine.connect() as connection:
+            return connection.connection.info['pid']
+
+
+def test_after_fork_gives_the_child_its_own_pool(app):
+    assert warm_parent_pool(app) == os.getpid()
+
+    def work():
+        with app.app_context():
+            inherited = db.engine.pool
+        after_fork(app)
+        with app.app_context():
+            with db.engine.connect() as connection:
+                return {
+                    'pid': os.getpid(),
+                    'new_pool': db.engine.pool is not inherited,
+                    'opened_by': connection.connection.info['pid'],
+                }
+
+    child = run_in_child(work)
+    assert 'error' not in child, child['error']
+    assert child['new_pool']
+    assert child['opened_by'] == child['pid'] != os.getpid()
+
+
+def test_pid_guard_replaces_an_inherited_connection(app):
+    parent_pid = warm_parent_pool(app)
+
+    def work():
+        # No after_fork: the pool still holds the parent's connection
+        with app.app_context():
+            pooled = db.engine.pool.checkedin()
+            with db.engine.connect() as connection:
+                return {
+                    'pid': os.getpid(),
+                    'pooled': pooled,
+                    'opened_by': connection.connection.info['pid'],
+                }
+
+    child = run_in_child(work)
+    assert 'error' not in child, child['error']
+    assert child['pooled'] >= 1
+    assert child['opened_by'] == child['pid'] != parent_pid
+
+    # The parent's own connection is untouched
+    assert warm_parent_pool(app) == os.getpid()
+
+
+def test_fork_check_reports_no_problems(app):
+    parent, workers, problems = fork_check(app, workers=2)
+    assert problems == []
+    assert all(worker['opened_by'] == worker['pid'] != parent['pid'] for worker in workers)
@@ -0,0 +1,120 @@
+"""Enrollment numbers come from a per-centre counter and are never duplicated"""
+
+import threading
+from datetime import date
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from models import Centre, Course, EnrollmentCounter, Student
+from utils import generate_enrollment_numbers, reserve_enrollment_numbers
+
+
+@pytest.fixture
+def centre_id(app, request):
+    with app.app_context():
+        centre = Centre(name='Counter Centre', email=f'counter-{request.node.name}@example.com', password_hash='x')
+        db.session.add(centre)
+        db.session.commit()
+        return centre.id
+
+
+@pytest.fixture(autouse=True)
+def numbering(app):
+    number_format = app.config['ENROLLMENT_NUMBER_FORMAT']
+    app.config['ENROLLMENT_NUMBER_FORMAT'] = 'C{centre}-{counter:04d}'
+    with app.app_context():
+        yield
+        db.session.rollback()
+    app.config['ENROLLMENT_NUMBER_FORMAT'] = number_format
+
+
+def add_student(centre_id, number):
+    course = Course.query.filter_by(centre_id=centre_id).first()
+    if course is None:
+        course = Course(name='COURSE', duration_months=3, fees=1000, centre_id=centre_id)
+        db.session.add(course)
+        db.session.flush()
+    db.session.add(Student(enrollment_number=number, name='STUDENT', mobile1='9876543210',
+                           date_of_joining=date.today(), total_fees=1000, net_fees=1000,
+                           centre_id=centre_id, course_id=course.id))
+    db.session.commit()
+
+
+def test_numbers_are_consecutive_and_formatted(centre_id):
+    first = generate_enrollment_numbers(centre_id, 3)
+    second = generate_enrollment_numbers(centre_id)
+    assert first + second == [f'C{centre_id}-{n:04d}' for n in (1, 2, 3, 4)]
+
+
+def test_first_allocation_starts_after_existing_numbers(centre_id):
+    add_student(centre_id, f'C{centre_id}-0041')
+    assert generate_enrollment_numbers(centre_id) == [f'C{centre_id}-0042']
+
+
+def test_hand_entered_numbers_move_the_counter(centre_id):
+    generate_enrollment_numbers(centre_id)
+    reserve_enrollment_numbers(centre_id, [f'C{centre_id}-0007', 'OTHER-99'])
+    add_student(centre_id, f'C{centre_id}-0007')
+    assert generate_enrollment_numbers(centre_id) == [f'C{centre_id}-0008']
+    # A lower hand-entered number never moves the counter back
+    reserve_enrollment_numbers(centre_id, [f'C{centre_id}-0003'])
+    assert generate_enrollment_numbers(centre_id) == [f'C{centre_id}-0009']
+
+
+def test_rolled_back_allocation_is_reused(centre_id):
+    generate_enrollment_numbers(centre_id)
+    db.session.commit()
+    generate_enrollment_numbers(centre_id, 5)
+    db.session.rollback()
+    assert generate_enrollment_numbers(centre_id) == [f'C{centre_id}-0002']
+
+
+def test_duplicate_number_is_rejected_by_the_database(centre_id):
+    add_student(centre_id, 'DUP-1')
+    with pytest.raises(IntegrityError):
+        add_student(centre_id, 'DUP-1')
+
+
+def test_concurrent_allocations_never_repeat(app, centre_id):
+    numbers, errors = [], []
+
+    def allocate():
+        try:
+            with app.app_context():
+                allocated = generate_enrollment_numbers(centre_id, 3)
+                db.session.commit()
+                numbers.extend(allocated)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=allocate) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(numbers) == len(set(numbers)) == 24
+    assert db.session.get(EnrollmentCounter, (centre_id, '')).last_value == 24
+
+
+def test_students_add_reports_a_duplicate(app, client, seeded_centre):
+    centre = Centre.query.filter_by(email=seeded_centre['email']).one()
+    existing = Student.query.filter_by(centre_id=centre.id).first()
+    form = {
+        'enrollment_number': existing.enrollment_number, 'name': 'DUPLICATE', 'mobile1': '9876543210',
+        'date_of_joining': date.today().isoformat(), 'total_fees': '1000',
+        'course_id': str(existing.course_id), 'scheme_id': '0', 'batch_id': '0',
+    }
+    count = Student.query.filter_by(centre_id=centre.id).count()
+    response = client.post('/students/add', data=form)
+    assert response.status_code == 200
+    assert 'Enrollment number already exists' in response.get_data(as_text=True)
+    db.session.rollback()
+    assert Student.query.filter_by(centre_id=centre.id).count() == count
+
+    form['enrollment_number'] = ''
+    assert client.post('/students/add', data=form).status_code == 302
+    db.session.rollback()
+    assert Student.query.filter_by(centre_id=centre.id).count() == count + 1
@@ -0,0 +1,118 @@
+"""Bulk fee collection writes every payment or none of them"""
+
+from datetime import date
+
+import pytest
+
+from app import db
+from fee_collection import parse_enrollment_numbers, record_payments, student_balances
+from fee_summaries import fee_report
+from models import Centre, Course, FeePayment, Student
+
+
+@pytest.fixture(autouse=True)
+def app_context(app):
+    with app.app_context():
+        yield
+        db.session.rollback()
+
+
+@pytest.fixture
+def centre(request):
+    """A centre with three students owing 1000 each, one of whom has paid 600"""
+    centre = Centre(name='Collection Centre', email=f'collect-{request.node.name}@example.com', password_hash='x')
+    db.session.add(centre)
+    db.session.flush()
+    course = Course(name='Tally', duration_months=3, fees=1000, centre_id=centre.id)
+    db.session.add(course)
+    db.session.flush()
+    students = [Student(enrollment_number=f'FC-{n}', name=f'STUDENT {n}', mobile1='9876543210',
+                        date_of_joining=date.today(), total_fees=1000, net_fees=1000,
+                        centre_id=centre.id, course_id=course.id) for n in (1, 2, 3)]
+    db.session.add_all(students)
+    db.session.flush()
+    db.session.add(FeePayment(amount=600, payment_date=date.today(), student_id=students[0].id,
+                              centre_id=centre.id))
+    db.session.commit()
+    return centre.id, [student.id for student in students]
+
+
+@pytest.fixture
+def other_centre(request):
+    """A second centre whose student reuses enrollment number FC-1"""
+    other = Centre(name='Other Centre', email=f'collect-other-{request.node.name}@example.com', password_hash='x')
+    db.session.add(other)
+    db.session.flush()
+    course = Course(name='Tally', duration_months=3, fees=1000, centre_id=other.id)
+    db.session.add(course)
+    db.session.flush()
+    student = Student(enrollment_number='FC-1', name='OUTSIDER', mobile1='9876543210',
+                      date_of_joining=date.today(), total_fees=1000, net_fees=1000,
+                      centre_id=other.id, course_id=course.id)
+    db.session.add(student)
+    db.session.commit()
+    return other.id, student.id
+
+
+def payments(centre_id):
+    return db.session.query(FeePayment.student_id, FeePayment.amount)\
+                     .filter_by(centre_id=centre_id).order_by(FeePayment.id).all()
+
+
+def test_parse_enrollment_numbers():
+    assert parse_enrollment_numbers(' fc-1, FC-2;fc-1\nfc-3 ') == ['FC-1', 'FC-2', 'FC-3']
+    assert parse_enrollment_numbers(None) == []
+
+
+@pytest.mark.parametrize('amount', [float('nan'), float('inf'), float('-inf')])
+def test_non_finite_amounts_are_rejected(centre, amount):
+    centre_id, (first, second, third) = centre
+    assert record_payments(centre_id, {second: (amount, '')}, date.today(), 'CASH') == \
+        (0, {second: 'Not a valid amount'})
+    assert payments(centre_id) == [(first, 600)]
+
+
+def test_amount_cannot_exceed_balance(centre):
+    centre_id, (first, second, third) = centre
+    recorded, errors = record_payments(centre_id, {first: (400.01, '')}, date.today(), 'CASH')
+    assert (recorded, errors) == (0, {first: 'Amount cannot exceed balance fees of ₹400.00'})
+
+    assert record_payments(centre_id, {first: (400, 'R-1')}, date.today(), 'CASH') == (1, {})
+    assert [row.balance for row in student_balances(centre_id)] == [0, 1000, 1000]
+
+
+def test_one_bad_entry_records_nothing(centre, other_centre):
+    centre_id, (first, second, third) = centre
+    other_centre_id, other_student = other_centre
+    entries = {
+        second: (500, 'R-2'),
+        third: (0, 'R-3'),
+        first: (401, 'R-1'),
+        other_student: (100, 'R-4'),
+    }
+
+    recorded, errors = record_payments(centre_id, entries, date.today(), 'CASH')
+
+    assert recorded == 0
+    assert errors == {
+        third: 'Amount must be greater than zero',
+        first: 'Amount cannot exceed balance fees of ₹400.00',
+        other_student: 'Student not found',
+    }
+    assert payments(centre_id) == [(first, 600)]
+    assert payments(other_centre_id) == []
+
+
+def test_valid_entries_are_recorded_together(centre):
+    centre_id, (first, second, third) = centre
+    entries = {first: (400, 'R-1'), second: (250.5, 'R-2'), third: (1000, '')}
+
+    assert record_payments(centre_id, entries, date.today(), 'ONLINE', notes='Term 1') == (3, {})
+
+    recorded = FeePayment.query.filter_by(centre_id=centre_id, notes='Term 1').order_by(FeePayment.student_id).all()
+    assert [(p.student_id, p.amount, p.receipt_number, p.payment_method) for p in recorded] == [
+        (first, 400, 'R-1', 'ONLINE'), (second, 250.5, 'R-2', 'ONLINE'), (third, 1000, None, 'ONLINE'),
+    ]
+    report = fee_report(centre_id)
+    assert (report['collected_fees'], report['pending_fees']) == (pytest.approx(2250.5), pytest.approx(749.5))
+
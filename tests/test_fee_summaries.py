@@ -0,0 +1,157 @@
+"""The fee rollup agrees with per-student totals, before and after writes"""
+
+from datetime import date, timedelta
+
+import pytest
+
+from app import db
+from fee_collection import record_payments
+from fee_summaries import (TOTALS, build_rows, fee_report, filter_by_fee_status, refresh,
+                           student_report, batch_student_counts)
+from models import Batch, Centre, FeePayment, FeeSummary, Student
+
+
+@pytest.fixture(scope='module')
+def centre_id(app):
+    from seed import seed_database
+    with app.app_context():
+        seed_database(centres=1, students=30, enquiries=0, email_prefix='rollup-centre')
+        return Centre.query.filter_by(email='rollup-centre-1@example.com').one().id
+
+
+@pytest.fixture(autouse=True)
+def app_context(app):
+    with app.app_context():
+        yield
+        db.session.rollback()
+
+
+def per_student(centre_id):
+    students = Student.query.filter_by(centre_id=centre_id).all()
+    statuses = [student.get_fee_status() for student in students]
+    return {
+        'total_students': len(students),
+        'fully_paid': statuses.count('Paid'),
+        'partially_paid': statuses.count('Partial'),
+        'unpaid': statuses.count('Unpaid'),
+        'total_fees': sum(student.net_fees for student in students),
+        'collected_fees': sum(student.get_total_paid() for student in students),
+        'pending_fees': sum(student.get_balance_fees() for student in students),
+    }
+
+
+def assert_matches_students(centre_id):
+    expected = per_student(centre_id)
+    report = dict(student_report(centre_id), **fee_report(centre_id))
+    for name, value in expected.items():
+        assert report[name] == pytest.approx(value), name
+
+
+def assert_matches_rebuild(centre_id):
+    """The incrementally maintained rows equal a rebuild from scratch"""
+    rebuilt = {
+        (row['course_id'], row['batch_id'], row['month']): row
+        for row in build_rows(db.session.connection(), [centre_id])
+    }
+    stored = {
+        (row.course_id, row.batch_id, row.month): row
+        for row in FeeSummary.query.filter_by(centre_id=centre_id)
+        if any(getattr(row, column) for column in TOTALS)
+    }
+    assert stored.keys() == rebuilt.keys()
+    for key, row in stored.items():
+        for column in TOTALS:
+            assert getattr(row, column) == pytest.approx(rebuilt[key][column]), (key, column)
+
+
+def test_reports_match_per_student_totals(centre_id):
+    refresh([centre_id])
+    assert_matches_students(centre_id)
+    assert_matches_rebuild(centre_id)
+
+
+def test_batch_counts_match_students(centre_id):
+    for batch in Batch.query.filter_by(centre_id=centre_id):
+        expected = Student.query.filter_by(batch_id=batch.id).count()
+        assert batch_student_counts(centre_id).get(batch.id, 0) == expected
+
+
+@pytest.mark.parametrize('status', ['paid', 'partial', 'unpaid'])
+def test_filter_by_fee_status_matches_get_fee_status(centre_id, status):
+    query = Student.query.filter_by(centre_id=centre_id)
+    expected = {student.id for student in query if student.get_fee_status().lower() == status}
+    assert {student.id for student in filter_by_fee_status(query, status)} == expected
+
+
+def test_monthly_collections_match_payments(centre_id):
+    today = date(2026, 10, 19)
+    report = fee_report(centre_id, months=3, today=today)
+    for bucket, start in zip(report['monthly_collections'], [date(2026, 8, 1), date(2026, 9, 1), date(2026, 10, 1)]):
+        end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+        expected = sum(payment.amount for payment in FeePayment.query.filter(
+            FeePayment.centre_id == centre_id, FeePayment.payment_date >= start, FeePayment.payment_date < end))
+        assert bucket['amount'] == pytest.approx(expected)
+
+
+def unpaid_student(centre_id):
+    query = Student.query.filter_by(centre_id=centre_id)
+    return filter_by_fee_status(query, 'unpaid').filter(Student.net_fees > 100).first()
+
+
+def test_payment_updates_rollup_in_the_same_transaction(centre_id):
+    student = unpaid_student(centre_id)
+    db.session.add(FeePayment(amount=50, payment_date=date.today(), student_id=student.id, centre_id=centre_id))
+    db.session.flush()
+    # Before commit: the rollup change is part of the writing transaction
+    assert_matches_rebuild(centre_id)
+    db.session.commit()
+    assert_matches_students(centre_id)
+    assert_matches_rebuild(centre_id)
+
+
+def test_rolled_back_payment_leaves_rollup_unchanged(centre_id):
+    before = student_report(centre_id)
+    student = unpaid_student(centre_id)
+    db.session.add(FeePayment(amount=50, payment_date=date.today(), student_id=student.id, centre_id=centre_id))
+    db.session.flush()
+    db.session.rollback()
+    assert student_report(centre_id) == before
+    assert_matches_rebuild(centre_id)
+
+
+def test_student_edits_move_their_totals(centre_id):
+    student = Student.query.filter_by(centre_id=centre_id).first()
+    other_batch = Batch.query.filter(Batch.centre_id == centre_id, Batch.id != student.batch_id).first()
+    student.batch_id = other_batch.id
+    student.net_fees += 100
+    student.date_of_joining -= timedelta(days=40)
+    db.session.commit()
+    assert_matches_students(centre_id)
+    assert_matches_rebuild(centre_id)
+
+
+def test_new_and_deleted_students(centre_id):
+    template = Student.query.filter_by(centre_id=centre_id).first()
+    student = Student(enrollment_number='ROLLUP-NEW', name='NEW', mobile1='9876543210',
+                      date_of_joining=date.today(), total_fees=900, net_fees=900,
+                      centre_id=centre_id, course_id=template.course_id, batch_id=None)
+    student.fee_payments.append(FeePayment(amount=300, payment_date=date.today(), centre_id=centre_id))
+    db.session.add(student)
+    db.session.commit()
+    assert_matches_students(centre_id)
+    assert_matches_rebuild(centre_id)
+
+    db.session.delete(student)
+    db.session.commit()
+    assert_matches_students(centre_id)
+    assert_matches_rebuild(centre_id)
+
+
+def test_bulk_payments_update_rollup(centre_id):
+    students = filter_by_fee_status(Student.query.filter_by(centre_id=centre_id), 'partial').limit(3).all()
+    recorded, errors = record_payments(
+        centre_id, {student.id: (1.0, None) for student in students}, date.today(), 'CASH'
+    )
+    assert (recorded, errors) == (len(students), {})
+    assert_matches_students(centre_id)
+    assert_matches_rebuild(centre_id)
@@ -0,0 +1,133 @@
+"""Student import validates every row, reports rejects and inserts in chunks"""
+
+import csv
+import io
+import re
+
+import pytest
+from sqlalchemy import event
+from werkzeug.datastructures import FileStorage
+
+import importer
+from app import db
+from fee_summaries import student_report
+from importer import import_students, write_error_report
+from models import Centre, Course, FeePayment, Student
+
+HEADER = 'Enrollment No,Name,Mobile,Course,Total Fees,Initial Payment,Bill No\n'
+
+
+@pytest.fixture
+def centre_id(app, request):
+    with app.app_context():
+        centre = Centre(name='Import Centre', email=f'import-{request.node.name}@example.com', password_hash='x')
+        db.session.add(centre)
+        db.session.flush()
+        db.session.add(Course(name='Tally', duration_months=3, fees=5000, centre_id=centre.id))
+        db.session.commit()
+        return centre.id
+
+
+@pytest.fixture(autouse=True)
+def app_context(app):
+    with app.app_context():
+        yield
+        db.session.rollback()
+
+
+def upload(*rows, filename='students.csv'):
+    return FileStorage(io.BytesIO((HEADER + ''.join(f'{row}\n' for row in rows)).encode()), filename=filename)
+
+
+def test_invalid_rows_are_reported_and_skipped(centre_id):
+    result = import_students(upload(
+        'IMP-1,Asha,9876543210,Tally,5000,,',
+        'IMP-2,B,9876543210,Tally,5000,,',
+        'IMP-3,Chetan,98765,Tally,5000,,',
+        'IMP-4,Divya,9876543210,Cooking,5000,,',
+        'IMP-5,Esha,9876543210,Tally,,,',
+        ',,,,,,',
+    ), centre_id)
+
+    assert (result.total_rows, result.imported) == (5, 1)
+    errors = {error['row']: error['errors'] for error in result.errors}
+    assert sorted(errors) == [3, 4, 5, 6]
+    assert errors[3].startswith('Name:')
+    assert errors[4].startswith('Mobile 1:')
+    assert "Unknown course 'Cooking'" in errors[5]
+    assert 'Total Fees:' in errors[6]
+    assert [s.enrollment_number for s in Student.query.filter_by(centre_id=centre_id)] == ['IMP-1']
+
+
+def test_duplicate_enrollment_numbers_in_file_and_database(centre_id):
+    import_students(upload('DUP-1,Asha,9876543210,Tally,5000,,'), centre_id)
+
+    result = import_students(upload(
+        'dup-1,Bhavna,9876543210,Tally,5000,,',
+        'DUP-2,Chetan,9876543210,Tally,5000,,',
+        'dup-2,Divya,9876543210,Tally,5000,,',
+    ), centre_id)
+
+    assert result.imported == 1
+    assert [(error['row'], error['errors']) for error in result.errors] == [
+        (2, 'Enrollment number DUP-1 already exists'),
+        (4, 'Enrollment number DUP-2 already exists'),
+    ]
+    names = dict(db.session.query(Student.enrollment_number, Student.name).filter_by(centre_id=centre_id))
+    assert names == {'DUP-1': 'ASHA', 'DUP-2': 'CHETAN'}
+
+
+def test_error_report_lists_rejected_rows(centre_id, tmp_path):
+    result = import_students(upload('REP-1,X,9876543210,Tally,5000,,'), centre_id)
+    path = write_error_report(result, str(tmp_path), centre_id)
+
+    assert path == str(tmp_path / f'{centre_id}_{result.report_token}.csv')
+    with open(path, newline='', encoding='utf-8') as f:
+        assert list(csv.DictReader(f)) == [
+            {'row': '2', 'enrollment_number': 'REP-1', 'name': 'X', 'errors': result.errors[0]['errors']}
+        ]
+
+
+def test_error_report_download(client):
+    data = {'file': (io.BytesIO((HEADER + 'WEB-1,Z,1,Tally,5000,,\n').encode()), 'students.csv')}
+    response = client.post('/students/import', data=data, content_type='multipart/form-data')
+    assert response.status_code == 200
+
+    token = re.search(r'/students/import/report/(\w+)', response.get_data(as_text=True)).group(1)
+    report = client.get(f'/students/import/report/{token}')
+    assert report.status_code == 200
+    assert report.mimetype == 'text/csv'
+    assert 'attachment' in report.headers['Content-Disposition']
+    assert list(csv.DictReader(io.StringIO(report.get_data(as_text=True))))[0]['enrollment_number'] == 'WEB-1'
+
+    assert client.get('/students/import/report/0123456789abcdef').status_code == 404
+    assert client.get('/students/import/report/..%2f..%2fsecret').status_code == 404
+
+
+def test_rows_are_inserted_in_chunks(centre_id, monkeypatch):
+    monkeypatch.setattr(importer, 'CHUNK_SIZE', 2)
+    chunks = []
+
+    def record(conn, clauseelement, multiparams, params, execution_options):
+        if clauseelement.is_insert and clauseelement.table.name == Student.__tablename__:
+            chunks.append(len(multiparams) or 1)
+
+    rows = [f',Student {n},9876543210,Tally,5000,{n * 100 if n % 2 else ""},B{n}' for n in range(1, 6)]
+    event.listen(db.engine, 'before_execute', record)
+    try:
+        result = import_students(upload(*rows), centre_id)
+    finally:
+        event.remove(db.engine, 'before_execute', record)
+
+    assert (result.imported, result.payments, result.errors) == (5, 3, [])
+    assert chunks == [2, 2, 1]
+
+    students = Student.query.filter_by(centre_id=centre_id).order_by(Student.id).all()
+    assert [student.name for student in students] == [f'STUDENT {n}' for n in range(1, 6)]
+    assert len({student.enrollment_number for student in students}) == 5
+    paid = {payment.student.name: (payment.amount, payment.receipt_number)
+            for payment in FeePayment.query.filter_by(centre_id=centre_id)}
+    assert paid == {'STUDENT 1': (100, 'B1'), 'STUDENT 3': (300, 'B3'), 'STUDENT 5': (500, 'B5')}
+
+    report = student_report(centre_id)
+    assert (report['total_students'], report['partially_paid'], report['unpaid']) == (5, 3, 2)
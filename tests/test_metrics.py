@@ -0,0 +1,62 @@
+"""Who may scrape /metrics"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True)
+def needs_prometheus(request):
+    if request.node.get_closest_marker('without_prometheus') is None:
+        pytest.importorskip('prometheus_client')
+
+
+@pytest.fixture
+def no_token(app):
+    token = app.config['METRICS_TOKEN']
+    app.config['METRICS_TOKEN'] = None
+    yield
+    app.config['METRICS_TOKEN'] = token
+
+
+def test_localhost_without_token(app, no_token):
+    assert app.test_client().get('/metrics').status_code == 200
+
+
+def test_remote_without_token_is_denied(app, no_token):
+    client = app.test_client()
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '203.0.113.7'}).status_code == 403
+    # A forged X-Forwarded-For does not make a remote peer local
+    response = client.get('/metrics', environ_base={'REMOTE_ADDR': '203.0.113.7'},
+                          headers={'X-Forwarded-For': '127.0.0.1'})
+    assert response.status_code == 403
+    # Nor does a local proxy forwarding a remote client
+    response = client.get('/metrics', headers={'X-Forwarded-For': '203.0.113.7'})
+    assert response.status_code == 403
+
+
+def test_token_required_when_set(app):
+    app.config['METRICS_TOKEN'], token = 'scrape', app.config['METRICS_TOKEN']
+    try:
+        client = app.test_client()
+        assert client.get('/metrics').status_code == 401
+        assert client.get('/metrics', headers={'Authorization': 'Bearer scrape'}).status_code == 200
+    finally:
+        app.config['METRICS_TOKEN'] = token
+
+
+@pytest.mark.without_prometheus
+def test_app_keeps_its_routes_without_prometheus_client(tmp_path):
+    script = (
+        "import sys; sys.modules['prometheus_client'] = None\n"
+        "from app import create_app\n"
+        "app = create_app()\n"
+        "assert 'export_excel' in app.view_functions and 'metrics' not in app.view_functions\n"
+    )
+    env = dict(os.environ, SESSION_SECRET='test-secret', FLASK_ENV='testing',
+               DATABASE_URL=f"sqlite:///{tmp_path / 'lerzo.db'}")
+    subprocess.run([sys.executable, '-c', script], cwd=ROOT, env=env, check=True)
@@ -0,0 +1,82 @@
+"""Every view with a @query_budget stays within it on a seeded centre"""
+
+import pytest
+from jinja2 import ChoiceLoader, DictLoader
+
+from query_audit import QueryBudgetExceeded
+
+# templates/reports/ is not in this tree; render the report context so the
+# views still run every query they would with the real templates
+REPORT_TEMPLATES = {
+    'reports/index.html': 'reports',
+    'reports/students.html': '{{ total_students }} {% for course in course_stats %}{{ course.name }}{% endfor %}',
+    'reports/fees.html': '{{ total_fees }} {% for month in monthly_collections %}{{ month.amount }}{% endfor %}',
+    'reports/batches.html': '{% for batch in batch_stats %}{{ batch.name }} {{ batch.student_count }}{% endfor %}',
+    'reports/enquiries.html': '{{ total_enquiries }} {{ active_enquiries }} {{ converted_enquiries }}',
+}
+
+EXPORT_FORMS = {
+    'students': {'export_type': 'students', 'fee_status': 'partial',
+                 'student_fields': ['enrollment_number', 'name', 'course', 'net_fees', 'paid_amount',
+                                    'balance_fees', 'fee_status']},
+    'enquiries': {'export_type': 'enquiries', 'enquiry_status': 'all',
+                  'enquiry_fields': ['name', 'mobile1', 'course', 'status']},
+}
+
+
+@pytest.fixture(autouse=True)
+def report_templates(app):
+    loader = app.jinja_loader
+    app.jinja_loader = ChoiceLoader([loader, DictLoader(REPORT_TEMPLATES)])
+    app.jinja_env.cache.clear()
+    yield
+    app.jinja_loader = loader
+
+
+def test_every_report_and_export_declares_a_budget(app):
+    for endpoint, view in app.view_functions.items():
+        if endpoint.startswith(('reports_', 'export_')):
+            assert getattr(view, 'query_budget', None) is not None, endpoint
+
+
+@pytest.mark.parametrize('url', [
+    '/reports', '/reports/students', '/reports/fees', '/reports/batches', '/reports/enquiries',
+    '/export/options', '/api/students/count', '/api/enquiries/count', '/api/batches/count',
+])
+def test_get_within_budget(client, url):
+    try:
+        response = client.get(url)
+    except QueryBudgetExceeded as e:
+        pytest.fail(str(e))
+    assert response.status_code == 200
+    assert int(response.headers['X-Query-Count']) <= int(response.headers['X-Query-Budget'])
+
+
+@pytest.mark.parametrize('export_type', sorted(EXPORT_FORMS))
+@pytest.mark.parametrize('url, module', [('/export/excel', 'pandas'), ('/export/pdf', 'weasyprint')])
+def test_export_within_budget(client, url, module, export_type):
+    pytest.importorskip(module)
+    try:
+        response = client.post(url, data=EXPORT_FORMS[export_type])
+    except QueryBudgetExceeded as e:
+        pytest.fail(str(e))
+    assert response.status_code == 200
+    assert int(response.headers['X-Query-Count']) <= int(response.headers['X-Query-Budget'])
+
+
+def test_bulk_fee_collection_within_budget(app, client, seeded_centre):
+    from datetime import date
+    from fee_summaries import filter_by_fee_status
+    from models import Centre, Student
+    with app.app_context():
+        centre = Centre.query.filter_by(email=seeded_centre['email']).one()
+        query = filter_by_fee_status(Student.query.filter_by(centre_id=centre.id), 'unpaid')
+        student_ids = [student.id for student in query.limit(5)]
+    form = {'payment_date': date.today().isoformat(), 'payment_method': 'CASH'}
+    form.update({f'amount-{student_id}': '0.01' for student_id in student_ids})
+    try:
+        response = client.post('/fees/collect', data=form)
+    except QueryBudgetExceeded as e:
+        pytest.fail(str(e))
+    assert response.status_code in (200, 302)
+    assert int(response.headers['X-Query-Count']) <= int(response.headers['X-Query-Budget'])
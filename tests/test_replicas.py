@@ -0,0 +1,112 @@
+"""Reads go to a replica only when it is fresh enough for the reader"""
+
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, update
+
+import replicas
+from app import db
+from models import Centre, Student
+
+
+@pytest.fixture
+def replica(app, seeded_centre, tmp_path, monkeypatch):
+    """A copy of the database without the seeded centre's students, bound as replica_1"""
+    path = tmp_path / 'replica.db'
+    with sqlite3.connect(os.environ['DATABASE_URL'].removeprefix('sqlite:///')) as source, \
+            sqlite3.connect(path) as copy:
+        source.backup(copy)
+        copy.execute('DELETE FROM students WHERE centre_id = (SELECT id FROM centres WHERE email = ?)',
+                     (seeded_centre['email'],))
+
+    engine = create_engine(f'sqlite:///{path}')
+    monkeypatch.setattr(replicas, '_lag', {})
+    monkeypatch.setitem(app.config, 'DB_REPLICA_MAX_LAG', 5)
+    with app.app_context():
+        monkeypatch.setitem(db.engines, 'replica_1', engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def lag(monkeypatch):
+    """Set the lag every replica probe reports; an exception makes the replica unreachable"""
+    def lag(value):
+        def measure_lag(engine):
+            if isinstance(value, Exception):
+                raise value
+            return value
+        monkeypatch.setattr(replicas, 'measure_lag', measure_lag)
+        replicas._lag.clear()
+    return lag
+
+
+@pytest.fixture
+def changed(app, seeded_centre):
+    """Move the logged in centre's last write to ``seconds`` ago"""
+    def changed(seconds):
+        with app.app_context():
+            db.session.execute(update(Centre).where(Centre.email == seeded_centre['email'])
+                               .values(data_changed_at=datetime.utcnow() - timedelta(seconds=seconds)))
+            db.session.commit()
+    return changed
+
+
+@pytest.fixture
+def primary_count(app, seeded_centre):
+    with app.app_context():
+        return Student.query.join(Centre).filter(Centre.email == seeded_centre['email']).count()
+
+
+def student_count(client):
+    return client.get('/api/students/count').json['count']
+
+
+def test_fresh_replica_serves_reads(client, replica, lag, changed):
+    lag(0.5)
+    changed(60)
+    assert student_count(client) == 0
+
+
+def test_lagging_replica_falls_back_to_primary(client, replica, lag, changed, primary_count):
+    changed(600)
+    lag(10)
+    assert student_count(client) == primary_count
+
+    lag(RuntimeError('connection refused'))
+    assert student_count(client) == primary_count
+
+
+def test_replica_must_have_replayed_the_centres_last_write(client, replica, lag, changed, primary_count):
+    lag(2)
+    changed(1)
+    assert student_count(client) == primary_count
+
+    changed(60)
+    assert student_count(client) == 0
+
+
+def test_probe_older_than_the_write_is_repeated(client, replica, lag, changed, primary_count, monkeypatch):
+    lag(0)
+    changed(60)
+    assert student_count(client) == 0
+
+    probes = []
+    monkeypatch.setattr(replicas, 'measure_lag', lambda engine: probes.append(engine) or 0.0)
+    changed(-1)
+    assert student_count(client) == primary_count
+    assert len(probes) == 1
+
+
+def test_session_reads_its_own_writes_from_the_primary(app, replica, lag, seeded_centre):
+    lag(0)
+    with app.app_context(), replicas.replica():
+        centre = Centre.query.filter_by(email=seeded_centre['email']).one()
+        assert Student.query.filter_by(centre_id=centre.id).count() == 0
+
+        db.session.execute(update(Centre).where(Centre.id == centre.id).values(data_version=Centre.data_version))
+        assert Student.query.filter_by(centre_id=centre.id).count() > 0
+        db.session.rollback()
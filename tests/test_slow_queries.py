@@ -0,0 +1,62 @@
+"""Slow query sampling skips locking statements and flushes off the request thread"""
+
+import threading
+import time
+
+import pytest
+
+import slow_queries
+from app import db
+from models import SlowQuery
+
+
+@pytest.mark.parametrize('statement, expected', [
+    ('SELECT id FROM students WHERE centre_id = ?', True),
+    ('  select count(*) from fee_payments', True),
+    ('SELECT id FROM centres WHERE id IN (?) ORDER BY id FOR UPDATE', False),
+    ('SELECT id FROM webhook_events FOR UPDATE SKIP LOCKED', False),
+    ('SELECT id FROM centres FOR NO KEY UPDATE', False),
+    ('SELECT id FROM centres\nFOR SHARE', False),
+    ('UPDATE centres SET data_version = data_version + 1', False),
+])
+def test_only_plain_selects_are_explained(statement, expected):
+    assert slow_queries.explainable(statement) is expected
+
+
+def test_executemany_is_never_explained():
+    assert not slow_queries.explainable('SELECT 1', executemany=True)
+
+
+@pytest.fixture
+def record_everything(monkeypatch):
+    monkeypatch.setitem(slow_queries._settings, 'threshold', 0)
+    monkeypatch.setitem(slow_queries._settings, 'explain_rate', 1.0)
+
+
+def test_flush_runs_on_the_background_thread(app, client, record_everything, monkeypatch):
+    flushed_on = []
+    flush = slow_queries.flush
+
+    def recording_flush():
+        flushed_on.append(threading.current_thread().name)
+        return flush()
+
+    monkeypatch.setattr(slow_queries, 'flush', recording_flush)
+    assert client.get('/api/students/count').status_code == 200
+    slow_queries._settings['threshold'] = None
+
+    deadline = time.monotonic() + 5
+    while not flushed_on and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert flushed_on and threading.main_thread().name not in flushed_on
+    assert set(flushed_on) == {'slow-query-flush'}
+
+    deadline = time.monotonic() + 5
+    with app.app_context():
+        while time.monotonic() < deadline:
+            db.session.rollback()
+            row = SlowQuery.query.filter_by(endpoint='api_students_count').first()
+            if row is not None and row.explain_plan:
+                break
+            time.sleep(0.05)
+        assert row is not None and row.explain_plan
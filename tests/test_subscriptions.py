@@ -0,0 +1,102 @@
+"""The subscription sweep expires lapsed centres and keeps days_left current"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from models import Centre, SubscriptionTransition
+from subscriptions import sweep
+
+
+@pytest.fixture(autouse=True)
+def app_context(app):
+    with app.app_context():
+        yield
+        db.session.rollback()
+
+
+@pytest.fixture
+def now():
+    return datetime.utcnow()
+
+
+@pytest.fixture
+def add_centre(request):
+    count = iter(range(100))
+
+    def add_centre(plan_type, trial_end=None, subscription_end=None):
+        centre = Centre(name='Sweep Centre', email=f'sweep-{request.node.name}-{next(count)}@example.com',
+                        password_hash='x', subscription_type=plan_type, trial_end_date=trial_end,
+                        subscription_end_date=subscription_end)
+        db.session.add(centre)
+        db.session.commit()
+        return centre.id
+    return add_centre
+
+
+def centre_state(centre_id):
+    db.session.expire_all()
+    centre = db.session.get(Centre, centre_id)
+    return centre.subscription_type, centre.days_left
+
+
+def transitions(centre_id):
+    return [(t.from_type, t.to_type, t.reason)
+            for t in SubscriptionTransition.query.filter_by(centre_id=centre_id)]
+
+
+def test_lapsed_trial_and_plan_expire(add_centre, now):
+    trial = add_centre('trial', trial_end=now - timedelta(minutes=1))
+    monthly = add_centre('monthly', subscription_end=now - timedelta(days=2))
+    version = db.session.get(Centre, trial).data_version
+
+    assert sweep(now)['expired'] >= 2
+
+    assert centre_state(trial) == ('expired', 0)
+    assert centre_state(monthly) == ('expired', 0)
+    assert transitions(trial) == [('trial', 'expired', 'trial_ended')]
+    assert transitions(monthly) == [('monthly', 'expired', 'plan_ended')]
+    assert db.session.get(Centre, trial).data_version == version + 1
+
+
+def test_missing_end_date_counts_as_lapsed(add_centre, now):
+    trial = add_centre('trial')
+    yearly = add_centre('yearly')
+    db.session.execute(db.update(Centre).where(Centre.id == trial).values(trial_end_date=None))
+    db.session.commit()
+
+    sweep(now)
+
+    assert centre_state(trial) == ('expired', 0)
+    assert centre_state(yearly) == ('expired', 0)
+    assert transitions(yearly) == [('yearly', 'expired', 'plan_ended')]
+
+
+def test_days_left_is_refreshed_for_active_centres(add_centre, now):
+    trial = add_centre('trial', trial_end=now + timedelta(days=5, hours=1))
+    yearly = add_centre('yearly', subscription_end=now + timedelta(days=200, hours=1))
+    expired = add_centre('expired', subscription_end=now + timedelta(days=3))
+
+    sweep(now)
+
+    assert centre_state(trial) == ('trial', 5)
+    assert centre_state(yearly) == ('yearly', 200)
+    assert centre_state(expired) == ('expired', None)
+    assert transitions(trial) == transitions(yearly) == transitions(expired) == []
+
+    assert sweep(now + timedelta(days=1))['expired'] == 0
+    assert centre_state(trial) == ('trial', 4)
+
+
+def test_each_change_is_recorded_once(add_centre, now):
+    lapsed = add_centre('trial', trial_end=now - timedelta(days=1))
+    active = add_centre('trial', trial_end=now + timedelta(days=1, hours=1))
+
+    sweep(now)
+    assert sweep(now) == {'expired': 0, 'days_left_updated': 0}
+    assert transitions(lapsed) == [('trial', 'expired', 'trial_ended')]
+
+    sweep(now + timedelta(days=2))
+    assert transitions(lapsed) == [('trial', 'expired', 'trial_ended')]
+    assert transitions(active) == [('trial', 'expired', 'trial_ended')]
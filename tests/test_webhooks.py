@@ -0,0 +1,110 @@
+"""The webhook inbox stores each event once and applies it exactly once"""
+
+import hashlib
+import hmac
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from models import Centre, SubscriptionPayment, WebhookEvent
+from webhooks import PermanentWebhookError, _record_failure, enqueue, process_pending
+
+SECRET = 'test-webhook-secret'
+
+
+@pytest.fixture(autouse=True)
+def app_context(app):
+    with app.app_context():
+        yield
+        db.session.rollback()
+        WebhookEvent.query.delete()
+        db.session.commit()
+
+
+@pytest.fixture
+def centre_id():
+    centre = Centre(name='Webhook Centre', email=f'webhook-{datetime.utcnow().timestamp()}@example.com',
+                    password_hash='x')
+    db.session.add(centre)
+    db.session.commit()
+    return centre.id
+
+
+def payment_captured(centre_id, payment_id='pay_test_1'):
+    return json.dumps({
+        'event': 'payment.captured',
+        'payload': {'payment': {'entity': {
+            'id': payment_id, 'amount': 99900, 'notes': {'centre_id': centre_id, 'plan_type': 'monthly'}
+        }}}
+    }).encode()
+
+
+def test_duplicate_event_id_is_ignored(centre_id):
+    body = payment_captured(centre_id)
+    assert enqueue(body, 'evt_duplicate') is True
+    assert enqueue(body, 'evt_duplicate') is False
+    assert WebhookEvent.query.filter_by(event_id='evt_duplicate').count() == 1
+
+
+def test_duplicate_delivery_through_the_endpoint(app, centre_id, monkeypatch):
+    monkeypatch.setenv('RAZORPAY_WEBHOOK_SECRET', SECRET)
+    body = payment_captured(centre_id)
+    headers = {
+        'X-Razorpay-Signature': hmac.new(SECRET.encode(), body, hashlib.sha256).hexdigest(),
+        'X-Razorpay-Event-Id': 'evt_endpoint',
+        'Content-Type': 'application/json',
+    }
+    client = app.test_client()
+    for _ in range(2):
+        assert client.post('/subscription/webhook', data=body, headers=headers).status_code == 200
+    assert WebhookEvent.query.filter_by(event_id='evt_endpoint').count() == 1
+
+    headers['X-Razorpay-Signature'] = 'forged'
+    assert client.post('/subscription/webhook', data=body, headers=headers).status_code == 400
+
+
+def test_failures_back_off_exponentially_until_max_attempts(app, centre_id, monkeypatch):
+    monkeypatch.setitem(app.config, 'WEBHOOK_RETRY_BASE_SECONDS', 30)
+    monkeypatch.setitem(app.config, 'WEBHOOK_MAX_ATTEMPTS', 3)
+    enqueue(payment_captured(centre_id), 'evt_backoff')
+    event_pk = WebhookEvent.query.filter_by(event_id='evt_backoff').one().id
+
+    for attempt, delay in ((1, 30), (2, 60)):
+        started = datetime.utcnow()
+        _record_failure(event_pk, RuntimeError('gateway timeout'), permanent=False)
+        event = db.session.get(WebhookEvent, event_pk)
+        assert (event.status, event.attempts, event.last_error) == ('pending', attempt, 'gateway timeout')
+        assert started + timedelta(seconds=delay - 1) <= event.next_attempt_at <= datetime.utcnow() + timedelta(seconds=delay)
+
+    _record_failure(event_pk, RuntimeError('gateway timeout'), permanent=False)
+    assert db.session.get(WebhookEvent, event_pk).status == 'failed'
+
+
+def test_permanent_error_fails_at_once(centre_id):
+    missing_centre = payment_captured(centre_id + 10_000)
+    enqueue(missing_centre, 'evt_permanent')
+    assert process_pending() == 1
+    event = WebhookEvent.query.filter_by(event_id='evt_permanent').one()
+    assert (event.status, event.attempts) == ('failed', 1)
+    assert 'Centre not found' in event.last_error
+
+    _record_failure(event.id, PermanentWebhookError('still broken'), permanent=True)
+    assert db.session.get(WebhookEvent, event.id).attempts == 2
+
+
+def test_event_is_processed_exactly_once(centre_id):
+    body = payment_captured(centre_id, payment_id='pay_once')
+    enqueue(body, 'evt_once')
+    enqueue(body, 'evt_once')
+    # A redelivery under a new event id carries the same payment
+    enqueue(body, 'evt_once_redelivered')
+
+    assert process_pending() == 2
+    assert process_pending() == 0
+
+    events = WebhookEvent.query.filter(WebhookEvent.event_id.like('evt_once%')).all()
+    assert [(event.status, event.attempts) for event in events] == [('processed', 1), ('processed', 1)]
+    assert SubscriptionPayment.query.filter_by(razorpay_payment_id='pay_once').count() == 1
+    assert db.session.get(Centre, centre_id).subscription_type == 'monthly'
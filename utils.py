@@ -1,49 +1,94 @@
 import os
-import secrets
-from datetime import datetime
-from PIL import Image
+import re
+import string
+from datetime import datetime, date
 from flask import current_app
-import pandas as pd
 from io import BytesIO
-import openpyxl
-from weasyprint import HTML
 import logging
 from datetime import timedelta
+from contextlib import nullcontext
+
+try:
+    from metrics import timed_export, PDF_RENDER_SECONDS
+except ImportError:
+    # prometheus_client is optional (see create_app); exports then run untimed
+    PDF_RENDER_SECONDS = None
+
+    def timed_export(kind, fmt):
+        return lambda f: f
+
+
+def _pdf_render_timer(document):
+    return PDF_RENDER_SECONDS.labels(document=document).time() if PDF_RENDER_SECONDS is not None else nullcontext()
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def generate_enrollment_number():
-    """Generate unique enrollment number based on current datetime"""
-    now = datetime.now()
-    return f"ENR{now.strftime('%Y%m%d%H%M%S')}"
+def _enrollment_format(centre_id, today):
+    """The configured format, its counter period and a pattern that reads the counter back"""
+    number_format = current_app.config['ENROLLMENT_NUMBER_FORMAT']
+    values = {'year': today.year, 'yy': today.strftime('%y'), 'centre': centre_id}
+    pattern = []
+    for literal, field, spec, _ in string.Formatter().parse(number_format):
+        pattern.append(re.escape(literal))
+        if field == 'counter':
+            pattern.append(r'(\d+)')
+        elif field is not None:
+            pattern.append(re.escape(format(values[field], spec)))
+    period = str(today.year) if '{year' in number_format or '{yy' in number_format else ''
+    return number_format, period, re.compile(''.join(pattern))
 
-def save_logo(form_logo, centre_id):
-    """Save uploaded logo file and return filename"""
-    if not form_logo:
-        return None
 
-    try:
-        random_hex = secrets.token_hex(8)
-        _, f_ext = os.path.splitext(form_logo.filename)
-        picture_fn = f"logo_{centre_id}_{random_hex}{f_ext}"
-        picture_path = os.path.join(current_app.config['UPLOAD_FOLDER'], picture_fn)
-        
-        # Resize image while maintaining aspect ratio
-        output_size = (200, 200)
-        img = Image.open(form_logo)
-        img.thumbnail(output_size, Image.Resampling.LANCZOS)
-        
-        # Convert to RGB if PNG
-        if img.mode in ('RGBA', 'P'):
-            img = img.convert('RGB')
-            
-        img.save(picture_path)
-        return picture_fn
-    except Exception as e:
-        logger.error(f"Error saving logo: {str(e)}")
-        return None
+def _counter_values(pattern, numbers):
+    return [int(match.group(1)) for match in map(pattern.fullmatch, numbers) if match]
+
+
+def reserve_enrollment_numbers(centre_id, numbers):
+    """Keep generated numbers clear of ``numbers``, which were entered by hand"""
+    from models import EnrollmentCounter
+
+    _, period, pattern = _enrollment_format(centre_id, date.today())
+    counters = _counter_values(pattern, [number for number in numbers if number])
+    if counters:
+        EnrollmentCounter.raise_to(centre_id, period, max(counters))
+
+
+def generate_enrollment_numbers(centre_id, count=1):
+    """Allocate ``count`` enrollment numbers for a centre.
+
+    Numbers are rendered with ENROLLMENT_NUMBER_FORMAT, which may use
+    {year}, {yy}, {centre} and {counter}. When the format contains the year
+    the counter restarts every year. Allocation is one counter upsert. Only
+    the first allocation of a centre and period also reads the centre's
+    existing numbers, so the new counter starts after them; numbers entered
+    by hand later move the counter through reserve_enrollment_numbers().
+    """
+    from app import db
+    from models import EnrollmentCounter, Student
+
+    today = date.today()
+    number_format, period, pattern = _enrollment_format(centre_id, today)
+    last = EnrollmentCounter.allocate(centre_id, period, count)
+    if last == count:
+        existing = db.session.query(Student.enrollment_number).filter(Student.centre_id == centre_id)
+        highest = max(_counter_values(pattern, [number for (number,) in existing if number]), default=0)
+        if highest:
+            last = EnrollmentCounter.allocate(centre_id, period, highest)
+    return [
+        number_format.format(year=today.year, yy=today.strftime('%y'), centre=centre_id, counter=counter)
+        for counter in range(last - count + 1, last + 1)
+    ]
+
+def generate_enrollment_number(centre_id):
+    """Allocate the next enrollment number for a centre"""
+    return generate_enrollment_numbers(centre_id)[0]
+
+def logo_img(logo_path):
+    """<img> tag for a PDF header logo, or an empty string"""
+    if not logo_path or not os.path.exists(logo_path):
+        return ''
+    return f'<img class="logo" src="file://{logo_path}" alt="">'
 
 def calculate_net_fees(total_fees, concession):
     """Calculate net fees after applying concession"""
@@ -55,9 +100,12 @@ def calculate_net_fees(total_fees, concession):
         logger.error("Invalid fee calculation values")
         return total_fees
 
+@timed_export('students', 'xlsx')
 def export_students_excel(students, fields):
     """Export students data to Excel format"""
     try:
+        import pandas as pd
+
         data = []
         field_mapping = {
             'enrollment_number': 'Enrollment Number',
@@ -119,9 +167,12 @@ def export_students_excel(students, fields):
         logger.error(f"Excel export failed for students: {str(e)}")
         raise RuntimeError("Failed to generate Excel report for students")
 
+@timed_export('enquiries', 'xlsx')
 def export_enquiries_excel(enquiries, fields):
     """Export enquiries data to Excel format"""
     try:
+        import pandas as pd
+
         data = []
         field_mapping = {
             'name': 'Name',
@@ -171,9 +222,12 @@ def export_enquiries_excel(enquiries, fields):
         logger.error(f"Excel export failed for enquiries: {str(e)}")
         raise RuntimeError("Failed to generate Excel report for enquiries")
 
-def export_students_pdf(students, fields, centre_name):
+@timed_export('students', 'pdf')
+def export_students_pdf(students, fields, centre_name, logo_path=None):
     """Export students data to PDF format with improved error handling"""
     try:
+        from weasyprint import HTML
+
         # Field headers mapping
         field_headers = {
             'enrollment_number': 'Enrollment No.',
@@ -217,6 +271,10 @@ def export_students_pdf(students, fields, centre_name):
                     font-size: 16pt;
                     color: #333;
                 }}
+                .header .logo {{
+                    height: 48px;
+                    margin-bottom: 6px;
+                }}
                 .header .subtitle {{
                     font-size: 12pt;
                     color: #666;
@@ -256,6 +314,7 @@ def export_students_pdf(students, fields, centre_name):
         </head>
         <body>
             <div class="header">
+                {logo_img(logo_path)}
                 <h1>{centre_name}</h1>
                 <div class="subtitle">Students Report</div>
             </div>
@@ -326,7 +385,8 @@ def export_students_pdf(students, fields, centre_name):
 
         # Generate PDF
         pdf_output = BytesIO()
-        HTML(string=html_content).write_pdf(pdf_output)
+        with _pdf_render_timer('students'):
+            HTML(string=html_content).write_pdf(pdf_output)
         pdf_output.seek(0)
         return pdf_output
 
@@ -334,9 +394,12 @@ def export_students_pdf(students, fields, centre_name):
         logger.error(f"PDF generation failed for students: {str(e)}")
         raise RuntimeError("Failed to generate PDF report for students")
 
-def export_enquiries_pdf(enquiries, fields, centre_name):
+@timed_export('enquiries', 'pdf')
+def export_enquiries_pdf(enquiries, fields, centre_name, logo_path=None):
     """Export enquiries data to PDF format"""
     try:
+        from weasyprint import HTML
+
         # Field headers mapping
         field_headers = {
             'name': 'Name',
@@ -376,6 +439,10 @@ def export_enquiries_pdf(enquiries, fields, centre_name):
                     font-size: 16pt;
                     color: #333;
                 }}
+                .header .logo {{
+                    height: 48px;
+                    margin-bottom: 6px;
+                }}
                 .header .subtitle {{
                     font-size: 12pt;
                     color: #666;
@@ -412,6 +479,7 @@ def export_enquiries_pdf(enquiries, fields, centre_name):
         </head>
         <body>
             <div class="header">
+                {logo_img(logo_path)}
                 <h1>{centre_name}</h1>
                 <div class="subtitle">Enquiries Report</div>
             </div>
@@ -470,7 +538,8 @@ def export_enquiries_pdf(enquiries, fields, centre_name):
 
         # Generate PDF - Updated to use newer WeasyPrint API
         pdf_output = BytesIO()
-        HTML(string=html_content).write_pdf(pdf_output)
+        with _pdf_render_timer('enquiries'):
+            HTML(string=html_content).write_pdf(pdf_output)
         pdf_output.seek(0)
         return pdf_output
 
@@ -478,9 +547,12 @@ def export_enquiries_pdf(enquiries, fields, centre_name):
         logger.error(f"PDF generation failed for enquiries: {str(e)}")
         raise RuntimeError("Failed to generate PDF report for enquiries")
 
+@timed_export('invoice', 'pdf')
 def generate_invoice_pdf(subscription_payment):
     """Generate invoice PDF for subscription payment"""
     try:
+        from weasyprint import HTML
+
         # Generate invoice number
         invoice_number = f"INV-{subscription_payment.id:06d}"
         
@@ -640,7 +712,8 @@ def generate_invoice_pdf(subscription_payment):
 
         # Generate PDF
         pdf_output = BytesIO()
-        HTML(string=html_content).write_pdf(pdf_output)
+        with _pdf_render_timer('invoice'):
+            HTML(string=html_content).write_pdf(pdf_output)
         pdf_output.seek(0)
         
         return pdf_output, invoice_number
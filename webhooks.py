@@ -0,0 +1,273 @@
+"""
+Razorpay webhook inbox.
+
+The webhook endpoint only verifies the signature and stores the raw event in
+webhook_events, keyed by the X-Razorpay-Event-Id header, before answering
+200. Razorpay retries of an event that is already stored are dropped by the
+unique event_id.
+
+A worker drains the inbox oldest first. By default it is a daemon thread in
+every web process, started on the first request that process handles and
+woken as soon as an event is stored. Set WEBHOOK_WORKER=off to run
+`flask webhooks process --loop` as a separate process instead. On
+PostgreSQL, events are claimed with FOR UPDATE SKIP LOCKED, so any number
+of workers can share the inbox. A failed event is retried with exponential
+backoff until WEBHOOK_MAX_ATTEMPTS is reached. A payload that can never
+succeed, such as one with an unknown centre, is marked failed straight
+away.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app import db
+from models import Centre, SubscriptionPayment, WebhookEvent, dialect_insert
+from payments import PLANS, plan_type_for
+
+
+class PermanentWebhookError(Exception):
+    """The event can never be processed, so retrying is pointless"""
+
+
+def verify_signature(body, signature, secret):
+    """Check X-Razorpay-Signature: a hex HMAC-SHA256 of the raw body"""
+    if not signature or not secret:
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def enqueue(body, event_id=None):
+    """Store a verified event; returns False when it was already received"""
+    payload = json.loads(body)
+    stmt = dialect_insert(WebhookEvent).values(
+        event_id=event_id or hashlib.sha256(body).hexdigest(),
+        event=payload.get('event', ''),
+        payload=body.decode('utf-8'),
+        status='pending',
+        attempts=0,
+        next_attempt_at=datetime.utcnow(),
+        received_at=datetime.utcnow()
+    ).on_conflict_do_nothing(index_elements=[WebhookEvent.event_id])
+    inserted = db.session.execute(stmt).rowcount
+    db.session.commit()
+    if inserted:
+        _wakeup.set()
+    return bool(inserted)
+
+
+def handle_event(payload):
+    """Apply one Razorpay event to centres and subscription payments.
+
+    Changes are left uncommitted so they land in the same transaction that
+    marks the inbox row processed.
+    """
+    event = payload['event']
+    current_app.logger.info(f"Processing webhook event: {event}")
+
+    if event in ['subscription.activated', 'subscription.charged', 'payment.captured']:
+        subscription_data = payload['payload']['subscription']['entity'] if 'subscription' in payload['payload'] else None
+        payment_data = payload['payload']['payment']['entity'] if 'payment' in payload['payload'] else None
+
+        if not subscription_data and payment_data:
+            # Handle direct payments (non-subscription)
+            current_app.logger.info("Processing direct payment")
+            notes = payment_data.get('notes', {})
+            centre_id = notes.get('centre_id')
+            plan_type = notes.get('plan_type', 'monthly')
+            if plan_type not in PLANS:
+                plan_type = 'monthly'
+
+            if not centre_id:
+                raise PermanentWebhookError("No centre_id found in payment notes")
+
+            centre = Centre.query.get(centre_id)
+            if not centre:
+                raise PermanentWebhookError(f"Centre not found: {centre_id}")
+
+            # Create payment record; a payment seen before changes nothing
+            if not SubscriptionPayment.record(
+                amount=payment_data['amount'] / 100,
+                razorpay_payment_id=payment_data['id'],
+                plan_type=plan_type,
+                centre_id=centre.id,
+                status='completed',
+                notes=f"Direct payment via webhook: {event}"
+            ):
+                current_app.logger.info(f"Payment {payment_data['id']} already recorded")
+                return
+
+            # Update centre subscription
+            centre.subscription_type = plan_type
+            centre.subscription_end_date = datetime.utcnow() + timedelta(days=PLANS[plan_type]['days'])
+            current_app.logger.info(f"Processed direct payment {payment_data['id']}")
+            return
+
+        if not subscription_data:
+            raise PermanentWebhookError("No subscription data in webhook payload")
+
+        # Extract relevant data
+        subscription_id = subscription_data['id']
+        plan_id = subscription_data['plan_id']
+        notes = subscription_data.get('notes', {})
+        centre_id = notes.get('centre_id')
+
+        if not centre_id:
+            raise PermanentWebhookError("No centre_id found in subscription notes")
+
+        # Find or create subscription record
+        subscription = SubscriptionPayment.query.filter_by(
+            razorpay_subscription_id=subscription_id
+        ).first()
+
+        if not subscription:
+            # New subscription
+            centre = Centre.query.get(centre_id)
+            if not centre:
+                raise PermanentWebhookError(f"Centre not found: {centre_id}")
+
+            # Determine plan type
+            plan_type = plan_type_for(plan_id)
+            amount = PLANS[plan_type]['price']
+            end_date = datetime.utcnow() + timedelta(days=PLANS[plan_type]['days'])
+
+            # Create subscription record
+            if SubscriptionPayment.record(
+                amount=amount,
+                razorpay_payment_id=payment_data['id'] if payment_data else None,
+                razorpay_subscription_id=subscription_id,
+                plan_type=plan_type,
+                centre_id=centre.id,
+                status='active' if event == 'subscription.activated' else 'completed',
+                notes=f"Webhook: {event}"
+            ):
+                # Update centre subscription
+                centre.subscription_type = plan_type
+                centre.subscription_end_date = end_date
+
+        elif payment_data and SubscriptionPayment.record(
+            amount=payment_data['amount'] / 100,
+            razorpay_payment_id=payment_data['id'],
+            razorpay_subscription_id=subscription_id,
+            plan_type=subscription.plan_type,
+            centre_id=centre_id,
+            status='completed',
+            notes=f"Recurring payment via webhook"
+        ):
+            # Additional payment for existing subscription: update subscription end date
+            centre = Centre.query.get(centre_id)
+            days = PLANS.get(subscription.plan_type, PLANS['monthly'])['days']
+            centre.subscription_end_date = datetime.utcnow() + timedelta(days=days)
+
+        current_app.logger.info(f"Processed {event} for subscription {subscription_id}")
+
+    elif event == 'subscription.cancelled':
+        subscription_data = payload['payload']['subscription']['entity']
+        subscription_id = subscription_data['id']
+
+        # Update subscription status
+        subscription = SubscriptionPayment.query.filter_by(razorpay_subscription_id=subscription_id).first()
+        if subscription:
+            subscription.status = 'cancelled'
+            current_app.logger.info(f"Marked subscription {subscription_id} as cancelled")
+
+
+def _claim_next():
+    """Lock the oldest due event, skipping rows other workers hold"""
+    return WebhookEvent.query.filter(
+        WebhookEvent.status == 'pending',
+        WebhookEvent.next_attempt_at <= datetime.utcnow()
+    ).order_by(WebhookEvent.id).limit(1).with_for_update(skip_locked=True).first()
+
+
+def _record_failure(event_pk, error, permanent):
+    event = db.session.get(WebhookEvent, event_pk)
+    event.attempts += 1
+    event.last_error = str(error)[:2000]
+    if permanent or event.attempts >= current_app.config['WEBHOOK_MAX_ATTEMPTS']:
+        event.status = 'failed'
+        current_app.logger.error(f"Webhook event {event.event_id} failed after {event.attempts} attempts: {error}")
+    else:
+        delay = min(current_app.config['WEBHOOK_RETRY_BASE_SECONDS'] * 2 ** (event.attempts - 1), 3600)
+        event.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+        current_app.logger.warning(f"Webhook event {event.event_id} failed, retrying in {delay}s: {error}")
+    db.session.commit()
+
+
+def process_pending(limit=100):
+    """Process due inbox events oldest first and return how many were handled"""
+    handled = 0
+    while handled < limit:
+        event = _claim_next()
+        if event is None:
+            db.session.rollback()
+            break
+        handled += 1
+        event_pk = event.id
+        try:
+            handle_event(json.loads(event.payload))
+            event.status = 'processed'
+            event.attempts += 1
+            event.last_error = None
+            event.processed_at = datetime.utcnow()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            if not isinstance(e, PermanentWebhookError):
+                current_app.logger.error(f"Webhook event {event_pk} raised: {e}", exc_info=True)
+            _record_failure(event_pk, e, isinstance(e, PermanentWebhookError))
+    return handled
+
+
+def requeue_failed():
+    """Give failed events another full set of attempts"""
+    count = WebhookEvent.query.filter_by(status='failed').update({
+        'status': 'pending', 'attempts': 0, 'next_attempt_at': datetime.utcnow()
+    })
+    db.session.commit()
+    return count
+
+
+_wakeup = threading.Event()
+_worker_pid = None
+_worker_lock = threading.Lock()
+
+
+def run_worker(app, poll_interval):
+    """Drain the inbox forever, sleeping until woken or the poll interval passes"""
+    while True:
+        try:
+            with app.app_context():
+                process_pending()
+        except Exception as e:
+            app.logger.error(f"Webhook worker error: {e}", exc_info=True)
+        _wakeup.wait(poll_interval)
+        _wakeup.clear()
+
+
+def init_webhooks(app):
+    """Configure the inbox and start a worker thread per process when enabled"""
+    app.config.setdefault('WEBHOOK_WORKER', os.environ.get('WEBHOOK_WORKER', 'thread'))
+    app.config.setdefault('WEBHOOK_MAX_ATTEMPTS', int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', 8)))
+    app.config.setdefault('WEBHOOK_RETRY_BASE_SECONDS', int(os.environ.get('WEBHOOK_RETRY_BASE_SECONDS', 30)))
+    app.config.setdefault('WEBHOOK_POLL_INTERVAL', int(os.environ.get('WEBHOOK_POLL_INTERVAL', 15)))
+
+    @app.before_request
+    def start_webhook_worker():
+        # Threads do not survive gunicorn's fork, so start one lazily per worker process
+        global _worker_pid
+        if _worker_pid == os.getpid() or app.config['WEBHOOK_WORKER'] != 'thread' or app.testing:
+            return
+        with _worker_lock:
+            if _worker_pid != os.getpid():
+                _worker_pid = os.getpid()
+                threading.Thread(
+                    target=run_worker, args=(app, app.config['WEBHOOK_POLL_INTERVAL']),
+                    name='webhook-worker', daemon=True
+                ).start()